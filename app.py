@@ -1,54 +1,184 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Blueprint, Response, current_app, render_template, jsonify, request, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import json
+import logging
 import os
+import queue
+import sys
 from datetime import datetime
-from scrapers.zillow_scraper import ZillowScraper
-from scrapers.apartments_scraper import ApartmentsScraper
+from scrapers import stream_scrape
 from database.db_manager import DatabaseManager
+from database.storage import open_database
+from database.batch_writer import BatchWriter
+from database import read_api, serialization
+from database.search_cache import SearchCache
 import threading
-import schedule
-import time
 
-app = Flask(__name__)
-CORS(app)
+bp = Blueprint('platform', __name__)
 
-# Initialize database
-db = DatabaseManager()
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes responses with orjson when it is installed"""
+    
+    def dumps(self, obj, **kwargs):
+        if serialization.orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return serialization.dumps(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if serialization.orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return serialization.loads(s)
+    
+    def response(self, *args, **kwargs):
+        if serialization.orjson is None:
+            return super().response(*args, **kwargs)
+        # Hand the encoded bytes straight to the response, skipping a decode
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serialization.dumps(obj), mimetype=self.mimetype)
+
+def create_app(config=None):
+    """Create and configure the Flask application
+
+    Subsystems are imported here, and the optional ones only when their
+    setting turns them on, so importing this module stays cheap.
+    """
+    from scheduler import AdaptiveScheduler, DEFAULT_LOCATIONS
+    from batch_scrape import BatchScraper
+    
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config['DATABASE_PATH'] = os.environ.get('DATABASE_PATH', 'rental_listings.db')
+    app.config['RETENTION_DAYS'] = 30
+    app.config['SCRAPE_LOCATIONS'] = DEFAULT_LOCATIONS
+    app.config['SCRAPE_REQUESTS_PER_HOUR'] = 120
+    app.config['WARM_TOP_LOCATIONS'] = 10
+    app.config['SEARCH_CACHE_TTL'] = 60
+    app.config['SEARCH_INDEX'] = os.environ.get('SEARCH_INDEX') == '1'
+    app.config['SEARCH_INDEX_MAX_LISTINGS'] = 1_000_000
+    app.config['BATCH_SCRAPE_WORKERS'] = 8
+    app.config['BATCH_SCRAPE_PER_HOST'] = 2
+    app.config['BATCH_SCRAPE_MAX_LOCATIONS'] = 100
+    app.config['BATCH_SCRAPE_MAX_PAGES'] = 20
+    app.config['QUERY_PROFILE'] = os.environ.get('QUERY_PROFILE') == '1'
+    app.config['QUERY_PROFILE_SLOW_MS'] = 50
+    app.config['READ_SNAPSHOT_PATH'] = os.environ.get('READ_SNAPSHOT_PATH')
+    app.config['MEDIA_CACHE_DIR'] = os.environ.get('MEDIA_CACHE_DIR')
+    app.config['MEDIA_CACHE_MAX_BYTES'] = 512 * 1024 * 1024
+    app.config['MEDIA_PREFETCH_WORKERS'] = 8
+    app.config['PAGE_ARCHIVE_DIR'] = os.environ.get('PAGE_ARCHIVE_DIR')
+    if config:
+        app.config.update(config)
+    CORS(app)
+    
+    # Initialize database (a SQLite path or a postgresql:// URL), reading
+    # from a published snapshot of it when READ_SNAPSHOT_PATH is set
+    options = {}
+    if app.config['READ_SNAPSHOT_PATH']:
+        options['snapshot_path'] = app.config['READ_SNAPSHOT_PATH']
+    db = open_database(app.config['DATABASE_PATH'], **options)
+    if app.config['QUERY_PROFILE']:
+        if isinstance(db, DatabaseManager):
+            from database.query_profiler import QueryProfiler
+            db.profiler = QueryProfiler(slow_ms=app.config['QUERY_PROFILE_SLOW_MS'])
+        else:
+            logging.getLogger(__name__).warning("Query profiling only supports a single SQLite database")
+    db.init_database()
+    app.extensions['db'] = db
+    
+    # Created here so searches record demand; started by the entry point
+    app.extensions['scheduler'] = AdaptiveScheduler(
+        db,
+        locations=app.config['SCRAPE_LOCATIONS'],
+        requests_per_hour=app.config['SCRAPE_REQUESTS_PER_HOUR']
+    )
+    
+    index = None
+    if app.config['SEARCH_INDEX']:
+        # numpy is only imported when the index is turned on
+        from database.listing_index import ListingIndex
+        index = ListingIndex(db, max_listings=app.config['SEARCH_INDEX_MAX_LISTINGS'])
+        index.load()
+    app.extensions['search_cache'] = SearchCache(db, index=index, ttl=app.config['SEARCH_CACHE_TTL'])
+    app.extensions['batch_scraper'] = BatchScraper(
+        db,
+        max_workers=app.config['BATCH_SCRAPE_WORKERS'],
+        per_host=app.config['BATCH_SCRAPE_PER_HOST']
+    )
+    
+    # Keep every fetched results page for python -m scrapers.reparse; an
+    # app without an archive directory stops an earlier app's archiving
+    archive = None
+    if app.config['PAGE_ARCHIVE_DIR']:
+        from scrapers.archive import PageArchive, set_archive
+        archive = PageArchive(app.config['PAGE_ARCHIVE_DIR'])
+        set_archive(archive)
+    elif 'scrapers.archive' in sys.modules:
+        # Only an app that archived has imported the module
+        sys.modules['scrapers.archive'].set_archive(None)
+    app.extensions['page_archive'] = archive
+    
+    if app.config['MEDIA_CACHE_DIR']:
+        from media import ImagePrefetcher, MediaCache
+        # Images are fetched once the entry point starts the prefetcher
+        media = MediaCache(app.config['MEDIA_CACHE_DIR'], max_bytes=app.config['MEDIA_CACHE_MAX_BYTES'])
+        app.extensions['media'] = media
+        app.extensions['image_prefetcher'] = ImagePrefetcher(
+            db, media, workers=app.config['MEDIA_PREFETCH_WORKERS']
+        )
+    
+    app.register_blueprint(bp)
+    return app
+
+def get_db():
+    """Database manager for the current application"""
+    return current_app.extensions['db']
+
+def with_thumbnails(listings):
+    """Listings with a local thumbnail URL where the media cache has their image"""
+    media = current_app.extensions.get('media')
+    return media.with_thumbnails(listings) if media else listings
 
-# Initialize scrapers
-zillow_scraper = ZillowScraper()
-apartments_scraper = ApartmentsScraper()
+def read_response(result):
+    """JSON response for the (payload, status) of a read_api function"""
+    payload, status = result
+    return current_app.response_class(serialization.dumps_response(payload), status=status,
+                                      mimetype='application/json')
 
-@app.route('/')
+def get_analytics():
+    """Analytics engine for the current application, created on first use"""
+    if 'analytics' not in current_app.extensions:
+        # numpy is only needed once someone asks for analytics
+        from database.analytics import ListingAnalytics
+        current_app.extensions['analytics'] = ListingAnalytics(
+            get_db(), max_age=current_app.config.get('ANALYTICS_MAX_AGE', 300)
+        )
+    return current_app.extensions['analytics']
+
+def __getattr__(name):
+    # `from app import app` builds the default application on first access
+    # instead of at import time.
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@bp.route('/')
 def index():
     """Serve the main dashboard"""
     return render_template('index.html')
 
-@app.route('/api/search', methods=['POST'])
+@bp.route('/api/search', methods=['POST'])
 def search_listings():
     """Search for rental listings"""
-    data = request.json
-    location = data.get('location', '')
-    min_price = data.get('min_price', 0)
-    max_price = data.get('max_price', 10000)
-    bedrooms = data.get('bedrooms', '')
-    
-    try:
-        # Get listings from database
-        listings = db.search_listings(location, min_price, max_price, bedrooms)
-        return jsonify({
-            'success': True,
-            'listings': listings,
-            'count': len(listings)
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return read_response(read_api.search(
+        current_app.extensions['search_cache'],
+        request.json,
+        record_search=current_app.extensions['scheduler'].record_search,
+        with_thumbnails=with_thumbnails
+    ))
 
-@app.route('/api/scrape', methods=['POST'])
+@bp.route('/api/scrape', methods=['POST'])
 def trigger_scrape():
     """Manually trigger scraping for a location"""
     data = request.json
@@ -60,23 +190,26 @@ def trigger_scrape():
             'error': 'Location is required'
         }), 400
     
+    db = get_db()
+    
     try:
         # Run scraping in background
         def run_scrape():
             print(f"Starting scrape for {location}")
             
-            # Scrape Zillow
-            zillow_listings = zillow_scraper.scrape_listings(location)
-            print(f"Found {len(zillow_listings)} Zillow listings")
+            # Scrape every registered source at once, saving listings in
+            # batches as pages come in
+            with BatchWriter(db) as writer:
+                counts = stream_scrape(location, writer.add)
+            for source, count in counts.items():
+                print(f"Found {count} {source} listings")
+            print(f"Saved {writer.received} total listings to database in {writer.batches} batches")
             
-            # Scrape Apartments.com
-            apartments_listings = apartments_scraper.scrape_listings(location)
-            print(f"Found {len(apartments_listings)} Apartments.com listings")
-            
-            # Save to database
-            all_listings = zillow_listings + apartments_listings
-            db.save_listings(all_listings)
-            print(f"Saved {len(all_listings)} total listings to database")
+            db.events.publish({
+                'type': 'scrape_complete',
+                'location': location,
+                'count': writer.received
+            })
         
         thread = threading.Thread(target=run_scrape)
         thread.daemon = True
@@ -92,30 +225,107 @@ def trigger_scrape():
             'error': str(e)
         }), 500
 
-@app.route('/api/listings')
-def get_all_listings():
-    """Get all listings from database"""
-    try:
-        listings = db.get_all_listings()
+@bp.route('/api/scrape/batch', methods=['POST'])
+def trigger_batch_scrape():
+    """Scrape many locations from many sources as one tracked batch"""
+    data = request.json or {}
+    locations = data.get('locations')
+    
+    if not isinstance(locations, list) or not all(isinstance(location, str) for location in locations) \
+            or not any(location.strip() for location in locations):
         return jsonify({
-            'success': True,
-            'listings': listings,
-            'count': len(listings)
-        })
-    except Exception as e:
+            'success': False,
+            'error': 'locations must be a non-empty list of strings'
+        }), 400
+    
+    if len(locations) > current_app.config['BATCH_SCRAPE_MAX_LOCATIONS']:
+        return jsonify({
+            'success': False,
+            'error': f"At most {current_app.config['BATCH_SCRAPE_MAX_LOCATIONS']} locations per batch"
+        }), 400
+    
+    max_pages = data.get('max_pages', 5)
+    if not isinstance(max_pages, int) or isinstance(max_pages, bool) or max_pages < 1:
+        return jsonify({
+            'success': False,
+            'error': 'max_pages must be a positive integer'
+        }), 400
+    
+    try:
+        batch = current_app.extensions['batch_scraper'].submit(
+            locations,
+            sources=data.get('sources'),
+            # Each page is a request per source and location, so deep batches are cut short
+            max_pages=min(max_pages, current_app.config['BATCH_SCRAPE_MAX_PAGES'])
+        )
+    except (TypeError, ValueError) as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'batch_id': batch.id,
+        'planned_units': batch.planned
+    }), 202
+
+@bp.route('/api/scrape/batch/<batch_id>')
+def get_batch_scrape(batch_id):
+    """Progress and per-location results of a batch scrape"""
+    batch = current_app.extensions['batch_scraper'].get(batch_id)
+    if batch is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown batch'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'batch': batch.status()
+    })
+
+@bp.route('/api/listings')
+def get_all_listings():
+    """Get all listings from database"""
+    return read_response(read_api.listings(get_db(), with_thumbnails=with_thumbnails))
 
-@app.route('/api/stats')
+@bp.route('/media/<digest>')
+def get_media(digest):
+    """Cached listing image by content hash; never changes, so cached for a year"""
+    media = current_app.extensions.get('media')
+    found = media.get(digest) if media else None
+    if found is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown media'
+        }), 404
+    
+    path, mimetype = found
+    response = send_file(path, mimetype=mimetype, etag=digest)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@bp.route('/api/stats')
 def get_stats():
     """Get platform statistics"""
+    from scrapers.health import health_status
+    sections = {'sources': health_status}
+    if 'image_prefetcher' in current_app.extensions:
+        sections['media'] = current_app.extensions['image_prefetcher'].stats
+    return read_response(read_api.stats(get_db(), **sections))
+
+@bp.route('/api/analytics')
+def get_analytics_summary():
+    """Price analysis over a columnar snapshot of all listings"""
     try:
-        stats = db.get_stats()
+        analytics = get_analytics()
+        if request.args.get('refresh') == '1':
+            analytics.invalidate()
+        summary = analytics.summary(min_count=request.args.get('min_count', 1, type=int))
         return jsonify({
             'success': True,
-            'stats': stats
+            'analytics': summary
         })
     except Exception as e:
         return jsonify({
@@ -123,52 +333,89 @@ def get_stats():
             'error': str(e)
         }), 500
 
-def scheduled_scraping():
-    """Run scheduled scraping for popular locations"""
-    popular_locations = [
-        "New York, NY",
-        "Los Angeles, CA", 
-        "Chicago, IL",
-        "Houston, TX",
-        "Phoenix, AZ"
-    ]
-    
-    for location in popular_locations:
+@bp.route('/api/events')
+def stream_events():
+    """Stream ingest events to the dashboard as server-sent events"""
+    db = get_db()
+    subscription = db.events.subscribe()
+    
+    def generate():
         try:
-            print(f"Scheduled scraping for {location}")
-            
-            # Scrape both sources
-            zillow_listings = zillow_scraper.scrape_listings(location)
-            apartments_listings = apartments_scraper.scrape_listings(location)
-            
-            # Save to database
-            all_listings = zillow_listings + apartments_listings
-            db.save_listings(all_listings)
-            
-            print(f"Completed scheduled scraping for {location}: {len(all_listings)} listings")
-            
-            # Wait between locations to be respectful
-            time.sleep(30)
-            
-        except Exception as e:
-            print(f"Error in scheduled scraping for {location}: {e}")
+            # Tell EventSource how long to wait before reconnecting
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = subscription.get(timeout=15)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {serialization.dumps(event).decode('utf-8')}\n\n"
+        finally:
+            db.events.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/api/schedule')
+def get_schedule():
+    """Get the adaptive scrape schedule"""
+    return jsonify({
+        'success': True,
+        'schedule': current_app.extensions['scheduler'].status(),
+        'search_cache': current_app.extensions['search_cache'].stats()
+    })
 
-def run_scheduler():
-    """Run the scheduler in a separate thread"""
-    schedule.every(6).hours.do(scheduled_scraping)
+@bp.route('/api/debug/queries')
+def get_query_profile():
+    """Timings, plans and index recommendations for profiled query shapes"""
+    db = get_db()
+    profiler = getattr(db, 'profiler', None)
+    if profiler is None:
+        return jsonify({
+            'success': False,
+            'error': 'Query profiling is disabled (set QUERY_PROFILE=1)'
+        }), 404
     
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    from database.index_advisor import recommend_indexes
+    report = profiler.report(
+        slow_only=request.args.get('slow') == '1',
+        limit=request.args.get('limit', type=int)
+    )
+    conn = db.connect()
+    try:
+        recommendations = recommend_indexes(conn, report['queries'])
+    finally:
+        conn.close()
+    if request.args.get('reset') == '1':
+        profiler.reset()
+    
+    return jsonify({
+        'success': True,
+        **report,
+        'recommendations': recommendations
+    })
 
 if __name__ == '__main__':
-    # Initialize database tables
-    db.init_database()
+    logging.basicConfig(level=logging.INFO)
+    app = create_app()
+    
+    # Refresh locations in the background as they come due, and keep the
+    # most-searched locations' results warm after every ingest
+    scheduler = app.extensions['scheduler']
+    scheduler.start()
+    app.extensions['search_cache'].start_warming(
+        lambda: scheduler.top_locations(app.config['WARM_TOP_LOCATIONS'])
+    )
+    
+    # Keep local thumbnails of listing images as listings are saved
+    if 'image_prefetcher' in app.extensions:
+        app.extensions['image_prefetcher'].start()
     
-    # Start scheduler in background
-    scheduler_thread = threading.Thread(target=run_scheduler)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
+    # Expire old listings in the background (batched, storage-specific)
+    app.extensions['db'].start_maintenance(days=app.config['RETENTION_DAYS'])
     
     # Run Flask app
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
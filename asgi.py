@@ -0,0 +1,108 @@
+"""
+ASGI entry point serving the read-only API on a single event loop.
+
+Run with: uvicorn asgi:app
+
+Responses come from the same database.read_api functions as the Flask
+app, through a SearchCache of its own, reading the published snapshot
+when READ_SNAPSHOT_PATH is set and adding thumbnails when MEDIA_CACHE_DIR
+is. Search demand and scraper source health live in the Flask process
+that runs the scheduler and the scrapers, so this app does not record
+the first or report the second.
+"""
+
+import os
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, Response
+from starlette.routing import Route
+from database.storage import open_database
+from database.async_db import AsyncDatabaseManager
+from database.search_cache import SearchCache
+from database import read_api, serialization
+
+def create_asgi_app(config=None):
+    """Create the async read API application"""
+    config = dict(config or {})
+    db_path = config.get('DATABASE_PATH', os.environ.get('DATABASE_PATH', 'rental_listings.db'))
+    snapshot_path = config.get('READ_SNAPSHOT_PATH', os.environ.get('READ_SNAPSHOT_PATH'))
+    media_dir = config.get('MEDIA_CACHE_DIR', os.environ.get('MEDIA_CACHE_DIR'))
+    
+    if snapshot_path:
+        # The Flask process owns the primary and publishes the snapshot
+        from database.replica import SnapshotReader
+        db = SnapshotReader(snapshot_path)
+    else:
+        db = open_database(db_path)
+        db.init_database()
+    async_db = AsyncDatabaseManager(db, max_workers=config.get('DB_WORKERS', 8))
+    cache = SearchCache(db, ttl=config.get('SEARCH_CACHE_TTL', 60))
+    
+    media = None
+    if media_dir:
+        from media import MediaCache
+        media = MediaCache(media_dir, max_bytes=config.get('MEDIA_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    with_thumbnails = media.with_thumbnails if media else None
+    
+    async def json_response(result):
+        # Encoding large listing payloads is CPU work; keep it off the loop too
+        payload, status = result
+        body = await async_db.run(serialization.dumps_response, payload)
+        return Response(body, status_code=status, media_type='application/json')
+    
+    async def search_listings(request):
+        """Search for rental listings"""
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        return await json_response(
+            await async_db.run(read_api.search, cache, data, with_thumbnails=with_thumbnails)
+        )
+    
+    async def get_all_listings(request):
+        """Get all listings from database"""
+        return await json_response(
+            await async_db.run(read_api.listings, db, with_thumbnails=with_thumbnails)
+        )
+    
+    async def get_stats(request):
+        """Get platform statistics"""
+        return await json_response(await async_db.run(read_api.stats, db))
+    
+    async def get_media(request):
+        """Cached listing image by content hash; never changes, so cached for a year"""
+        found = await async_db.run(media.get, request.path_params['digest']) if media else None
+        if found is None:
+            return await json_response(read_api.error('Unknown media', 404))
+        
+        path, mimetype = found
+        return FileResponse(path, media_type=mimetype, headers={
+            'ETag': f'"{request.path_params["digest"]}"',
+            'Cache-Control': 'public, max-age=31536000, immutable'
+        })
+    
+    routes = [
+        Route('/api/search', search_listings, methods=['POST']),
+        Route('/api/listings', get_all_listings),
+        Route('/api/stats', get_stats),
+        Route('/media/{digest}', get_media),
+    ]
+    
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        async_db.close()
+        db.close()
+    
+    app = Starlette(routes=routes, lifespan=lifespan)
+    app.state.db = async_db
+    app.state.search_cache = cache
+    return app
+
+def __getattr__(name):
+    # Same lazy default as app.py: build the application on first access
+    if name == 'app':
+        globals()['app'] = create_asgi_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
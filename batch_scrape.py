@@ -0,0 +1,213 @@
+"""
+Batch scrapes of many locations at once.
+
+A batch is planned as (source, location, page) work units. The first page
+of every (source, location) pair is queued up front and each later page is
+queued when the previous one says more results follow. Units run on a
+shared worker pool, at most max_workers at a time overall and at most
+per_host at a time against any one site. Listings stream into the database
+through a BatchWriter while the batch runs.
+"""
+
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from database.batch_writer import BatchWriter
+from scheduler import location_key
+from scrapers import get_scraper, scraper_names
+
+
+class ScrapeBatch:
+    """Progress and per-location results of one batch"""
+
+    def __init__(self, locations, sources, max_pages):
+        self.id = uuid.uuid4().hex[:12]
+        self.locations = locations
+        self.sources = sources
+        self.max_pages = max_pages
+        self.created = time.time()
+        self.finished = None
+        # Pages beyond a source's last results page are dropped from the plan
+        self.planned = len(locations) * len(sources) * max_pages
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.outstanding = 0
+        self.writer = None
+        self.results = {
+            location: {
+                source: {'pages': 0, 'listings': 0, 'errors': 0, 'state': 'pending', '_seen': set()}
+                for source in sources
+            }
+            for location in locations
+        }
+
+    def status(self):
+        saved = self.writer.stats() if self.writer else {}
+        return {
+            'batch_id': self.id,
+            'state': 'done' if self.finished else 'running',
+            'created': self.created,
+            'finished': self.finished,
+            'progress': round((self.completed + self.failed + self.skipped) / self.planned, 3) if self.planned else 1.0,
+            'units': {
+                'planned': self.planned,
+                'completed': self.completed,
+                'failed': self.failed,
+                'skipped': self.skipped
+            },
+            'listings_saved': saved.get('received', 0),
+            'results': {
+                location: {
+                    source: {key: value for key, value in result.items() if not key.startswith('_')}
+                    for source, result in sources.items()
+                }
+                for location, sources in self.results.items()
+            }
+        }
+
+
+class BatchScraper:
+    """Runs scrape batches under global and per-host concurrency limits"""
+
+    def __init__(self, db, max_workers=8, per_host=2, max_batches=50):
+        self.db = db
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.max_batches = max_batches
+        self.logger = logging.getLogger(__name__)
+        self._batches = OrderedDict()
+        self._pending = deque()
+        self._running = 0
+        self._hosts = Counter()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+
+    def submit(self, locations, sources=None, max_pages=5):
+        """Start scraping locations from sources (default: all); returns the ScrapeBatch"""
+        if max_pages < 1:
+            raise ValueError("max_pages must be at least 1")
+        sources = tuple(sources or scraper_names())
+        unknown = set(sources) - set(scraper_names())
+        if unknown:
+            raise ValueError(f"Unknown sources: {', '.join(sorted(unknown))}")
+
+        # Keep the first spelling of each location
+        unique = OrderedDict()
+        for location in locations:
+            if location_key(location):
+                unique.setdefault(location_key(location), location.strip())
+        locations = list(unique.values())
+        batch = ScrapeBatch(locations, sources, max_pages)
+        batch.writer = BatchWriter(self.db)
+
+        with self._lock:
+            self._batches[batch.id] = batch
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+            for location in locations:
+                for source in sources:
+                    self._queue(batch, source, location, 1)
+
+        self.logger.info(f"Batch {batch.id}: {len(locations)} locations x {len(sources)} sources")
+        if not batch.outstanding:
+            self._finish(batch)
+        self._dispatch()
+        return batch
+
+    def get(self, batch_id):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def _queue(self, batch, source, location, page):
+        """Add a unit to the pending queue; lock held"""
+        batch.outstanding += 1
+        batch.results[location][source]['state'] = 'running'
+        self._pending.append((batch, source, location, page))
+
+    def _dispatch(self):
+        """Start pending units while the global and per-host limits allow"""
+        with self._lock:
+            waiting = deque()
+            while self._pending:
+                unit = self._pending.popleft()
+                host = self._host(unit[1])
+                if self._running >= self.max_workers or self._hosts[host] >= self.per_host:
+                    waiting.append(unit)
+                    continue
+                self._running += 1
+                self._hosts[host] += 1
+                self._executor.submit(self._run_unit, *unit)
+            self._pending = waiting
+
+    def _host(self, source):
+        return urlparse(get_scraper(source).base_url).netloc
+
+    def _run_unit(self, batch, source, location, page):
+        scraper = get_scraper(source)
+        result = batch.results[location][source]
+        listings = None
+        has_more = False
+        skipped = not scraper.breaker.allow()
+        try:
+            if not skipped:
+                listings, has_more = scraper.scrape_page(location, page)
+                for listing in listings or []:
+                    addr = listing.get('address', '').lower()
+                    if addr and addr not in result['_seen']:
+                        result['_seen'].add(addr)
+                        batch.writer.add(listing)
+                if listings is not None:
+                    # Be polite to the site before its slot goes to the next page
+                    time.sleep(random.uniform(*scraper.page_delay))
+        except Exception as e:
+            self.logger.error(f"Batch {batch.id}: error scraping {source} for {location} page {page}: {e}")
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._hosts[self._host(source)] -= 1
+                batch.outstanding -= 1
+
+                if skipped:
+                    # The source's circuit is open; don't wait for it
+                    batch.skipped += 1
+                elif listings is None:
+                    result['errors'] += 1
+                    batch.failed += 1
+                else:
+                    result['pages'] += 1
+                    result['listings'] = len(result['_seen'])
+                    batch.completed += 1
+
+                if has_more and page < batch.max_pages:
+                    self._queue(batch, source, location, page + 1)
+                else:
+                    # This pair is done; its remaining pages will never run
+                    batch.planned -= batch.max_pages - page
+                    result['state'] = 'done' if result['pages'] else 'skipped' if skipped else 'failed'
+                    result['_seen'] = set()
+                done = batch.outstanding == 0
+
+            if done:
+                self._finish(batch)
+            self._dispatch()
+
+    def _finish(self, batch):
+        batch.writer.close()
+        batch.finished = time.time()
+        status = batch.status()
+        self.logger.info(
+            f"Batch {batch.id} finished: {status['listings_saved']} listings, "
+            f"{batch.failed} failed pages in {batch.finished - batch.created:.1f}s"
+        )
+        self.db.events.publish({
+            'type': 'batch_complete',
+            'batch_id': batch.id,
+            'locations': batch.locations,
+            'count': status['listings_saved']
+        })
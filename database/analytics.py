@@ -0,0 +1,349 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+# Numeric columns are fetched with NULL (or any non-numeric value) mapped to
+# -1, which none of them can legitimately be, so the whole result streams
+# straight into a typed array.
+SNAPSHOT_DTYPE = np.dtype([
+    ('price', 'f8'),
+    ('bedrooms', 'f8'),
+    ('bathrooms', 'f8'),
+    ('square_feet', 'f8'),
+    ('source', 'i4'),
+    ('city', 'i4')
+])
+
+NUMERIC_COLUMNS = ('price', 'bedrooms', 'bathrooms', 'square_feet')
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def _numeric(column):
+    """SQL expression yielding a numeric column or -1 when it is missing"""
+    return f"CASE WHEN typeof({column}) IN ('integer', 'real') THEN {column} ELSE -1 END"
+
+
+class ListingSnapshot:
+    """Columnar, read-only copy of the listings table"""
+
+    def __init__(self, columns, sources, cities, taken_at=None):
+        self.columns = columns
+        self.sources = sources
+        self.cities = cities
+        self.taken_at = taken_at or time.time()
+
+    def __len__(self):
+        return len(self.columns['price'])
+
+    @classmethod
+    def from_database(cls, db):
+        """Snapshot the listings table in one pass
+
+        Categorical columns are dictionary-encoded inside the database, so rows
+        arrive as plain numeric tuples that numpy consumes without building
+        Python objects per row. A sharded store is read shard by shard and
+        the codes are translated into one shared dictionary.
+        """
+        parts = [cls._read(partition) for partition in db.partitions()]
+        if len(parts) == 1:
+            records, sources, cities = parts[0]
+        else:
+            sources = sorted(set().union(*(part_sources for _, part_sources, _ in parts)))
+            cities = sorted(set().union(*(part_cities for _, _, part_cities in parts)))
+            source_codes = {name: code for code, name in enumerate(sources)}
+            city_codes = {name: code for code, name in enumerate(cities)}
+            for part_records, part_sources, part_cities in parts:
+                if len(part_records):
+                    part_records['source'] = np.array([source_codes[name] for name in part_sources])[part_records['source']]
+                    part_records['city'] = np.array([city_codes[name] for name in part_cities])[part_records['city']]
+            records = np.concatenate([part_records for part_records, _, _ in parts])
+
+        columns = {}
+        for name in SNAPSHOT_DTYPE.names:
+            column = np.ascontiguousarray(records[name])
+            if column.dtype.kind == 'f':
+                column[column < 0] = np.nan
+            columns[name] = column
+
+        return cls(columns, sources, cities)
+
+    @classmethod
+    def _read(cls, db):
+        """(records, sources, cities) of one database"""
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            if db.dialect == 'postgresql':
+                sources, cities, count = cls._query_postgres(cursor)
+            else:
+                sources, cities, count = cls._query_sqlite(cursor)
+            return np.fromiter(cursor, dtype=SNAPSHOT_DTYPE, count=count), sources, cities
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _query_sqlite(cursor):
+        """Run the snapshot query on SQLite; returns (sources, cities, count)"""
+        # One read transaction so the dictionaries, count and rows agree
+        cursor.execute("BEGIN")
+
+        # Dictionary-encode the categorical columns in temp tables; a join
+        # is much cheaper than ranking window functions over every row
+        for table, expression in (('snapshot_sources', 'source'), ('snapshot_cities', "IFNULL(city, '')")):
+            cursor.execute(f"DROP TABLE IF EXISTS temp.{table}")
+            cursor.execute(f"CREATE TEMP TABLE {table} (name TEXT PRIMARY KEY, code INTEGER) WITHOUT ROWID")
+            cursor.execute(f'''
+                INSERT INTO {table}
+                SELECT name, ROW_NUMBER() OVER (ORDER BY name) - 1
+                FROM (SELECT DISTINCT {expression} AS name FROM listings)
+            ''')
+
+        cursor.execute("SELECT name FROM snapshot_sources ORDER BY code")
+        sources = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute("SELECT name FROM snapshot_cities ORDER BY code")
+        cities = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute("SELECT COUNT(*) FROM listings")
+        count = cursor.fetchone()[0]
+
+        cursor.execute(f'''
+            SELECT {', '.join(_numeric('l.' + column) for column in NUMERIC_COLUMNS)},
+                   s.code, c.code
+            FROM listings l
+            JOIN snapshot_sources s ON s.name = l.source
+            JOIN snapshot_cities c ON c.name = IFNULL(l.city, '')
+        ''')
+        return sources, cities, count
+
+    @staticmethod
+    def _query_postgres(cursor):
+        """Run the snapshot query on PostgreSQL; returns (sources, cities, count)"""
+        # Columns are typed there, so only NULLs need mapping; ranks in the
+        # same order as the dictionaries give the codes
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+
+        cursor.execute("SELECT DISTINCT source FROM listings ORDER BY source")
+        sources = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute("SELECT DISTINCT COALESCE(city, '') AS name FROM listings ORDER BY name")
+        cities = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute("SELECT COUNT(*) FROM listings")
+        count = cursor.fetchone()[0]
+
+        cursor.execute(f'''
+            SELECT {', '.join(f'COALESCE({column}, -1)::float8' for column in NUMERIC_COLUMNS)},
+                   DENSE_RANK() OVER (ORDER BY source) - 1,
+                   DENSE_RANK() OVER (ORDER BY COALESCE(city, '')) - 1
+            FROM listings
+        ''')
+        return sources, cities, count
+
+    def save_npz(self, path):
+        """Write the snapshot as compressed NumPy arrays"""
+        np.savez_compressed(
+            path,
+            sources=np.array(self.sources, dtype=object),
+            cities=np.array(self.cities, dtype=object),
+            **self.columns
+        )
+
+    def save_parquet(self, path):
+        """Write the snapshot as a Parquet file (requires pyarrow)"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow to be installed")
+
+        table = pa.table({
+            'price': self.columns['price'],
+            'bedrooms': self.columns['bedrooms'],
+            'bathrooms': self.columns['bathrooms'],
+            'square_feet': self.columns['square_feet'],
+            'source': pa.DictionaryArray.from_arrays(self.columns['source'], self.sources),
+            'city': pa.DictionaryArray.from_arrays(self.columns['city'], self.cities)
+        })
+        pq.write_table(table, path)
+
+
+def _round(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+def grouped_medians(keys, values):
+    """Median and count of values for each distinct key, fully vectorized
+
+    keys is an integer array (or a tuple of them for compound keys); rows
+    where the value is NaN are ignored. Returns (unique_keys, medians, counts).
+    """
+    keys = keys if isinstance(keys, tuple) else (keys,)
+    valid = ~np.isnan(values)
+    keys = tuple(key[valid] for key in keys)
+    values = values[valid]
+    if len(values) == 0:
+        return tuple(np.array([], dtype=key.dtype) for key in keys), np.array([]), np.array([], dtype=int)
+
+    # Sort by key, then value, so each group is a sorted run
+    order = np.lexsort((values,) + keys[::-1])
+    sorted_keys = tuple(key[order] for key in keys)
+    sorted_values = values[order]
+
+    boundaries = np.zeros(len(sorted_values), dtype=bool)
+    boundaries[0] = True
+    for key in sorted_keys:
+        boundaries[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(boundaries)
+    counts = np.diff(np.append(starts, len(sorted_values)))
+
+    medians = (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+    return tuple(key[starts] for key in sorted_keys), medians, counts
+
+
+class ListingAnalytics:
+    """Vectorized price analysis over a cached columnar snapshot"""
+
+    def __init__(self, db, max_age=300):
+        self.db = db
+        self.max_age = max_age
+        self.logger = logging.getLogger(__name__)
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def snapshot(self, refresh=False):
+        """Current snapshot, rebuilt when older than max_age seconds"""
+        with self._lock:
+            stale = self._snapshot is None or time.time() - self._snapshot.taken_at > self.max_age
+            if refresh or stale:
+                started = time.perf_counter()
+                self._snapshot = ListingSnapshot.from_database(self.db)
+                self.logger.info(
+                    f"Built analytics snapshot of {len(self._snapshot)} listings "
+                    f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+                )
+            return self._snapshot
+
+    def invalidate(self):
+        """Force the next query to take a fresh snapshot"""
+        with self._lock:
+            self._snapshot = None
+
+    def summary(self, min_count=1, limit=50):
+        """Median rent by city and bedrooms, price-per-sqft percentiles and source comparison"""
+        snap = self.snapshot()
+        price = snap.columns['price']
+        bedrooms = snap.columns['bedrooms']
+        sqft = snap.columns['square_feet']
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price_per_sqft = np.where(sqft > 0, price / sqft, np.nan)
+
+        return {
+            'listing_count': len(snap),
+            'snapshot_age_seconds': round(time.time() - snap.taken_at, 1),
+            'median_rent_by_city': self._by_city(snap, price, min_count, limit),
+            'median_rent_by_bedrooms': self._by_bedrooms(bedrooms, price, min_count),
+            'median_rent_by_city_bedrooms': self._by_city_bedrooms(snap, price, min_count, limit),
+            'price_per_sqft': self._percentiles(price_per_sqft),
+            'by_source': self._by_source(snap, price, price_per_sqft)
+        }
+
+    def _by_city(self, snap, price, min_count, limit):
+        (cities,), medians, counts = grouped_medians(snap.columns['city'], price)
+        rows = [
+            {'city': snap.cities[code], 'median_price': _round(median), 'count': int(count)}
+            for code, median, count in zip(cities, medians, counts)
+            if count >= min_count and snap.cities[code]
+        ]
+        rows.sort(key=lambda row: row['count'], reverse=True)
+        return rows[:limit]
+
+    def _by_bedrooms(self, bedrooms, price, min_count):
+        known = ~np.isnan(bedrooms)
+        (beds,), medians, counts = grouped_medians(bedrooms[known].astype(int), price[known])
+        return [
+            {'bedrooms': int(bed), 'median_price': _round(median), 'count': int(count)}
+            for bed, median, count in zip(beds, medians, counts)
+            if count >= min_count
+        ]
+
+    def _by_city_bedrooms(self, snap, price, min_count, limit):
+        bedrooms = snap.columns['bedrooms']
+        known = ~np.isnan(bedrooms)
+        (cities, beds), medians, counts = grouped_medians(
+            (snap.columns['city'][known], bedrooms[known].astype(int)), price[known]
+        )
+        rows = [
+            {'city': snap.cities[code], 'bedrooms': int(bed),
+             'median_price': _round(median), 'count': int(count)}
+            for code, bed, median, count in zip(cities, beds, medians, counts)
+            if count >= min_count and snap.cities[code]
+        ]
+        rows.sort(key=lambda row: row['count'], reverse=True)
+        return rows[:limit]
+
+    def _percentiles(self, values):
+        values = values[~np.isnan(values)]
+        result = {'count': int(len(values))}
+        if len(values):
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                result[f'p{percentile}'] = _round(value)
+        return result
+
+    def _by_source(self, snap, price, price_per_sqft):
+        source = snap.columns['source']
+        counts = np.bincount(source, minlength=len(snap.sources))
+        (price_sources,), medians, _ = grouped_medians(source, price)
+        (sqft_sources,), sqft_medians, _ = grouped_medians(source, price_per_sqft)
+
+        valid = ~np.isnan(price)
+        price_totals = np.bincount(source[valid], weights=price[valid], minlength=len(snap.sources))
+        price_counts = np.bincount(source[valid], minlength=len(snap.sources))
+
+        median_by_code = dict(zip(price_sources.tolist(), medians))
+        sqft_by_code = dict(zip(sqft_sources.tolist(), sqft_medians))
+
+        return [
+            {
+                'source': name,
+                'count': int(counts[code]),
+                'median_price': _round(median_by_code.get(code, np.nan)),
+                'mean_price': _round(price_totals[code] / price_counts[code]) if price_counts[code] else None,
+                'median_price_per_sqft': _round(sqft_by_code.get(code, np.nan))
+            }
+            for code, name in enumerate(snap.sources)
+        ]
+
+
+def main(argv=None):
+    """Command line entry point: export a snapshot or print the summary"""
+    import argparse
+    import json
+    from database.storage import open_database
+
+    parser = argparse.ArgumentParser(description="Columnar listing analytics")
+    parser.add_argument('--db', default='rental_listings.db', help="SQLite database path or postgresql:// URL")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help="write a snapshot (.npz or .parquet)")
+    export.add_argument('path')
+    subparsers.add_parser('summary', help="print the analytics summary as JSON")
+    args = parser.parse_args(argv)
+
+    analytics = ListingAnalytics(open_database(args.db))
+    if args.command == 'export':
+        snap = analytics.snapshot()
+        if args.path.endswith('.parquet'):
+            snap.save_parquet(args.path)
+        else:
+            snap.save_npz(args.path)
+        print(f"Wrote {len(snap)} listings to {args.path}")
+    else:
+        print(json.dumps(analytics.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDatabaseManager:
+    """Async facade over DatabaseManager that runs blocking SQLite work on a thread pool"""
+
+    def __init__(self, db, max_workers=8):
+        self.db = db
+        # SQLite calls are short and open their own connection, so a small
+        # pool is enough to keep the event loop free for thousands of clients.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on the database pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def search_listings(self, *args, **kwargs):
+        """Search for listings based on criteria (see DatabaseManager.search_listings)"""
+        return await self.run(self.db.search_listings, *args, **kwargs)
+
+    async def search_facets(self, *args, **kwargs):
+        """Facet counts for a search (see DatabaseManager.search_facets)"""
+        return await self.run(self.db.search_facets, *args, **kwargs)
+
+    async def get_all_listings(self, limit=100):
+        """Get all listings from database"""
+        return await self.run(self.db.get_all_listings, limit)
+
+    async def get_stats(self):
+        """Get platform statistics"""
+        return await self.run(self.db.get_stats)
+
+    def close(self):
+        """Shut down the worker pool"""
+        self._executor.shutdown(wait=False)
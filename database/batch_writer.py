@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+import time
+
+_CLOSE = object()
+
+
+class BatchWriter:
+    """Saves streamed listings to a store in batches from a background thread
+
+    add() hands over one listing. The writer saves a batch once batch_size
+    listings are waiting, or flush_interval seconds after the first of them
+    arrived, whichever comes first, so scraped listings become searchable
+    while the scrape is still running. At most max_pending listings wait in
+    memory: when the store falls behind, add() blocks and the scrapers slow
+    down instead of buffering without bound.
+    """
+
+    def __init__(self, db, batch_size=500, flush_interval=0.5, max_pending=2000):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(__name__)
+        self.received = 0
+        self.saved = 0
+        self.batches = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, listing):
+        """Queue a listing for saving; blocks while max_pending listings are waiting"""
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        self._queue.put(listing)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                listing = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                listing = None
+
+            if listing is _CLOSE:
+                self._flush(batch)
+                return
+            if listing is not None:
+                batch.append(listing)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if len(batch) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            self.saved += self.db.save_listings(batch) or 0
+            self.batches += 1
+        except Exception as e:
+            # Keep draining so producers never block on a dead writer
+            self.logger.error(f"Error saving batch of {len(batch)} listings: {e}")
+            self.failed += len(batch)
+        self.received += len(batch)
+
+    def close(self):
+        """Save whatever is still waiting and stop the writer thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        return self.stats()
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'saved': self.saved,
+            'batches': self.batches,
+            'failed': self.failed
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
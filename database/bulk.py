@@ -0,0 +1,241 @@
+"""
+Streaming bulk import/export of listings.
+
+    python -m database.bulk export listings.ndjson.gz
+    python -m database.bulk --batch-size 5000 import listings.csv
+
+Rows move in fixed-size chunks, so memory stays bounded no matter how
+large the file or table is. Files ending in .gz are (de)compressed on the
+fly and "-" means stdin/stdout. An import exits non-zero when the
+database saved fewer rows than were read.
+"""
+
+import argparse
+import contextlib
+import csv
+import gzip
+import json
+import sys
+import time
+from database import serialization
+from database.storage import open_database
+
+# Fields accepted on import; id, city and created_at are assigned by the database
+IMPORT_FIELDS = (
+    'source', 'title', 'address', 'price', 'price_max', 'bedrooms', 'bathrooms',
+    'square_feet', 'url', 'image_url', 'amenities', 'phone', 'description',
+    'latitude', 'longitude', 'scraped_at'
+)
+
+# CSV carries everything as text; these fields are converted back on import
+CSV_TYPES = {
+    'price': int,
+    'price_max': int,
+    'bedrooms': int,
+    'bathrooms': float,
+    'square_feet': int,
+    'latitude': float,
+    'longitude': float
+}
+
+
+class Progress:
+    """Periodic rows and rows/sec report on stderr
+
+    An import also counts the rows the database saved, reported next to
+    the rows read.
+    """
+
+    def __init__(self, label, stream=None, interval=2.0):
+        self.label = label
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.rows = 0
+        self.saved = None
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def advance(self, rows, saved=None):
+        self.rows += rows
+        if saved is not None:
+            self.saved = (self.saved or 0) + saved
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self._report(now)
+
+    def finish(self):
+        self._report(time.perf_counter(), final=True)
+        return self.rows
+
+    def _report(self, now, final=False):
+        elapsed = max(now - self.started, 1e-9)
+        prefix = "Done: " if final else ""
+        saved = f", {self.saved:,} saved" if self.saved is not None else ""
+        self.stream.write(
+            f"{prefix}{self.label} {self.rows:,} rows{saved} in {elapsed:.1f}s "
+            f"({self.rows / elapsed:,.0f} rows/sec)\n"
+        )
+        self.stream.flush()
+
+
+def _open(path, mode):
+    """Open a text file, stdin/stdout for "-", transparently gzipped for .gz"""
+    if path == '-':
+        # Leave the process streams open when the with-block ends
+        return contextlib.nullcontext(sys.stdin if mode == 'r' else sys.stdout)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+def _read_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield serialization.loads(line)
+
+
+def _read_csv(stream):
+    for row in csv.DictReader(stream):
+        listing = {}
+        for field, value in row.items():
+            if field not in IMPORT_FIELDS or value in (None, ''):
+                continue
+            if field in CSV_TYPES:
+                try:
+                    value = CSV_TYPES[field](float(value))
+                except ValueError:
+                    # Keep unparseable source values (e.g. "$2,500/mo") as text
+                    pass
+            elif field == 'amenities':
+                value = json.loads(value)
+            listing[field] = value
+        yield listing
+
+
+def iter_chunks(items, size):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_listings(db, path, fmt=None, batch_size=5000, progress=None):
+    """Stream listings from an NDJSON or CSV file into the database
+
+    Each chunk goes through save_listings as one transaction. Returns
+    {'read', 'saved'}: the rows read from the file and the rows the
+    database reported saved, which fall short when a chunk fails.
+    """
+    fmt = _detect_format(path, fmt)
+    progress = progress or Progress("Imported")
+
+    with _open(path, 'r') as stream:
+        rows = _read_csv(stream) if fmt == 'csv' else _read_ndjson(stream)
+        for chunk in iter_chunks(rows, batch_size):
+            saved = db.save_listings([
+                {field: listing.get(field) for field in IMPORT_FIELDS if field in listing}
+                for listing in chunk
+            ])
+            progress.advance(len(chunk), saved)
+
+    read = progress.finish()
+    return {'read': read, 'saved': progress.saved or 0}
+
+
+def export_listings(db, path, fmt=None, batch_size=5000, progress=None):
+    """Stream every listing to an NDJSON or CSV file
+
+    The table is read with a single cursor and fetchmany(), so only one
+    chunk of rows is in memory at a time (on PostgreSQL through a named,
+    server-side cursor). On SQLite, NDJSON lines are encoded by the
+    query itself. A sharded store is exported one shard after another,
+    each in id order. Returns the number of rows written.
+    """
+    fmt = _detect_format(path, fmt)
+    progress = progress or Progress("Exported")
+
+    with _open(path, 'w') as stream:
+        writer = None
+        header = None
+        for partition in db.partitions():
+            conn = partition.connect()
+            try:
+                if partition.dialect == 'postgresql':
+                    cursor = conn.cursor(name='listings_export')
+                else:
+                    cursor = conn.cursor()
+                encoded = fmt == 'ndjson' and partition.dialect == 'sqlite'
+                if encoded:
+                    # SQLite writes each line's JSON, so rows never become dicts
+                    cursor.execute("SELECT * FROM listings LIMIT 0")
+                    select = serialization.json_object_sql([description[0] for description in cursor.description])
+                    cursor.execute(f"SELECT {select} FROM listings ORDER BY id")
+                else:
+                    cursor.execute(f"SELECT {partition.select_columns} FROM listings ORDER BY id")
+                # Server-side cursors only describe their columns after a fetch
+                rows = cursor.fetchmany(batch_size)
+                columns = [description[0] for description in cursor.description]
+
+                if fmt == 'csv' and writer is None:
+                    writer = csv.writer(stream)
+                    header = columns
+                    writer.writerow(header)
+                # Shards migrated at different times may order their columns differently
+                order = [columns.index(column) for column in header] if writer and columns != header else None
+
+                while rows:
+                    if writer:
+                        # Amenities stay as their stored JSON text in CSV
+                        writer.writerows([[row[i] for i in order] for row in rows] if order else rows)
+                    elif encoded:
+                        stream.write(''.join(row[0] + '\n' for row in rows))
+                    else:
+                        stream.write(''.join(
+                            serialization.dumps(listing).decode('utf-8') + '\n'
+                            for listing in serialization.rows_to_listings(columns, rows)
+                        ))
+                    progress.advance(len(rows))
+                    rows = cursor.fetchmany(batch_size)
+            finally:
+                conn.close()
+
+    return progress.finish()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Bulk import/export of rental listings")
+    parser.add_argument('--db', default='rental_listings.db', help="SQLite database path or postgresql:// URL")
+    parser.add_argument('--format', choices=('ndjson', 'csv'), help="file format (default: from extension)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="rows per chunk/transaction")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('import', help="load listings from a file").add_argument('path')
+    subparsers.add_parser('export', help="write all listings to a file").add_argument('path')
+    args = parser.parse_args(argv)
+
+    db = open_database(args.db)
+    if args.command == 'import':
+        db.init_database()
+        result = import_listings(db, args.path, args.format, args.batch_size)
+        if result['saved'] != result['read']:
+            sys.exit(f"Only {result['saved']:,} of {result['read']:,} rows were saved")
+    else:
+        export_listings(db, args.path, args.format, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,284 @@ import sqlite3
 import json
 from datetime import datetime
 import logging
+import math
 import os
+import re
+import threading
+from database import serialization
+from database.events import EventBus
+from database.storage import ListingStore
 
-class DatabaseManager:
-    def __init__(self, db_path="rental_listings.db"):
+# Listing columns that describe the property itself (everything except the
+# natural key and timestamps); a change in any of these is a listing update.
+CONTENT_FIELDS = (
+    'title', 'price_max', 'bedrooms', 'bathrooms', 'square_feet', 'url',
+    'image_url', 'amenities', 'phone', 'description', 'latitude', 'longitude'
+)
+
+# Columns added after the original schema, applied to existing databases
+MIGRATED_COLUMNS = {
+    'latitude': 'REAL',
+    'longitude': 'REAL',
+    'city': 'TEXT'
+}
+
+EARTH_RADIUS_MILES = 3958.8
+
+# A listing's price where it is a number, else NULL. SQLite's untyped column
+# also keeps text prices ("Call for pricing"), which compare above every
+# number; PostgreSQL's price column is an INTEGER, so there it is just price.
+SQLITE_PRICE_SQL = "(CASE WHEN typeof(price) IN ('integer', 'real') THEN price END)"
+
+# Upper bounds of the price facet's buckets; the last bucket is open-ended
+PRICE_BUCKETS = (1000, 1500, 2000, 2500, 3000, 4000)
+
+def search_sorts(price='price'):
+    """ORDER BY for each search sort, given the SQL of a numeric price
+
+    Unknown values sort last and ties newest first.
+    """
+    per_sqft = f"CASE WHEN square_feet > 0 AND {price} > 0 THEN {price} * 1.0 / square_feet END"
+    return {
+        'newest': "created_at DESC, id DESC",
+        'price_asc': f"{price} IS NULL, {price} ASC, created_at DESC, id DESC",
+        'price_desc': f"{price} IS NULL, {price} DESC, created_at DESC, id DESC",
+        'price_per_sqft': f"({per_sqft}) IS NULL, {per_sqft} ASC, created_at DESC, id DESC"
+    }
+
+def price_bucket_sql(price='price'):
+    """SQL of the bucket number (index into PRICE_BUCKETS, or its length) of a price"""
+    return "CASE WHEN {0} IS NULL OR {0} <= 0 THEN NULL {1} ELSE {2} END".format(
+        price,
+        ' '.join(f"WHEN {price} < {bound} THEN {number}" for number, bound in enumerate(PRICE_BUCKETS)),
+        len(PRICE_BUCKETS)
+    )
+
+SEARCH_SORTS = search_sorts(SQLITE_PRICE_SQL)
+PRICE_BUCKET_SQL = price_bucket_sql(SQLITE_PRICE_SQL)
+
+def _normalize_amenity(name):
+    """Canonical form used for amenity storage and matching"""
+    return ' '.join(name.split()).lower()
+
+def extract_city(address):
+    """City key ("New York, NY") for an address, or None if it has no city part"""
+    parts = [part.strip() for part in (address or '').split(',') if part.strip()]
+    
+    state = None
+    if parts and re.fullmatch(r'[A-Za-z]{2}(\s+\d{5}(-\d{4})?)?', parts[-1]):
+        state = parts.pop()[:2].upper()
+    
+    # Without a state the last part is only a city if a street precedes it
+    if not parts or (state is None and len(parts) < 2):
+        return None
+    return f"{parts[-1]}, {state}" if state else parts[-1]
+
+def distance_miles(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance between two points in miles"""
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+def radius_bounds(latitude, longitude, radius_miles):
+    """Bounding box (south, north, west, east) that contains a radius around a point"""
+    lat_delta = math.degrees(radius_miles / EARTH_RADIUS_MILES)
+    # Longitude degrees shrink towards the poles; clamp to avoid dividing by ~0
+    lng_delta = lat_delta / max(math.cos(math.radians(latitude)), 0.01)
+    return latitude - lat_delta, latitude + lat_delta, longitude - lng_delta, longitude + lng_delta
+
+def parse_geo_filter(data):
+    """Read radius and map-bounds filters from a search request
+
+    Returns (near, bounds) where near is (latitude, longitude, radius_miles)
+    and bounds is (south, north, west, east); either may be None. Raises
+    ValueError for incomplete or non-numeric input.
+    """
+    near = None
+    bounds = None
+    
+    if data.get('radius_miles') is not None:
+        near = (float(data['latitude']), float(data['longitude']), float(data['radius_miles']))
+        if near[2] <= 0:
+            raise ValueError("radius_miles must be positive")
+    
+    if data.get('bounds'):
+        box = data['bounds']
+        bounds = (float(box['south']), float(box['north']), float(box['west']), float(box['east']))
+        if bounds[0] > bounds[1] or bounds[2] > bounds[3]:
+            raise ValueError("bounds must have south <= north and west <= east")
+    
+    return near, bounds
+
+def parse_amenity_filter(value):
+    """Split an amenity filter such as "parking AND laundry" into terms
+
+    Accepts a list of terms or a string separated by commas or AND.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'\s*,\s*|\s+and\s+', value, flags=re.IGNORECASE)
+    return [term.strip() for term in value if isinstance(term, str) and term.strip()]
+
+def parse_search_options(data):
+    """Read the bathroom, size and source filters and the sort order of a search request
+
+    Returns keyword arguments for search_listings: min_bathrooms,
+    min_sqft, max_sqft, sources (a list, or a comma-separated string in
+    the request) and sort. Raises ValueError for non-numeric bounds or an
+    unknown sort.
+    """
+    options = {}
+    for key, convert in (('min_bathrooms', float), ('min_sqft', int), ('max_sqft', int)):
+        if data.get(key) not in (None, ''):
+            options[key] = convert(data[key])
+
+    sources = data.get('sources')
+    if isinstance(sources, str):
+        sources = sources.split(',')
+    sources = [source.strip() for source in sources or [] if isinstance(source, str) and source.strip()]
+    if sources:
+        options['sources'] = sources
+
+    sort = data.get('sort') or 'newest'
+    if sort not in SEARCH_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SEARCH_SORTS)}")
+    options['sort'] = sort
+    return options
+
+def _sort_price(value):
+    """A price as the search sorts see it: None unless it is a number"""
+    return value if isinstance(value, (int, float)) else None
+
+def sort_listings(listings, sort='newest'):
+    """Sort listings in place the way SEARCH_SORTS orders them in SQL"""
+    listings.sort(key=lambda listing: (listing.get('created_at') or '', listing.get('id') or 0), reverse=True)
+    if sort == 'price_asc':
+        listings.sort(key=lambda listing: (_sort_price(listing.get('price')) is None, _sort_price(listing.get('price')) or 0))
+    elif sort == 'price_desc':
+        listings.sort(key=lambda listing: (_sort_price(listing.get('price')) is None, -(_sort_price(listing.get('price')) or 0)))
+    elif sort == 'price_per_sqft':
+        def per_sqft(listing):
+            price, sqft = _sort_price(listing.get('price')), listing.get('square_feet')
+            return price / sqft if price and price > 0 and sqft and sqft > 0 else None
+        listings.sort(key=lambda listing: (per_sqft(listing) is None, per_sqft(listing) or 0))
+    return listings
+
+def build_facets(rows):
+    """Facet counts from (bedrooms, source, price bucket, count) rows
+
+    Returns {'total', 'bedrooms': {beds: count}, 'source': {source: count},
+    'price': [{'min', 'max', 'count'}, ...]}; the last price bucket has no
+    max and listings without a price are in none of them.
+    """
+    bedrooms = {}
+    sources = {}
+    buckets = [0] * (len(PRICE_BUCKETS) + 1)
+    total = 0
+    for beds, source, bucket, count in rows:
+        total += count
+        if beds is not None:
+            bedrooms[int(beds)] = bedrooms.get(int(beds), 0) + count
+        if source is not None:
+            sources[source] = sources.get(source, 0) + count
+        if bucket is not None:
+            buckets[int(bucket)] += count
+
+    bounds = (0,) + PRICE_BUCKETS + (None,)
+    return {
+        'total': total,
+        'bedrooms': {str(beds): bedrooms[beds] for beds in sorted(bedrooms)},
+        'source': dict(sorted(sources.items(), key=lambda item: (-item[1], item[0]))),
+        'price': [
+            {'min': bounds[number], 'max': bounds[number + 1], 'count': count}
+            for number, count in enumerate(buckets)
+        ]
+    }
+
+def merge_facets(parts):
+    """Add up build_facets() results, e.g. from several shards"""
+    rows = []
+    for facets in parts:
+        rows.extend((int(beds), None, None, count) for beds, count in facets['bedrooms'].items())
+        rows.extend((None, source, None, count) for source, count in facets['source'].items())
+        rows.extend((None, None, number, bucket['count']) for number, bucket in enumerate(facets['price']))
+    merged = build_facets(rows)
+    merged['total'] = sum(facets['total'] for facets in parts)
+    return merged
+
+def _stats_delta(before, after):
+    """Difference between two get_stats() results"""
+    delta = {
+        key: round((after.get(key) or 0) - (before.get(key) or 0), 2)
+        for key in ('total_listings', 'recent_listings', 'average_price')
+    }
+    
+    before_sources = before.get('by_source', {})
+    after_sources = after.get('by_source', {})
+    delta['by_source'] = {}
+    for source in set(before_sources) | set(after_sources):
+        change = after_sources.get(source, 0) - before_sources.get(source, 0)
+        if change:
+            delta['by_source'][source] = change
+    
+    return delta
+
+class DatabaseManager(ListingStore):
+    dialect = 'sqlite'
+    
+    def __init__(self, db_path="rental_listings.db", events=None, profiler=None):
         self.db_path = db_path
         self.logger = logging.getLogger(__name__)
+        self.events = events or EventBus()
+        # QueryProfiler that times every statement on this store's connections
+        self.profiler = profiler
+        # Kept open for data_version(), which is relative to one connection
+        self._version_conn = None
+        self._version_lock = threading.Lock()
+        # Listing columns, read on first use by the encoded read paths
+        self._columns = None
+        
+    def connect(self):
+        """Open a connection with the platform's SQL functions registered"""
+        if self.profiler is not None:
+            conn = sqlite3.connect(self.db_path, factory=self.profiler.connection_factory)
+        else:
+            conn = sqlite3.connect(self.db_path)
+        conn.create_function('distance_miles', 4, distance_miles, deterministic=True)
+        return conn
+    
+    def data_version(self):
+        """SQLite's PRAGMA data_version on a connection kept for the purpose
+
+        It changes whenever any other connection, in this process or
+        another, commits to the database file.
+        """
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def close(self):
+        """Close the data_version() connection"""
+        with self._version_lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
         
     def init_database(self):
         """Initialize the database with required tables"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
+            # New databases can then be shrunk a little at a time by the
+            # retention worker (no effect on existing files)
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            
             # Create listings table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS listings (
@@ -32,12 +297,18 @@ class DatabaseManager:
                     amenities TEXT,
                     phone TEXT,
                     description TEXT,
+                    latitude REAL,
+                    longitude REAL,
+                    city TEXT,
                     scraped_at TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE(source, address, price) ON CONFLICT REPLACE
                 )
             ''')
             
+            self._migrate_columns(cursor)
+            self._columns = None
+            
             # Create search index
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_location 
@@ -59,6 +330,50 @@ class DatabaseManager:
                 ON listings(source)
             ''')
             
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_city 
+                ON listings(city)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_created_at 
+                ON listings(created_at)
+            ''')
+            
+            # Normalized amenities: a dictionary of names plus a join table
+            # keyed by amenity first, so each filter term is an index range
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS amenities (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS listing_amenities (
+                    amenity_id INTEGER NOT NULL,
+                    listing_id INTEGER NOT NULL,
+                    PRIMARY KEY (amenity_id, listing_id)
+                ) WITHOUT ROWID
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_listing_amenities_listing 
+                ON listing_amenities(listing_id)
+            ''')
+            
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_listings_delete_amenities
+                AFTER DELETE ON listings
+                BEGIN
+                    DELETE FROM listing_amenities WHERE listing_id = OLD.id;
+                END
+            ''')
+            
+            self._backfill_amenities(cursor)
+            
+            self._create_geo_index(cursor)
+            
             conn.commit()
             conn.close()
             
@@ -68,15 +383,22 @@ class DatabaseManager:
             self.logger.error(f"Error initializing database: {e}")
             
     def save_listings(self, listings):
-        """Save a list of listings to the database"""
+        """Save a list of listings to the database, returning how many were saved"""
         if not listings:
-            return
+            return 0
             
         try:
-            conn = sqlite3.connect(self.db_path)
+            # Only pay for change tracking when someone is listening
+            publish = self.events.has_subscribers()
+            stats_before = self.get_stats() if publish else None
+            
+            conn = self.connect()
             cursor = conn.cursor()
             
             saved_count = 0
+            new_ids = []
+            changed_ids = []
+            refreshed_ids = []
             
             for listing in listings:
                 try:
@@ -85,28 +407,48 @@ class DatabaseManager:
                     if 'amenities' in listing and listing['amenities']:
                         amenities_json = json.dumps(listing['amenities'])
                     
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO listings 
-                        (source, title, address, price, price_max, bedrooms, 
-                         bathrooms, square_feet, url, image_url, amenities, 
-                         phone, description, scraped_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        listing.get('source'),
-                        listing.get('title'),
-                        listing.get('address'),
-                        listing.get('price'),
-                        listing.get('price_max'),
-                        listing.get('bedrooms'),
-                        listing.get('bathrooms'),
-                        listing.get('square_feet'),
-                        listing.get('url'),
-                        listing.get('image_url'),
-                        amenities_json,
-                        listing.get('phone'),
-                        listing.get('description'),
-                        listing.get('scraped_at')
-                    ))
+                    content = tuple(
+                        amenities_json if field == 'amenities' else listing.get(field)
+                        for field in CONTENT_FIELDS
+                    )
+                    
+                    cursor.execute(f'''
+                        SELECT id, {', '.join(CONTENT_FIELDS)} FROM listings
+                        WHERE source = ? AND address = ? AND price = ?
+                    ''', (listing.get('source'), listing.get('address'), listing.get('price')))
+                    existing = cursor.fetchone()
+                    
+                    if existing is None:
+                        cursor.execute(f'''
+                            INSERT OR REPLACE INTO listings 
+                            (source, address, price, city, {', '.join(CONTENT_FIELDS)}, scraped_at)
+                            VALUES ({', '.join('?' * (len(CONTENT_FIELDS) + 5))})
+                        ''', (
+                            listing.get('source'),
+                            listing.get('address'),
+                            listing.get('price'),
+                            extract_city(listing.get('address'))
+                        ) + content + (listing.get('scraped_at'),))
+                        new_ids.append(cursor.lastrowid)
+                        self._save_amenities(cursor, cursor.lastrowid, listing.get('amenities'))
+                    elif tuple(existing[1:]) == content:
+                        # Re-scraped without changes: refresh timestamps, keep the id
+                        cursor.execute('''
+                            UPDATE listings SET scraped_at = ?, created_at = CURRENT_TIMESTAMP
+                            WHERE id = ?
+                        ''', (listing.get('scraped_at'), existing[0]))
+                        refreshed_ids.append(existing[0])
+                    else:
+                        cursor.execute(f'''
+                            UPDATE listings SET {', '.join(f'{field} = ?' for field in CONTENT_FIELDS)},
+                                scraped_at = ?, created_at = CURRENT_TIMESTAMP
+                            WHERE id = ?
+                        ''', content + (listing.get('scraped_at'), existing[0]))
+                        changed_ids.append(existing[0])
+                        
+                        if existing[CONTENT_FIELDS.index('amenities') + 1] != amenities_json:
+                            cursor.execute("DELETE FROM listing_amenities WHERE listing_id = ?", (existing[0],))
+                            self._save_amenities(cursor, existing[0], listing.get('amenities'))
                     
                     saved_count += 1
                     
@@ -115,59 +457,257 @@ class DatabaseManager:
                     continue
             
             conn.commit()
+            if saved_count:
+                self.events.notify({'type': 'write', 'count': saved_count,
+                                    'ids': new_ids + changed_ids + refreshed_ids})
+            
+            if publish and (new_ids or changed_ids):
+                self.events.publish({
+                    'type': 'ingest',
+                    'new': self._fetch_listings_by_id(cursor, new_ids),
+                    'changed': self._fetch_listings_by_id(cursor, changed_ids),
+                    'stats_delta': _stats_delta(stats_before, self.get_stats())
+                })
+            
             conn.close()
             
             self.logger.info(f"Saved {saved_count} listings to database")
+            return saved_count
             
         except Exception as e:
             self.logger.error(f"Error saving listings to database: {e}")
+            return 0
+    
+    def _migrate_columns(self, cursor):
+        """Add columns introduced after a database was first created"""
+        cursor.execute("PRAGMA table_info(listings)")
+        existing = {row[1] for row in cursor.fetchall()}
+        
+        for column, column_type in MIGRATED_COLUMNS.items():
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE listings ADD COLUMN {column} {column_type}")
+        
+        if 'city' not in existing:
+            cursor.execute("SELECT id, address FROM listings")
+            cursor.executemany(
+                "UPDATE listings SET city = ? WHERE id = ?",
+                [(extract_city(address), listing_id) for listing_id, address in cursor.fetchall()]
+            )
+    
+    def _create_geo_index(self, cursor):
+        """Create the R*Tree over listing coordinates, kept in sync by triggers"""
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS listings_geo 
+            USING rtree(id, min_lat, max_lat, min_lng, max_lng)
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_listings_geo_insert
+            AFTER INSERT ON listings
+            WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+            BEGIN
+                INSERT INTO listings_geo VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_listings_geo_update
+            AFTER UPDATE OF latitude, longitude ON listings
+            BEGIN
+                DELETE FROM listings_geo WHERE id = OLD.id;
+                INSERT INTO listings_geo
+                SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+                WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_listings_geo_delete
+            AFTER DELETE ON listings
+            BEGIN
+                DELETE FROM listings_geo WHERE id = OLD.id;
+            END
+        ''')
+        
+        # Index rows that gained coordinates before the index existed
+        cursor.execute('''
+            INSERT INTO listings_geo
+            SELECT id, latitude, latitude, longitude, longitude FROM listings
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+              AND id NOT IN (SELECT id FROM listings_geo)
+        ''')
     
-    def search_listings(self, location="", min_price=0, max_price=10000, bedrooms=""):
-        """Search for listings based on criteria"""
+    def _save_amenities(self, cursor, listing_id, amenities):
+        """Link a listing to its normalized amenities"""
+        names = {_normalize_amenity(amenity) for amenity in amenities or [] if isinstance(amenity, str)}
+        names.discard('')
+        
+        for name in names:
+            cursor.execute("INSERT OR IGNORE INTO amenities (name) VALUES (?)", (name,))
+            cursor.execute('''
+                INSERT OR IGNORE INTO listing_amenities (amenity_id, listing_id)
+                SELECT id, ? FROM amenities WHERE name = ?
+            ''', (listing_id, name))
+    
+    def _backfill_amenities(self, cursor):
+        """Populate the amenity tables for listings saved before they existed"""
+        cursor.execute('''
+            SELECT id, amenities FROM listings
+            WHERE amenities IS NOT NULL
+              AND id NOT IN (SELECT listing_id FROM listing_amenities)
+        ''')
+        
+        for listing_id, amenities_json in cursor.fetchall():
+            try:
+                amenities = json.loads(amenities_json)
+            except ValueError:
+                continue
+            if isinstance(amenities, list):
+                self._save_amenities(cursor, listing_id, amenities)
+    
+    def _fetch_listings_by_id(self, cursor, ids):
+        """Load listings for the given ids as dictionaries"""
+        listings = []
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(
+                f"SELECT * FROM listings WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY id",
+                chunk
+            )
+            listings.extend(self._rows_to_listings(cursor, cursor.fetchall()))
+        return listings
+    
+    def get_listings_by_id(self, ids):
+        """Load listings for the given ids as dictionaries"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Build query
-            query = "SELECT * FROM listings WHERE 1=1"
-            params = []
-            
-            if location:
-                query += " AND address LIKE ?"
-                params.append(f"%{location}%")
+            conn = self.connect()
+            listings = self._fetch_listings_by_id(conn.cursor(), list(ids))
+            conn.close()
+            return listings
             
-            if min_price > 0:
-                query += " AND price >= ?"
-                params.append(min_price)
+        except Exception as e:
+            self.logger.error(f"Error loading listings by id: {e}")
+            return []
+    
+    def _rows_to_listings(self, cursor, rows):
+        """Convert result rows to listing dictionaries"""
+        return serialization.rows_to_listings((d[0] for d in cursor.description), rows)
+    
+    def _search_filters(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                        sources=None):
+        """WHERE clause and parameters shared by search_listings and search_facets"""
+        query = " WHERE 1=1"
+        params = []
+        
+        if near:
+            latitude, longitude, radius = near
+            # Box lookup in the R*Tree, then the exact distance on the survivors
+            query += self._geo_box_clause()
+            params.extend(radius_bounds(latitude, longitude, radius))
+            query += " AND distance_miles(latitude, longitude, ?, ?) <= ?"
+            params.extend([latitude, longitude, radius])
+        
+        if bounds:
+            query += self._geo_box_clause()
+            params.extend(bounds)
+        
+        if location:
+            query += " AND address LIKE ?"
+            params.append(f"%{location}%")
+        
+        if min_price > 0:
+            query += " AND price >= ?"
+            params.append(min_price)
+        
+        if max_price < 10000:
+            query += " AND price <= ?"
+            params.append(max_price)
+        
+        if bedrooms and bedrooms.isdigit():
+            query += " AND bedrooms = ?"
+            params.append(int(bedrooms))
+        
+        if min_bathrooms:
+            query += " AND bathrooms >= ?"
+            params.append(min_bathrooms)
+        
+        if min_sqft:
+            query += " AND square_feet >= ?"
+            params.append(min_sqft)
+        
+        if max_sqft:
+            query += " AND square_feet <= ?"
+            params.append(max_sqft)
+        
+        if sources:
+            query += f" AND source IN ({', '.join('?' * len(sources))})"
+            params.extend(sources)
+        
+        amenity_terms = [_normalize_amenity(term) for term in amenities or []]
+        amenity_terms = [term for term in amenity_terms if term]
+        if amenity_terms:
+            # One indexed lookup per term, intersected inside SQLite
+            query += " AND id IN (" + " INTERSECT ".join(
+                "SELECT listing_id FROM listing_amenities WHERE amenity_id IN "
+                "(SELECT id FROM amenities WHERE name LIKE ?)"
+                for _ in amenity_terms
+            ) + ")"
+            params.extend(f"%{term}%" for term in amenity_terms)
+        
+        return query, params
+    
+    def search_listings(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                        sources=None, sort='newest'):
+        """Search for listings based on criteria
+
+        Each entry in amenities must match (as a substring) at least one of a
+        listing's amenities; all entries must match. near is a
+        (latitude, longitude, radius_miles) tuple and bounds a
+        (south, north, west, east) map box; both use the R*Tree index.
+        min_bathrooms, min_sqft and max_sqft are inclusive bounds, sources
+        a list of source names, and sort one of SEARCH_SORTS.
+        """
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
             
-            if max_price < 10000:
-                query += " AND price <= ?"
-                params.append(max_price)
+            columns = "*, distance_miles(latitude, longitude, ?, ?) AS distance_miles" if near else "*"
+            query, params = self._search_query(columns, location, min_price, max_price, bedrooms, amenities, near,
+                                               bounds, min_bathrooms, min_sqft, max_sqft, sources, sort)
+            cursor.execute(query, params)
+            listings = self._rows_to_listings(cursor, cursor.fetchall())
             
-            if bedrooms and bedrooms.isdigit():
-                query += " AND bedrooms = ?"
-                params.append(int(bedrooms))
+            conn.close()
+            return listings
             
-            query += " ORDER BY created_at DESC LIMIT 100"
+        except Exception as e:
+            self.logger.error(f"Error searching listings: {e}")
+            return []
+    
+    def search_listings_encoded(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                                near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                                sources=None, sort='newest'):
+        """search_listings as EncodedListing rows whose JSON SQLite writes itself"""
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
             
+            if near:
+                # Encode the page of results, so each distance is computed once
+                query, params = self._search_query(
+                    "*, distance_miles(latitude, longitude, ?, ?) AS distance_miles", location, min_price,
+                    max_price, bedrooms, amenities, near, bounds, min_bathrooms, min_sqft, max_sqft, sources, sort
+                )
+                query = f"SELECT {self._encoded_columns(cursor, near)} FROM ({query}) ORDER BY {SEARCH_SORTS[sort]}"
+            else:
+                query, params = self._search_query(self._encoded_columns(cursor), location, min_price, max_price,
+                                                   bedrooms, amenities, near, bounds, min_bathrooms, min_sqft,
+                                                   max_sqft, sources, sort)
             cursor.execute(query, params)
-            rows = cursor.fetchall()
-            
-            # Convert to list of dictionaries
-            columns = [description[0] for description in cursor.description]
-            listings = []
-            
-            for row in rows:
-                listing = dict(zip(columns, row))
-                
-                # Parse amenities JSON
-                if listing['amenities']:
-                    try:
-                        listing['amenities'] = json.loads(listing['amenities'])
-                    except:
-                        listing['amenities'] = []
-                
-                listings.append(listing)
+            listings = self._rows_to_encoded(cursor.fetchall())
             
             conn.close()
             return listings
@@ -176,30 +716,113 @@ class DatabaseManager:
             self.logger.error(f"Error searching listings: {e}")
             return []
     
+    def _search_query(self, columns, location, min_price, max_price, bedrooms, amenities, near, bounds,
+                      min_bathrooms, min_sqft, max_sqft, sources, sort):
+        """SELECT of columns for the first page of a search, and its parameters
+
+        With near, columns take the search point's latitude and longitude
+        as their first two parameters.
+        """
+        query = f"SELECT {columns} FROM listings"
+        params = list(near[:2]) if near else []
+        
+        where, where_params = self._search_filters(
+            location, min_price, max_price, bedrooms, amenities, near, bounds,
+            min_bathrooms, min_sqft, max_sqft, sources
+        )
+        return query + where + f" ORDER BY {SEARCH_SORTS[sort]} LIMIT 100", params + where_params
+    
+    def _encoded_columns(self, cursor, near=None):
+        """Columns selecting (image_url, JSON text) for each listing, with its distance_miles for near"""
+        if self._columns is None:
+            cursor.execute("PRAGMA table_info(listings)")
+            self._columns = [row[1] for row in cursor.fetchall()]
+        columns = self._columns + ['distance_miles'] if near else self._columns
+        return f"image_url, {serialization.json_object_sql(columns, precise=('distance_miles',))}"
+    
+    def _rows_to_encoded(self, rows):
+        """EncodedListing rows from (image_url, JSON text) results"""
+        return list(map(serialization.EncodedListing._make, rows))
+    
+    def search_facets(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                      near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                      sources=None):
+        """Counts by bedrooms, source and price bucket of every listing a search matches
+
+        Takes the filters of search_listings and returns build_facets()
+        output. The counts come from one grouped pass over the matching
+        rows, using the same indexes as the search itself.
+        """
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            
+            where, params = self._search_filters(
+                location, min_price, max_price, bedrooms, amenities, near, bounds,
+                min_bathrooms, min_sqft, max_sqft, sources
+            )
+            cursor.execute(
+                f"SELECT bedrooms, source, {PRICE_BUCKET_SQL} AS bucket, COUNT(*) FROM listings{where}"
+                " GROUP BY bedrooms, source, bucket",
+                params
+            )
+            facets = build_facets(cursor.fetchall())
+            
+            conn.close()
+            return facets
+            
+        except Exception as e:
+            self.logger.error(f"Error counting search facets: {e}")
+            return build_facets([])
+    
+    def _geo_box_clause(self):
+        """SQL restricting listings to a (south, north, west, east) box"""
+        return (" AND id IN (SELECT id FROM listings_geo"
+                " WHERE min_lat >= ? AND max_lat <= ? AND min_lng >= ? AND max_lng <= ?)")
+    
+    def get_listing_keys(self, location):
+        """Every stored (source, address, price) whose address contains location
+
+        Unlike search_listings this is not capped, so it can tell which of
+        a location's scraped listings are already known.
+        """
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT source, address, price FROM listings WHERE address LIKE ?", (f"%{location}%",))
+            keys = set(cursor)
+            conn.close()
+            return keys
+            
+        except Exception as e:
+            self.logger.error(f"Error getting listing keys: {e}")
+            return set()
+    
     def get_all_listings(self, limit=100):
         """Get all listings from database"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             cursor.execute("SELECT * FROM listings ORDER BY created_at DESC LIMIT ?", (limit,))
-            rows = cursor.fetchall()
-            
-            # Convert to list of dictionaries
-            columns = [description[0] for description in cursor.description]
-            listings = []
-            
-            for row in rows:
-                listing = dict(zip(columns, row))
-                
-                # Parse amenities JSON
-                if listing['amenities']:
-                    try:
-                        listing['amenities'] = json.loads(listing['amenities'])
-                    except:
-                        listing['amenities'] = []
-                
-                listings.append(listing)
+            listings = self._rows_to_listings(cursor, cursor.fetchall())
+            
+            conn.close()
+            return listings
+            
+        except Exception as e:
+            self.logger.error(f"Error getting all listings: {e}")
+            return []
+    
+    def get_all_listings_encoded(self, limit=100):
+        """get_all_listings as EncodedListing rows whose JSON SQLite writes itself"""
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(f"SELECT {self._encoded_columns(cursor)} FROM listings ORDER BY created_at DESC LIMIT ?",
+                           (limit,))
+            listings = self._rows_to_encoded(cursor.fetchall())
             
             conn.close()
             return listings
@@ -211,7 +834,7 @@ class DatabaseManager:
     def get_stats(self):
         """Get platform statistics"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             stats = {}
@@ -267,20 +890,25 @@ class DatabaseManager:
             return {}
     
     def clean_old_listings(self, days=30):
-        """Remove listings older than specified days"""
+        """Remove listings older than specified days
+
+        Deletes in small batches so the write lock is never held for long;
+        see database.retention.RetentionWorker for archiving and compaction.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM listings WHERE created_at < datetime('now', '-' || ? || ' days')", (days,))
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
+            from database.retention import RetentionWorker
+            deleted_count = RetentionWorker(self, days=days, archive=None, pause=0).purge_expired()
             
             self.logger.info(f"Cleaned {deleted_count} old listings")
             return deleted_count
             
         except Exception as e:
             self.logger.error(f"Error cleaning old listings: {e}")
-            return 0
\ No newline at end of file
+            return 0
+    
+    def start_maintenance(self, days=30):
+        """Expire old listings in small batches and compact during quiet hours"""
+        from database.retention import RetentionWorker
+        worker = RetentionWorker(self, days=days)
+        worker.start()
+        return worker
\ No newline at end of file
@@ -0,0 +1,74 @@
+import logging
+import queue
+import threading
+
+
+class EventBus:
+    """In-process publish/subscribe hub for ingest notifications"""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def subscribe(self):
+        """Register a subscriber and return the queue its events arrive on"""
+        subscription = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscriber queue"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def add_listener(self, callback):
+        """Call callback(event) for every notify(); it runs on the writer's thread, so keep it quick"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def notify(self, event):
+        """Tell in-process listeners about a write
+
+        Unlike publish(), callers send this on every write: the event is a
+        small dict and nothing is queued.
+        """
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                # A broken listener must not fail the write that notified it
+                self.logger.error(f"Error in event listener: {e}")
+
+    def has_subscribers(self):
+        """Whether anyone is listening, so publishers can skip building events"""
+        return bool(self._subscribers)
+
+    def publish(self, event):
+        """Deliver an event to every subscriber without blocking the publisher"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # Slow consumer: drop its oldest event rather than stall ingest
+                try:
+                    subscription.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscription.put_nowait(event)
+                except queue.Full:
+                    pass
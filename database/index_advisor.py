@@ -0,0 +1,295 @@
+"""
+Index recommendations from an observed query workload.
+
+    curl -s localhost:5000/api/debug/queries > workload.json
+    python -m database.index_advisor --workload workload.json
+    python -m database.index_advisor --db rental_listings.db --workload workload.json --apply
+
+The workload is a QueryProfiler report (the app collects one when started
+with QUERY_PROFILE=1). Every query shape whose plan scans a whole table or
+sorts in a temporary b-tree is broken into its equality, sort and range
+columns, and a composite index in that order (equality, sort, range) is
+proposed, widened into a covering index when the query reads only a few
+columns. Proposals an existing index already serves are dropped, the rest
+are merged by prefix and ranked by the query time they would save. With
+--apply the indexes are created and the table re-analyzed. SQLite only.
+"""
+
+import argparse
+import json
+import re
+import sys
+from database.query_profiler import normalize_sql
+from database.storage import open_database
+
+# Wider indexes cost more on every write than they save on reads
+MAX_INDEX_COLUMNS = 5
+
+_CLAUSES = re.compile(r"\b(WHERE|GROUP BY|HAVING|ORDER BY|LIMIT)\b", re.IGNORECASE)
+_AND = re.compile(r"\s+AND\s+", re.IGNORECASE)
+_EQUALITY = re.compile(r"^(?:\w+\.)?(\w+)\s*(?:==?\s*\?|IN\s*\(.*\))$", re.IGNORECASE | re.DOTALL)
+_RANGE = re.compile(r"^(?:\w+\.)?(\w+)\s*(?:[<>]=?\s*\S.*|BETWEEN\s+.+|IS\s+NOT\s+NULL)$", re.IGNORECASE | re.DOTALL)
+_SORT_KEY = re.compile(r"^(?:\w+\.)?(\w+)(?:\s+(?:ASC|DESC))?$", re.IGNORECASE)
+_IDENTIFIER = re.compile(r"\b([A-Za-z_]\w*)\b")
+
+
+def _top_level(sql):
+    """sql with everything inside parentheses blanked, positions unchanged"""
+    out = []
+    depth = 0
+    for ch in sql:
+        if ch == ')':
+            depth -= 1
+        out.append(ch if depth == 0 else ' ')
+        if ch == '(':
+            depth += 1
+    return ''.join(out)
+
+
+def parse_query(shape):
+    """Table and index-relevant columns of a single-table statement
+
+    Returns a dict with table, equality, sort and range column lists,
+    selected (the columns read, or None for SELECT *) and residual (columns
+    in conditions an index cannot serve), or None for statements the
+    advisor does not understand (joins, OR conditions, DDL).
+    """
+    top = _top_level(shape)
+    match = re.match(r"\s*(?:SELECT\s+(.*?)\s+FROM|DELETE\s+FROM|UPDATE)\s+(\w+)(.*)$", top, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return None
+    # Anything between the table and the first clause other than an UPDATE's
+    # SET list means more than one table
+    source = _CLAUSES.split(match.group(3))[0]
+    if not re.match(r"\s*SET\b", source, re.IGNORECASE) and re.search(r"\b(JOIN|UNION|INTERSECT|EXCEPT)\b|,", source, re.IGNORECASE):
+        return None
+
+    # Slice the clauses out of the original text at top-level keyword positions
+    clauses = {}
+    marks = list(_CLAUSES.finditer(top, match.start(3)))
+    for i, mark in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(shape)
+        clauses[mark.group(1).upper()] = (shape[mark.end():end].strip(), top[mark.end():end].strip())
+
+    query = {
+        'table': match.group(2),
+        'equality': [],
+        'sort': [],
+        'range': [],
+        'selected': None,
+        'residual': []
+    }
+    if match.group(1) is not None and match.group(1).strip() != '*':
+        query['selected'] = _IDENTIFIER.findall(shape[match.start(1):match.end(1)])
+
+    where, where_top = clauses.get('WHERE', ('', ''))
+    if re.search(r"\bOR\b", where_top, re.IGNORECASE):
+        return None
+    conditions = []
+    start = 0
+    for separator in _AND.finditer(where_top):
+        conditions.append(where[start:separator.start()])
+        start = separator.end()
+    if where:
+        conditions.append(where[start:])
+    # "x BETWEEN ? AND ?" was split at its AND
+    merged = []
+    for condition in conditions:
+        if merged and re.search(r"\bBETWEEN\b", merged[-1], re.IGNORECASE) and merged[-1].upper().count(' AND ') == 0:
+            merged[-1] += ' AND ' + condition
+        else:
+            merged.append(condition.strip())
+
+    for condition in merged:
+        equality = _EQUALITY.match(condition)
+        ranged = _RANGE.match(condition)
+        if equality:
+            query['equality'].append(equality.group(1))
+        elif ranged:
+            query['range'].append(ranged.group(1))
+        else:
+            query['residual'].extend(_IDENTIFIER.findall(condition))
+
+    sort = clauses.get('ORDER BY') or clauses.get('GROUP BY')
+    if sort:
+        keys = [_SORT_KEY.match(key.strip()) for key in sort[0].split(',')]
+        if all(keys):
+            query['sort'] = [key.group(1) for key in keys]
+    return query
+
+
+def index_columns(query, columns):
+    """Equality, sort, range (then covering) column order for a parsed query
+
+    columns is the table's column set; anything else (aliases, SQL
+    keywords and functions) is ignored. Returns a tuple, empty when no
+    index would help.
+    """
+    def known(names):
+        return [name for name in names if name in columns]
+
+    if 'id' in query['equality']:
+        # A rowid lookup needs no index
+        return ()
+
+    ordered = []
+    for name in known(query['equality']) + known(query['sort']) + known(query['range']):
+        if name not in ordered and name != 'id':
+            ordered.append(name)
+    if not ordered:
+        return ()
+
+    if query['selected'] is not None:
+        extra = [
+            name for name in known(query['selected'] + query['residual'])
+            if name not in ordered and name != 'id'
+        ]
+        if len(ordered) + len(set(extra)) <= MAX_INDEX_COLUMNS:
+            for name in extra:
+                if name not in ordered:
+                    ordered.append(name)
+    return tuple(ordered[:MAX_INDEX_COLUMNS])
+
+
+def existing_indexes(conn, table):
+    """{index name: (columns, origin)} for a table; origin 'c' is CREATE INDEX"""
+    indexes = {}
+    for _, name, _, origin, _ in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        columns = tuple(row[2] for row in conn.execute(f"PRAGMA index_info({name})").fetchall())
+        indexes[name] = (columns, origin)
+    return indexes
+
+
+def recommend_indexes(conn, queries):
+    """Indexes worth adding for a workload, best first
+
+    queries are QueryProfiler report entries. Each recommendation has the
+    index name, table, columns, CREATE INDEX sql, the time (benefit_ms)
+    and calls of the queries it targets, the query shapes themselves, and
+    redundant: existing single-purpose indexes it makes unnecessary.
+    """
+    candidates = {}
+    tables = {}
+    for entry in queries:
+        if not (entry.get('full_scan') or entry.get('temp_sort')):
+            continue
+        query = parse_query(entry['shape'])
+        if query is None:
+            continue
+
+        table = query['table']
+        if table not in tables:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+            tables[table] = (columns, existing_indexes(conn, table))
+        columns, indexes = tables[table]
+        wanted = index_columns(query, columns)
+        if not wanted or any(existing[:len(wanted)] == wanted for existing, _ in indexes.values()):
+            continue
+
+        candidate = candidates.setdefault((table, wanted), {'benefit_ms': 0.0, 'calls': 0, 'queries': []})
+        candidate['benefit_ms'] += entry.get('total_ms', 0.0)
+        candidate['calls'] += entry.get('calls', 0)
+        candidate['queries'].append(entry['shape'])
+
+    # An index also serves every query whose columns are a prefix of its own
+    keys = sorted(candidates, key=lambda key: len(key[1]), reverse=True)
+    for i, (table, wanted) in enumerate(keys):
+        for longer_table, longer in keys[:i]:
+            if longer_table == table and longer[:len(wanted)] == wanted and (longer_table, longer) in candidates:
+                target = candidates[(longer_table, longer)]
+                merged = candidates.pop((table, wanted))
+                target['benefit_ms'] += merged['benefit_ms']
+                target['calls'] += merged['calls']
+                target['queries'].extend(merged['queries'])
+                break
+
+    recommendations = []
+    for (table, wanted), candidate in candidates.items():
+        name = f"idx_{table}_{'_'.join(wanted)}"
+        recommendations.append({
+            'name': name,
+            'table': table,
+            'columns': list(wanted),
+            'sql': f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(wanted)})",
+            'benefit_ms': round(candidate['benefit_ms'], 3),
+            'calls': candidate['calls'],
+            'queries': candidate['queries'],
+            'redundant': sorted(
+                index_name for index_name, (existing, origin) in tables[table][1].items()
+                if origin == 'c' and existing == wanted[:len(existing)]
+            )
+        })
+    recommendations.sort(key=lambda recommendation: recommendation['benefit_ms'], reverse=True)
+    return recommendations
+
+
+def apply_recommendations(conn, recommendations):
+    """Create the recommended indexes and refresh the planner statistics
+
+    Returns {query shape: plan after the change} for the targeted queries.
+    """
+    for recommendation in recommendations:
+        conn.execute(recommendation['sql'])
+    conn.execute("ANALYZE")
+    conn.commit()
+
+    plans = {}
+    for recommendation in recommendations:
+        for shape in recommendation['queries']:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {shape}", [None] * shape.count('?')).fetchall()
+            plans[shape] = [row[3] for row in rows]
+    return plans
+
+
+def load_workload(path):
+    """Query entries of a saved QueryProfiler report ("-" for stdin)"""
+    if path == '-':
+        report = json.load(sys.stdin)
+    else:
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+    queries = report['queries']
+    for entry in queries:
+        # Reports may come from other tools; make sure shapes are normalized
+        entry['shape'] = normalize_sql(entry['shape'])
+    return queries
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Recommend indexes for an observed query workload")
+    parser.add_argument('--db', default='rental_listings.db', help="SQLite database path or shard directory")
+    parser.add_argument('--workload', required=True, help="QueryProfiler report JSON file, or - for stdin")
+    parser.add_argument('--apply', action='store_true', help="create the recommended indexes")
+    args = parser.parse_args(argv)
+
+    # Every shard has the same schema, so the first one stands in for the
+    # plans and the recommendations are applied to all of them
+    connections = [partition.connect() for partition in open_database(args.db).partitions()]
+    try:
+        workload = load_workload(args.workload)
+        recommendations = recommend_indexes(connections[0], workload) if connections else []
+        if not recommendations:
+            print("No index changes recommended")
+            return recommendations
+
+        for recommendation in recommendations:
+            print(f"{recommendation['sql']};")
+            print(f"  -- {recommendation['benefit_ms']:.1f}ms over {recommendation['calls']} calls "
+                  f"of {len(recommendation['queries'])} query shapes")
+            if recommendation['redundant']:
+                print(f"  -- makes redundant: {', '.join(recommendation['redundant'])}")
+
+        if args.apply:
+            for conn in connections:
+                for shape, plan in apply_recommendations(conn, recommendations).items():
+                    print(f"\n{shape}")
+                    for step in plan:
+                        print(f"  {step}")
+        return recommendations
+    finally:
+        for conn in connections:
+            conn.close()
+
+if __name__ == '__main__':
+    main()
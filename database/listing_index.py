@@ -0,0 +1,447 @@
+import bisect
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+
+import numpy as np
+
+from database import serialization
+from database.db_manager import extract_city
+
+# Rows scanned per step when walking back from the newest listing
+SCAN_CHUNK = 4096
+
+# Locations whose matching cities are remembered between searches
+LOCATION_CODES_CACHED = 1024
+
+# Records measured to estimate the size of the rest
+MEMORY_SAMPLE = 100
+
+# Numeric columns, one array each
+COLUMNS = ('_ids', '_price', '_bedrooms', '_city', '_created', '_alive')
+
+# Listing fields kept per record, in SELECT order
+RECORD_FIELDS = (
+    'id', 'source', 'title', 'address', 'price', 'price_max', 'bedrooms', 'bathrooms',
+    'square_feet', 'url', 'image_url', 'amenities', 'phone', 'description', 'latitude',
+    'longitude', 'city', 'scraped_at', 'created_at'
+)
+
+
+class ListingRecord:
+    """One listing held by the index; rebuilt as a dict only when returned"""
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, listing):
+        for field in RECORD_FIELDS:
+            setattr(self, field, listing.get(field))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in RECORD_FIELDS}
+
+
+def _price_value(price):
+    """Numeric price as SQLite compares it: NULL never matches, text sorts above every number"""
+    if price is None:
+        return np.nan
+    if isinstance(price, (int, float)):
+        return float(price)
+    return np.inf
+
+
+class ListingIndex:
+    """In-memory columnar index over the newest listings
+
+    Rows are kept oldest to newest, so a newest-first query walks back from
+    the end in chunks, filtering each chunk with vectorized masks, and
+    usually stops after the first one. Writes are applied from the store's
+    write notifications; when one cannot be applied, the index is marked
+    dirty and reloaded on a background thread, and searches go to the
+    database until the reload is done. At most max_listings rows are held; when the table
+    is larger, a query that cannot fill its limit from the index goes to
+    the database, as do amenity and geographic filters, free-text
+    locations, bathroom, size and source filters and the other sorts. A
+    "City, ST" location is matched by city and then checked against the
+    address like the database's LIKE filter; each city keeps the positions
+    of its rows, so such a search walks only those.
+    """
+
+    def __init__(self, db, max_listings=1_000_000):
+        self.db = db
+        self.max_listings = max_listings
+        self.logger = logging.getLogger(__name__)
+        self.complete = False
+        self.loaded = False
+        self.dirty = False
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.RLock()
+        self._reloading = False
+        # Writes notified during a reload, applied once it has swapped in
+        self._pending = []
+        self._reset(0)
+        db.events.add_listener(self._on_write)
+
+    def _reset(self, capacity):
+        capacity = max(capacity, 1024)
+        self._size = 0
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._bedrooms = np.zeros(capacity, dtype=np.float64)
+        self._city = np.zeros(capacity, dtype=np.int32)
+        self._created = np.zeros(capacity, dtype='datetime64[s]')
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._records = [None] * capacity
+        self._positions = {}
+        self._ordered = True
+        self._city_codes = {}
+        self._city_names = []
+        # Positions of each city's rows, ascending; dead rows stay until compaction
+        self._city_rows = {}
+        self._location_codes = {}
+
+    def _newest(self, db, limit, batch_size):
+        """Listings of one database, newest first"""
+        conn = db.connect()
+        try:
+            cursor = conn.cursor(name='listing_index') if db.dialect == 'postgresql' else conn.cursor()
+            cursor.execute(
+                f"SELECT {db.select_columns} FROM listings ORDER BY created_at DESC, id DESC LIMIT {int(limit)}"
+            )
+            rows = cursor.fetchmany(batch_size)
+            columns = [description[0] for description in cursor.description]
+            while rows:
+                yield from serialization.rows_to_listings(columns, rows)
+                rows = cursor.fetchmany(batch_size)
+        finally:
+            conn.close()
+
+    def load(self, batch_size=10000):
+        """Fill the index with the newest max_listings listings
+
+        The shards of a sharded store are read side by side and merged.
+        """
+        started = time.perf_counter()
+        streams = [self._newest(partition, self.max_listings + 1, batch_size) for partition in self.db.partitions()]
+        try:
+            listings = list(itertools.islice(
+                heapq.merge(*streams, key=lambda listing: (listing.get('created_at') or '', listing['id']), reverse=True),
+                self.max_listings + 1
+            ))
+        finally:
+            for stream in streams:
+                stream.close()
+
+        with self._lock:
+            self._reset(min(len(listings), self.max_listings) * 5 // 4)
+            self.complete = len(listings) <= self.max_listings
+            self._append(reversed(listings[:self.max_listings]))
+            self.loaded = True
+
+        self.logger.info(
+            f"Loaded {self._size} listings into the search index "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms ({self.memory_bytes() // 1024} KiB)"
+        )
+        return self._size
+
+    def _append(self, listings):
+        """Append listings (oldest first) as new rows; lock held"""
+        listings = list(listings)
+        needed = self._size + len(listings)
+        if needed > len(self._ids):
+            self._grow(max(needed, len(self._ids) * 2))
+
+        position = self._size
+        for listing in listings:
+            created = np.datetime64(listing.get('created_at') or 'NaT', 's')
+            old = self._positions.get(listing['id'])
+            if old is not None:
+                if self._created[old] > created:
+                    # A concurrent write already delivered a newer version
+                    continue
+                self._kill(old)
+
+            city = listing.get('city') or ''
+            code = self._city_codes.get(city.lower())
+            if code is None:
+                code = self._city_codes[city.lower()] = len(self._city_names)
+                self._city_names.append(city)
+                self._city_rows[code] = []
+                # The new city may name locations already looked up
+                self._location_codes.clear()
+
+            bedrooms = listing.get('bedrooms')
+            self._ids[position] = listing['id']
+            self._price[position] = _price_value(listing.get('price'))
+            self._bedrooms[position] = bedrooms if isinstance(bedrooms, (int, float)) else np.nan
+            self._city[position] = code
+            self._created[position] = created
+            self._alive[position] = True
+            self._records[position] = ListingRecord(listing)
+            self._positions[listing['id']] = position
+            self._city_rows[code].append(position)
+            if position and (created, listing['id']) < (self._created[position - 1], self._ids[position - 1]):
+                self._ordered = False
+            position += 1
+        self._size = position
+
+    def _grow(self, capacity):
+        for name in COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+        self._records.extend([None] * (capacity - len(self._records)))
+
+    def _kill(self, position):
+        self._alive[position] = False
+        self._records[position] = None
+
+    def _on_write(self, event):
+        """Apply a store write notification"""
+        if not self.loaded:
+            return
+        with self._lock:
+            if self._reloading:
+                # The reload may have read the table before this write
+                self._pending.append(event)
+                return
+        self._apply(event)
+
+    def _apply(self, event):
+        ids = event.get('ids') or []
+        deleted = event.get('deleted') or []
+        listings = self.db.get_listings_by_id(ids) if ids else []
+
+        if len(listings) != len(set(ids)):
+            # Some saved rows could not be read back (a later write may have
+            # replaced them); start over rather than serve a partial view
+            self._reload_in_background()
+            return
+
+        with self._lock:
+            for listing_id in deleted:
+                position = self._positions.pop(listing_id, None)
+                if position is not None:
+                    self._kill(position)
+
+            listings.sort(key=lambda listing: (listing.get('created_at') or '', listing['id']))
+            self._append(listings)
+            self._enforce_bounds()
+
+    def _reload_in_background(self):
+        """Mark the index dirty and reload it off the writer's thread"""
+        with self._lock:
+            self.dirty = True
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name='listing-index-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            self.load()
+        except Exception as e:
+            # Stays dirty, so searches keep going to the database
+            self.logger.error(f"Error reloading search index: {e}")
+            with self._lock:
+                self._reloading = False
+                self._pending = []
+            return
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._reloading = False
+        for event in pending:
+            self._apply(event)
+        with self._lock:
+            # Unless replaying a write started another reload
+            if not self._reloading:
+                self.dirty = False
+
+    def _enforce_bounds(self):
+        """Drop the oldest rows beyond max_listings and compact away dead rows; lock held"""
+        if not self._ordered:
+            self._compact()
+        alive = len(self._positions)
+        if alive > self.max_listings:
+            excess = alive - self.max_listings
+            for position in np.flatnonzero(self._alive[:self._size])[:excess]:
+                self._positions.pop(int(self._ids[position]), None)
+                self._kill(position)
+            self.complete = False
+
+        dead = self._size - len(self._positions)
+        if dead > max(1024, self._size // 4):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the columns with only live rows, oldest to newest; lock held"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        if not self._ordered:
+            keep = keep[np.lexsort((self._ids[keep], self._created[keep]))]
+        for name in COLUMNS:
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+        self._records[:len(keep)] = [self._records[position] for position in keep]
+        self._records[len(keep):self._size] = [None] * (self._size - len(keep))
+        self._size = len(keep)
+        self._positions = {int(listing_id): position for position, listing_id in enumerate(self._ids[:self._size])}
+        self._city_rows = {code: [] for code in self._city_rows}
+        for position, code in enumerate(self._city[:self._size].tolist()):
+            self._city_rows[code].append(position)
+        self._ordered = True
+
+    def _location_cities(self, needle):
+        """Codes of the cities a "City, ST" location can match; lock held"""
+        codes = self._location_codes.get(needle)
+        if codes is None:
+            # Cities naming the location ("West Springfield, IL" for
+            # "Springfield, IL"), plus any the parser could not read
+            codes = [code for key, code in self._city_codes.items() if needle in key or ', ' not in key]
+            if len(self._location_codes) >= LOCATION_CODES_CACHED:
+                self._location_codes.clear()
+            self._location_codes[needle] = codes
+        return codes
+
+    def _city_chunks(self, codes):
+        """Positions of the given cities' rows, newest first, in ascending chunks; lock held
+
+        Each chunk takes at most SCAN_CHUNK rows from every city, and only
+        positions above every row left unread, so chunks come out in order.
+        """
+        ends = {code: len(self._city_rows[code]) for code in codes if self._city_rows[code]}
+        while ends:
+            cutoff = max((self._city_rows[code][end - SCAN_CHUNK] for code, end in ends.items()
+                          if end > SCAN_CHUNK), default=0)
+            chunk = []
+            for code, end in list(ends.items()):
+                rows = self._city_rows[code]
+                start = bisect.bisect_left(rows, cutoff, 0, end)
+                chunk.extend(rows[start:end])
+                if start:
+                    ends[code] = start
+                else:
+                    del ends[code]
+            chunk.sort()
+            yield np.array(chunk, dtype=np.int64)
+
+    def search_listings(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, limit=100, **options):
+        """Answer a search from memory, or from the database when the index cannot
+
+        options are search_listings' bathroom, size and source filters and
+        sort; only the default newest-first search is answered from memory.
+        """
+        refined = options.get('sort', 'newest') != 'newest' or any(
+            value for key, value in options.items() if key != 'sort'
+        )
+        listings = None if refined else self.search(
+            location, min_price, max_price, bedrooms, amenities, near, bounds, limit
+        )
+        if listings is None:
+            self.fallbacks += 1
+            return self.db.search_listings(location, min_price, max_price, bedrooms, amenities,
+                                           near=near, bounds=bounds, **options)
+        self.hits += 1
+        return listings
+
+    def search(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+               near=None, bounds=None, limit=100):
+        """Newest-first matching listings, or None if the index cannot answer exactly"""
+        if not self.loaded or self.dirty or amenities or near or bounds:
+            return None
+        if not isinstance(min_price, (int, float)) or not isinstance(max_price, (int, float)):
+            return None
+
+        needle = None
+        if location:
+            # Only "City, ST" locations; anything else needs the database's LIKE
+            city = extract_city(location)
+            if not city or ', ' not in city or city.lower() != ' '.join(location.split()).lower():
+                return None
+            needle = location.strip().lower()
+
+        beds = int(bedrooms) if isinstance(bedrooms, str) and bedrooms.isdigit() else None
+
+        with self._lock:
+            chunks = self._city_chunks(self._location_cities(needle)) if needle is not None else None
+
+            matches = []
+            end = self._size
+            while len(matches) < limit:
+                if chunks is not None:
+                    positions = next(chunks, None)
+                    if positions is None:
+                        break
+                    mask = self._alive[positions]
+                else:
+                    if end <= 0:
+                        break
+                    start = max(0, end - SCAN_CHUNK)
+                    positions = np.arange(start, end)
+                    mask = self._alive[start:end].copy()
+                    end = start
+
+                if min_price > 0:
+                    mask &= self._price[positions] >= min_price
+                if max_price < 10000:
+                    mask &= self._price[positions] <= max_price
+                if beds is not None:
+                    mask &= self._bedrooms[positions] == beds
+
+                for position in positions[mask][::-1]:
+                    record = self._records[position]
+                    if needle and needle not in (record.address or '').lower():
+                        continue
+                    matches.append(position)
+                    if len(matches) >= limit:
+                        break
+
+            if len(matches) < limit and not self.complete:
+                return None
+
+            return [self._records[position].to_dict() for position in matches]
+
+    def memory_bytes(self):
+        """Approximate size of the columns, position lists and records
+
+        Records are estimated from the newest MEMORY_SAMPLE, counting the
+        strings and numbers they hold.
+        """
+        with self._lock:
+            columns = sum(getattr(self, name).nbytes for name in COLUMNS)
+            # Pointers in the records list and the city position lists, and the id map
+            lists = 8 * (len(self._records) + self._size) + sys.getsizeof(self._positions)
+
+            sample = []
+            for position in range(self._size - 1, -1, -1):
+                if len(sample) >= MEMORY_SAMPLE:
+                    break
+                if self._records[position] is not None:
+                    sample.append(self._records[position])
+            if not sample:
+                return columns + lists
+            measured = sum(
+                sys.getsizeof(record) + sum(
+                    sys.getsizeof(value) for value in map(record.__getattribute__, RECORD_FIELDS)
+                    if value is not None and not isinstance(value, bool)
+                )
+                for record in sample
+            )
+            return columns + lists + measured * len(self._positions) // len(sample)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'listings': len(self._positions),
+                'complete': self.complete,
+                'dirty': self.dirty,
+                'memory_bytes': self.memory_bytes(),
+                'hits': self.hits,
+                'fallbacks': self.fallbacks
+            }
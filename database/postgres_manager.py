@@ -0,0 +1,562 @@
+import io
+import json
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from database import serialization
+from database.db_manager import (
+    CONTENT_FIELDS, EARTH_RADIUS_MILES, _normalize_amenity, _stats_delta, build_facets, extract_city,
+    price_bucket_sql, radius_bounds, search_sorts
+)
+from database.events import EventBus
+from database.storage import ListingStore
+
+# Same columns, order and value types as SELECT * on the SQLite schema;
+# created_at comes back as the same "YYYY-MM-DD HH:MM:SS" UTC text
+LISTING_COLUMNS = (
+    'id, source, title, address, price, price_max, bedrooms, bathrooms, square_feet, '
+    'url, image_url, amenities, phone, description, latitude, longitude, city, scraped_at, '
+    "to_char(created_at, 'YYYY-MM-DD HH24:MI:SS') AS created_at"
+)
+
+# Columns staged with COPY for each save, in COPY order
+STAGED_FIELDS = ('source', 'address', 'price', 'city') + CONTENT_FIELDS + ('scraped_at',)
+
+INTEGER_FIELDS = {'price', 'price_max', 'bedrooms', 'square_feet'}
+FLOAT_FIELDS = {'bathrooms', 'latitude', 'longitude'}
+
+# Haversine distance in miles from (latitude, longitude) to a bound point;
+# parameters are latitude, latitude, longitude of that point
+DISTANCE_SQL = (
+    f"2 * {EARTH_RADIUS_MILES} * asin(least(1, sqrt("
+    "power(sin(radians(latitude - %s) / 2), 2) + "
+    "cos(radians(%s)) * cos(radians(latitude)) * power(sin(radians(longitude - %s) / 2), 2))))"
+)
+
+# price is an INTEGER column here, so it needs no guard against text
+SEARCH_SORTS = search_sorts()
+PRICE_BUCKET_SQL = price_bucket_sql()
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def _to_int(value):
+    """Integer value for a typed column; scraped text like "$2,195/mo" keeps its number"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r'\d[\d,]*', str(value))
+    return int(match.group().replace(',', '')) if match else None
+
+def _to_float(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _copy_value(value):
+    """Encode one field for COPY ... FROM STDIN text format"""
+    if value is None:
+        return '\\N'
+    return str(value).translate(_COPY_ESCAPES)
+
+class PostgresDatabaseManager(ListingStore):
+    """Listing storage on PostgreSQL
+
+    Connections come from a thread-safe pool, batches are staged with COPY
+    and merged with one INSERT ... ON CONFLICT, and coordinates use a GiST
+    index instead of SQLite's R*Tree. Requires psycopg2.
+    """
+
+    dialect = 'postgresql'
+    select_columns = LISTING_COLUMNS
+
+    def __init__(self, dsn, events=None, min_connections=1, max_connections=10):
+        import psycopg2.pool
+
+        self.dsn = dsn
+        self.logger = logging.getLogger(__name__)
+        self.events = events or EventBus()
+        self.pool = psycopg2.pool.ThreadedConnectionPool(min_connections, max_connections, dsn)
+
+    def connect(self):
+        """Open a dedicated (unpooled) connection; the caller closes it"""
+        import psycopg2
+        return psycopg2.connect(self.dsn)
+
+    def close(self):
+        """Close every pooled connection"""
+        self.pool.closeall()
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection, committing on success"""
+        conn = self.pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def init_database(self):
+        """Initialize the database with required tables"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS listings (
+                        id BIGSERIAL PRIMARY KEY,
+                        source TEXT NOT NULL,
+                        title TEXT,
+                        address TEXT NOT NULL,
+                        price INTEGER,
+                        price_max INTEGER,
+                        bedrooms INTEGER,
+                        bathrooms DOUBLE PRECISION,
+                        square_feet INTEGER,
+                        url TEXT,
+                        image_url TEXT,
+                        amenities TEXT,
+                        phone TEXT,
+                        description TEXT,
+                        latitude DOUBLE PRECISION,
+                        longitude DOUBLE PRECISION,
+                        city TEXT,
+                        scraped_at TEXT NOT NULL,
+                        created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+                        UNIQUE (source, address, price)
+                    )
+                ''')
+
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_location ON listings (address)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_price ON listings (price)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_bedrooms ON listings (bedrooms)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_source ON listings (source)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_city ON listings (city)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON listings (created_at DESC)")
+
+                # Radius and map-box searches test point(lng, lat) against a box
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_listings_geo
+                    ON listings USING gist (point(longitude, latitude))
+                    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                ''')
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS amenities (
+                        id SERIAL PRIMARY KEY,
+                        name TEXT NOT NULL UNIQUE
+                    )
+                ''')
+
+                # The foreign key replaces SQLite's delete trigger
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS listing_amenities (
+                        amenity_id INTEGER NOT NULL REFERENCES amenities (id),
+                        listing_id BIGINT NOT NULL REFERENCES listings (id) ON DELETE CASCADE,
+                        PRIMARY KEY (amenity_id, listing_id)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_listing_amenities_listing
+                    ON listing_amenities (listing_id)
+                ''')
+
+            self.logger.info("Database initialized successfully")
+
+        except Exception as e:
+            self.logger.error(f"Error initializing database: {e}")
+
+    def save_listings(self, listings):
+        """Save a list of listings to the database, returning how many were saved
+
+        The batch is COPYed into a temporary table and merged in two set
+        statements: refresh unchanged rows, then upsert the rest, where the
+        RETURNING clause tells new rows from changed ones. It commits or
+        fails as a whole, so every row given counts as saved, duplicates
+        included, as with SQLite.
+        """
+        if not listings:
+            return 0
+
+        try:
+            publish = self.events.has_subscribers()
+            stats_before = self.get_stats() if publish else None
+
+            # Last occurrence wins, matching row-by-row saving
+            staged = {}
+            for listing in listings:
+                row = self._staged_row(listing)
+                staged[(row['source'], row['address'], row['price'])] = (row, listing.get('amenities'))
+
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    CREATE TEMP TABLE listings_staging (
+                        source TEXT, address TEXT, price INTEGER, city TEXT,
+                        title TEXT, price_max INTEGER, bedrooms INTEGER, bathrooms DOUBLE PRECISION,
+                        square_feet INTEGER, url TEXT, image_url TEXT, amenities TEXT, phone TEXT,
+                        description TEXT, latitude DOUBLE PRECISION, longitude DOUBLE PRECISION,
+                        scraped_at TEXT
+                    ) ON COMMIT DROP
+                ''')
+
+                buffer = io.StringIO()
+                for row, _ in staged.values():
+                    buffer.write('\t'.join(_copy_value(row[field]) for field in STAGED_FIELDS) + '\n')
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY listings_staging ({', '.join(STAGED_FIELDS)}) FROM STDIN", buffer
+                )
+
+                content = ', '.join(CONTENT_FIELDS)
+                # Re-scraped without changes: refresh timestamps, keep the id
+                cursor.execute(f'''
+                    UPDATE listings l
+                    SET scraped_at = s.scraped_at, created_at = now() AT TIME ZONE 'utc'
+                    FROM listings_staging s
+                    WHERE l.source = s.source AND l.address = s.address AND l.price = s.price
+                      AND ({', '.join('l.' + field for field in CONTENT_FIELDS)})
+                          IS NOT DISTINCT FROM ({', '.join('s.' + field for field in CONTENT_FIELDS)})
+                    RETURNING l.id
+                ''')
+                refreshed_ids = [row[0] for row in cursor.fetchall()]
+
+                cursor.execute(f'''
+                    INSERT INTO listings (source, address, price, city, {content}, scraped_at)
+                    SELECT source, address, price, city, {content}, scraped_at FROM listings_staging
+                    ON CONFLICT (source, address, price) DO UPDATE
+                    SET {', '.join(f'{field} = EXCLUDED.{field}' for field in CONTENT_FIELDS)},
+                        scraped_at = EXCLUDED.scraped_at, created_at = now() AT TIME ZONE 'utc'
+                    WHERE ({', '.join('listings.' + field for field in CONTENT_FIELDS)})
+                          IS DISTINCT FROM ({', '.join('EXCLUDED.' + field for field in CONTENT_FIELDS)})
+                    RETURNING id, source, address, price, xmax = 0
+                ''')
+                written = cursor.fetchall()
+
+                new_ids = [row[0] for row in written if row[4]]
+                changed_ids = [row[0] for row in written if not row[4]]
+                self._save_amenities(cursor, changed_ids, [
+                    (row[0], staged[(row[1], row[2], row[3])][1]) for row in written
+                ])
+
+                if publish and written:
+                    new = self._fetch_listings_by_id(cursor, new_ids)
+                    changed = self._fetch_listings_by_id(cursor, changed_ids)
+
+            self.events.notify({'type': 'write', 'count': len(listings),
+                                'ids': new_ids + changed_ids + refreshed_ids})
+
+            if publish and written:
+                self.events.publish({
+                    'type': 'ingest',
+                    'new': new,
+                    'changed': changed,
+                    'stats_delta': _stats_delta(stats_before, self.get_stats())
+                })
+
+            self.logger.info(f"Saved {len(listings)} listings to database")
+            return len(listings)
+
+        except Exception as e:
+            self.logger.error(f"Error saving listings to database: {e}")
+            return 0
+
+    def _staged_row(self, listing):
+        """Column values for one listing, coerced to the column types"""
+        row = {field: listing.get(field) for field in STAGED_FIELDS}
+        row['city'] = extract_city(listing.get('address'))
+        row['amenities'] = json.dumps(listing['amenities']) if listing.get('amenities') else None
+        for field in INTEGER_FIELDS:
+            row[field] = _to_int(row[field])
+        for field in FLOAT_FIELDS:
+            row[field] = _to_float(row[field])
+        return row
+
+    def _save_amenities(self, cursor, changed_ids, written):
+        """Link written listings to their normalized amenities"""
+        from psycopg2.extras import execute_values
+
+        if changed_ids:
+            cursor.execute("DELETE FROM listing_amenities WHERE listing_id = ANY(%s)", (changed_ids,))
+
+        links = set()
+        for listing_id, amenities in written:
+            for amenity in amenities or []:
+                if isinstance(amenity, str) and _normalize_amenity(amenity):
+                    links.add((listing_id, _normalize_amenity(amenity)))
+        if not links:
+            return
+
+        execute_values(
+            cursor,
+            "INSERT INTO amenities (name) VALUES %s ON CONFLICT (name) DO NOTHING",
+            sorted({(name,) for _, name in links}),
+            page_size=1000
+        )
+        execute_values(cursor, '''
+            INSERT INTO listing_amenities (amenity_id, listing_id)
+            SELECT a.id, v.listing_id FROM (VALUES %s) AS v (listing_id, name)
+            JOIN amenities a ON a.name = v.name
+            ON CONFLICT DO NOTHING
+        ''', sorted(links), page_size=1000)
+
+    def _fetch_listings_by_id(self, cursor, ids):
+        """Load listings for the given ids as dictionaries"""
+        if not ids:
+            return []
+        cursor.execute(f"SELECT {LISTING_COLUMNS} FROM listings WHERE id = ANY(%s) ORDER BY id", (ids,))
+        return self._rows_to_listings(cursor, cursor.fetchall())
+
+    def get_listings_by_id(self, ids):
+        """Load listings for the given ids as dictionaries"""
+        try:
+            with self._connection() as conn:
+                return self._fetch_listings_by_id(conn.cursor(), list(ids))
+
+        except Exception as e:
+            self.logger.error(f"Error loading listings by id: {e}")
+            return []
+
+    def _rows_to_listings(self, cursor, rows):
+        """Convert result rows to listing dictionaries"""
+        return serialization.rows_to_listings((d[0] for d in cursor.description), rows)
+
+    def _search_filters(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                        sources=None):
+        """WHERE clause and parameters shared by search_listings and search_facets"""
+        query = " WHERE 1=1"
+        params = []
+
+        if near:
+            latitude, longitude, radius = near
+            # Indexed box lookup, then the exact distance on the survivors
+            clause, box_params = self._geo_box_clause(*radius_bounds(latitude, longitude, radius))
+            query += clause
+            params.extend(box_params)
+            query += f" AND {DISTANCE_SQL} <= %s"
+            params.extend([latitude, latitude, longitude, radius])
+
+        if bounds:
+            clause, box_params = self._geo_box_clause(*bounds)
+            query += clause
+            params.extend(box_params)
+
+        if location:
+            query += " AND address ILIKE %s"
+            params.append(f"%{location}%")
+
+        if min_price > 0:
+            query += " AND price >= %s"
+            params.append(min_price)
+
+        if max_price < 10000:
+            query += " AND price <= %s"
+            params.append(max_price)
+
+        if bedrooms and bedrooms.isdigit():
+            query += " AND bedrooms = %s"
+            params.append(int(bedrooms))
+
+        if min_bathrooms:
+            query += " AND bathrooms >= %s"
+            params.append(min_bathrooms)
+
+        if min_sqft:
+            query += " AND square_feet >= %s"
+            params.append(min_sqft)
+
+        if max_sqft:
+            query += " AND square_feet <= %s"
+            params.append(max_sqft)
+
+        if sources:
+            query += " AND source = ANY(%s)"
+            params.append(list(sources))
+
+        amenity_terms = [_normalize_amenity(term) for term in amenities or []]
+        amenity_terms = [term for term in amenity_terms if term]
+        if amenity_terms:
+            query += " AND id IN (" + " INTERSECT ".join(
+                "SELECT listing_id FROM listing_amenities WHERE amenity_id IN "
+                "(SELECT id FROM amenities WHERE name LIKE %s)"
+                for _ in amenity_terms
+            ) + ")"
+            params.extend(f"%{term}%" for term in amenity_terms)
+
+        return query, params
+
+    def search_listings(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                        sources=None, sort='newest'):
+        """Search for listings based on criteria
+
+        Same filters, sorts and semantics as DatabaseManager.search_listings;
+        the geographic filters use the GiST index on listing coordinates.
+        """
+        try:
+            query = f"SELECT {LISTING_COLUMNS} FROM listings"
+            params = []
+            if near:
+                query = f"SELECT {LISTING_COLUMNS}, {DISTANCE_SQL} AS distance_miles FROM listings"
+                params.extend([near[0], near[0], near[1]])
+
+            where, where_params = self._search_filters(
+                location, min_price, max_price, bedrooms, amenities, near, bounds,
+                min_bathrooms, min_sqft, max_sqft, sources
+            )
+            query += where + f" ORDER BY {SEARCH_SORTS[sort]} LIMIT 100"
+
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params + where_params)
+                return self._rows_to_listings(cursor, cursor.fetchall())
+
+        except Exception as e:
+            self.logger.error(f"Error searching listings: {e}")
+            return []
+
+    def search_facets(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                      near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                      sources=None):
+        """Counts by bedrooms, source and price bucket of every listing a search matches
+
+        Same result as DatabaseManager.search_facets, from one grouped pass.
+        """
+        try:
+            where, params = self._search_filters(
+                location, min_price, max_price, bedrooms, amenities, near, bounds,
+                min_bathrooms, min_sqft, max_sqft, sources
+            )
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"SELECT bedrooms, source, {PRICE_BUCKET_SQL} AS bucket, COUNT(*) FROM listings{where}"
+                    " GROUP BY bedrooms, source, bucket",
+                    params
+                )
+                return build_facets(cursor.fetchall())
+
+        except Exception as e:
+            self.logger.error(f"Error counting search facets: {e}")
+            return build_facets([])
+
+    def _geo_box_clause(self, south, north, west, east):
+        """SQL and parameters restricting listings to a map box"""
+        return (" AND latitude IS NOT NULL AND longitude IS NOT NULL"
+                " AND point(longitude, latitude) <@ box(point(%s, %s), point(%s, %s))",
+                [west, south, east, north])
+
+    def get_listing_keys(self, location):
+        """Every stored (source, address, price) whose address contains location"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT source, address, price FROM listings WHERE address ILIKE %s", (f"%{location}%",))
+                return set(cursor.fetchall())
+
+        except Exception as e:
+            self.logger.error(f"Error getting listing keys: {e}")
+            return set()
+
+    def get_all_listings(self, limit=100):
+        """Get all listings from database"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT {LISTING_COLUMNS} FROM listings ORDER BY created_at DESC LIMIT %s", (limit,))
+                return self._rows_to_listings(cursor, cursor.fetchall())
+
+        except Exception as e:
+            self.logger.error(f"Error getting all listings: {e}")
+            return []
+
+    def get_stats(self):
+        """Get platform statistics"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                stats = {}
+
+                cursor.execute("SELECT COUNT(*) FROM listings")
+                stats['total_listings'] = cursor.fetchone()[0]
+
+                cursor.execute("SELECT source, COUNT(*) FROM listings GROUP BY source")
+                stats['by_source'] = {source: count for source, count in cursor.fetchall()}
+
+                cursor.execute("SELECT AVG(price)::float8, MIN(price), MAX(price) FROM listings WHERE price > 0")
+                avg_price, min_price, max_price = cursor.fetchone()
+                stats['average_price'] = round(avg_price, 2) if avg_price else 0
+                stats['price_range'] = {'min': min_price or 0, 'max': max_price or 0}
+
+                cursor.execute(
+                    "SELECT bedrooms, COUNT(*) FROM listings WHERE bedrooms IS NOT NULL GROUP BY bedrooms ORDER BY bedrooms"
+                )
+                stats['bedroom_distribution'] = {str(beds): count for beds, count in cursor.fetchall()}
+
+                cursor.execute(
+                    "SELECT COUNT(*) FROM listings WHERE created_at > (now() AT TIME ZONE 'utc') - interval '1 day'"
+                )
+                stats['recent_listings'] = cursor.fetchone()[0]
+
+                cursor.execute('''
+                    SELECT split_part(address, ',', 1), COUNT(*) AS count
+                    FROM listings
+                    WHERE position(',' IN address) > 0
+                    GROUP BY 1
+                    ORDER BY count DESC
+                    LIMIT 10
+                ''')
+                stats['top_locations'] = {city: count for city, count in cursor.fetchall() if city}
+
+                return stats
+
+        except Exception as e:
+            self.logger.error(f"Error getting stats: {e}")
+            return {}
+
+    def clean_old_listings(self, days=30, batch_size=500):
+        """Remove listings older than specified days, one short transaction per batch"""
+        try:
+            deleted_count = 0
+            while True:
+                with self._connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        DELETE FROM listings WHERE id IN (
+                            SELECT id FROM listings
+                            WHERE created_at < (now() AT TIME ZONE 'utc') - make_interval(days => %s)
+                            ORDER BY created_at LIMIT %s
+                        )
+                        RETURNING id
+                    ''', (days, batch_size))
+                    deleted = [row[0] for row in cursor.fetchall()]
+                if deleted:
+                    self.events.notify({'type': 'write', 'count': len(deleted), 'deleted': deleted})
+                deleted_count += len(deleted)
+                if len(deleted) < batch_size:
+                    break
+
+            self.logger.info(f"Cleaned {deleted_count} old listings")
+            return deleted_count
+
+        except Exception as e:
+            self.logger.error(f"Error cleaning old listings: {e}")
+            return 0
+
+    def start_maintenance(self, days=30, interval=24 * 3600):
+        """Expire old listings once per interval; autovacuum reclaims the space"""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.clean_old_listings(days)
+
+        threading.Thread(target=loop, name='retention', daemon=True).start()
+        return stop
@@ -0,0 +1,233 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE = re.compile(r"\s+")
+
+# Statements EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# A plan step that reads every row of a table ("SCAN listings"); scans
+# "USING INDEX" walk an index in order and are not flagged
+_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?\w+$")
+
+
+def normalize_sql(sql):
+    """Shape of a statement: literals become ?, IN lists one ?, whitespace collapsed
+
+    Statements that differ only in their values share a shape, so
+    "... WHERE id IN (1, 2, 3)" and "... WHERE id IN (?, ?)" are counted
+    together.
+    """
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PARAM_LIST.sub('?', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """Calls, time and the query plan of one statement shape"""
+
+    __slots__ = ('shape', 'calls', 'total_ms', 'max_ms', 'slow_calls', 'plan')
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow_calls = 0
+        self.plan = None
+
+    def as_dict(self):
+        plan = self.plan or []
+        return {
+            'shape': self.shape,
+            'calls': self.calls,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'slow_calls': self.slow_calls,
+            'plan': plan,
+            'full_scan': any(_FULL_SCAN.match(step) for step in plan),
+            'temp_sort': any(step.startswith('USE TEMP B-TREE') for step in plan)
+        }
+
+
+class QueryProfiler:
+    """Timings and query plans of every statement run on profiled connections
+
+    Statements are grouped by normalize_sql() shape. The first time a
+    shape is seen its EXPLAIN QUERY PLAN is captured; after that only
+    timings are recorded, so the overhead per statement is a clock read
+    and a dict update. A statement's time covers its execute and every
+    fetch until the cursor is exhausted, re-executed or dropped. At most
+    max_shapes shapes are tracked; statements of further shapes are only
+    counted in dropped.
+    """
+
+    def __init__(self, slow_ms=50, max_shapes=500):
+        self.slow_ms = slow_ms
+        self.max_shapes = max_shapes
+        self.logger = logging.getLogger(__name__)
+        self.dropped = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+        # sqlite3.connect() factory whose connections report to this profiler
+        self.connection_factory = type('ProfiledConnection', (ProfiledConnection,), {'profiler': self})
+
+    def needs_plan(self, shape):
+        """Whether a newly seen shape should have its plan captured"""
+        with self._lock:
+            stats = self._stats.get(shape)
+            return stats is None and len(self._stats) < self.max_shapes
+
+    def set_plan(self, shape, plan):
+        with self._lock:
+            stats = self._stats.get(shape)
+            if stats is None:
+                if len(self._stats) >= self.max_shapes:
+                    return
+                stats = self._stats[shape] = QueryStats(shape)
+            if stats.plan is None:
+                stats.plan = plan
+
+    def record(self, shape, elapsed_ms):
+        """Add one statement's time to its shape"""
+        with self._lock:
+            stats = self._stats.get(shape)
+            if stats is None:
+                if len(self._stats) >= self.max_shapes:
+                    self.dropped += 1
+                    return
+                stats = self._stats[shape] = QueryStats(shape)
+            stats.calls += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            slow = elapsed_ms >= self.slow_ms
+            if slow:
+                stats.slow_calls += 1
+            first_slow = slow and stats.slow_calls == 1
+
+        if first_slow:
+            self.logger.warning(f"Slow query ({elapsed_ms:.1f}ms): {shape}")
+
+    def report(self, slow_only=False, limit=None):
+        """Shapes by total time, most expensive first"""
+        with self._lock:
+            queries = [stats.as_dict() for stats in self._stats.values()]
+        if slow_only:
+            queries = [query for query in queries if query['slow_calls']]
+        queries.sort(key=lambda query: query['total_ms'], reverse=True)
+        return {
+            'slow_ms': self.slow_ms,
+            'shapes': len(queries),
+            'dropped': self.dropped,
+            'queries': queries[:limit] if limit else queries
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.dropped = 0
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times its statements for the connection's profiler"""
+
+    _shape = None
+    _elapsed = 0.0
+
+    def _begin(self, sql, params):
+        self._finish()
+        profiler = self.connection.profiler
+        shape = normalize_sql(sql)
+        if shape.split(' ', 1)[0].upper() in _EXPLAINABLE and profiler.needs_plan(shape):
+            profiler.set_plan(shape, self._explain(sql, params))
+        self._shape = shape
+        self._elapsed = 0.0
+
+    def _explain(self, sql, params):
+        try:
+            rows = sqlite3.Cursor(self.connection).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            return [row[3] for row in rows]
+        except sqlite3.Error:
+            return []
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += (time.perf_counter() - started) * 1000
+
+    def _finish(self):
+        if self._shape is not None:
+            self.connection.profiler.record(self._shape, self._elapsed)
+            self._shape = None
+
+    def execute(self, sql, params=()):
+        self._begin(sql, params)
+        self._timed(super().execute, sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        # Only a list can be peeked at for EXPLAIN without consuming it
+        first = seq_of_params[0] if isinstance(seq_of_params, (list, tuple)) and seq_of_params else ()
+        self._begin(sql, first)
+        self._timed(super().executemany, sql, seq_of_params)
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors report to a QueryProfiler
+
+    Pass a profiler's connection_factory to sqlite3.connect() to get one
+    bound to that profiler.
+    """
+
+    profiler = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
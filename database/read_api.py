@@ -0,0 +1,95 @@
+"""
+Read endpoints shared by the Flask app and the ASGI app.
+
+Each function returns (payload, status) for the front end to encode with
+serialization.dumps_response(), so both serve the same query with the
+same response. Listings in a payload are EncodedListing rows. State that
+belongs to one process, like search demand or image thumbnails, is passed
+in by the caller.
+"""
+
+from database.db_manager import parse_amenity_filter, parse_geo_filter, parse_search_options
+
+
+def error(message, status):
+    """Failure payload in the shape every endpoint uses"""
+    return {'success': False, 'error': message}, status
+
+
+def search(cache, data, record_search=None, with_thumbnails=None):
+    """Search listings through a SearchCache
+
+    record_search is called with the location to count demand for it;
+    with_thumbnails decorates the listings returned.
+    """
+    location = data.get('location', '')
+    min_price = data.get('min_price', 0)
+    max_price = data.get('max_price', 10000)
+    bedrooms = data.get('bedrooms', '')
+    amenities = parse_amenity_filter(data.get('amenities'))
+
+    # Checked before counting demand, so bad input never reaches the scheduler
+    if not isinstance(location, str):
+        return error('Invalid search filter: location must be a string', 400)
+    if location and record_search:
+        record_search(location)
+
+    try:
+        near, bounds = parse_geo_filter(data)
+    except (KeyError, TypeError, ValueError) as e:
+        return error(f'Invalid location filter: {e}', 400)
+
+    try:
+        options = parse_search_options(data)
+    except (TypeError, ValueError) as e:
+        return error(f'Invalid search filter: {e}', 400)
+
+    try:
+        listings = cache.search(
+            location, min_price, max_price, bedrooms, amenities, near=near, bounds=bounds, **options
+        )
+        if with_thumbnails:
+            listings = with_thumbnails(listings)
+        response = {
+            'success': True,
+            'listings': listings,
+            'count': len(listings),
+            'sort': options['sort']
+        }
+        if data.get('facets'):
+            # Counts over every match, not just the listings returned
+            response['facets'] = cache.facets(
+                location, min_price, max_price, bedrooms, amenities, near=near, bounds=bounds, **options
+            )
+        return response, 200
+    except Exception as e:
+        return error(str(e), 500)
+
+
+def listings(db, with_thumbnails=None):
+    """Every listing in the database"""
+    try:
+        found = db.get_all_listings_encoded()
+        if with_thumbnails:
+            found = with_thumbnails(found)
+        return {
+            'success': True,
+            'listings': found,
+            'count': len(found)
+        }, 200
+    except Exception as e:
+        return error(str(e), 500)
+
+
+def stats(db, **sections):
+    """Platform statistics, plus one entry per keyword computed by calling its value"""
+    try:
+        response = {
+            'success': True,
+            'stats': db.get_stats()
+        }
+        for name, compute in sections.items():
+            response[name] = compute()
+        return response, 200
+    except Exception as e:
+        return error(str(e), 500)
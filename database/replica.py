@@ -0,0 +1,247 @@
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from database.db_manager import DatabaseManager, distance_miles
+from database.events import EventBus
+from database.storage import ListingStore
+
+
+class SnapshotReader(DatabaseManager):
+    """DatabaseManager over a published snapshot: immutable, memory-mapped, read-only
+
+    immutable=1 tells SQLite the file never changes while it is open, so
+    readers take no locks and never check for other writers. That holds
+    because a snapshot file is only ever replaced, never written in place.
+    """
+
+    def __init__(self, db_path, events=None, mmap_size=256 * 1024 * 1024):
+        super().__init__(db_path, events=events)
+        self.mmap_size = mmap_size
+
+    def connect(self):
+        uri = f"{pathlib.Path(self.db_path).resolve().as_uri()}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True)
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.create_function('distance_miles', 4, distance_miles, deterministic=True)
+        return conn
+
+    def data_version(self):
+        """Identity of the snapshot file, which changes when a new one is renamed into place
+
+        PRAGMA data_version would not: an immutable connection never
+        notices the file it opened being replaced.
+        """
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+
+class _PrimaryEvents(EventBus):
+    """Event bus of the primary: ingest events go straight out, write
+    notifications wait until a snapshot containing the write is live"""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def has_subscribers(self):
+        return self.store.events.has_subscribers()
+
+    def publish(self, event):
+        self.store.events.publish(event)
+
+    def notify(self, event):
+        self.store._written(event)
+
+
+class ReplicatedDatabaseManager(ListingStore):
+    """SQLite store that serves reads from a snapshot of the primary database
+
+    Writes (saves and retention) commit to the primary file, which is kept
+    in WAL mode so the copy reads alongside ingest commits instead of
+    blocking them. After each write, once min_interval has passed since
+    the last snapshot, a background thread copies the primary with the
+    SQLite backup API into a temporary file and renames it over
+    snapshot_path. The rename is atomic: a reader opens either the old
+    snapshot or the new one, and connections already open keep reading the
+    old file until they close. Writes made by other processes (bulk
+    imports) are picked up within interval seconds.
+
+    Reads never touch the primary, so they do not wait on ingest
+    transactions; in exchange they lag writes by about min_interval plus
+    the copy time. Every snapshot is a full copy, so min_interval also
+    bounds the copy I/O under steady ingest. Write notifications are held back and sent once the
+    snapshot with those writes is in place, so caches refresh against data
+    they can actually read.
+    """
+
+    dialect = 'sqlite'
+
+    def __init__(self, db_path="rental_listings.db", snapshot_path=None, events=None,
+                 min_interval=5.0, interval=60.0, mmap_size=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path or f"{os.path.splitext(db_path)[0]}.snapshot.db"
+        self.min_interval = min_interval
+        self.interval = interval
+        self.logger = logging.getLogger(__name__)
+        self.events = events or EventBus()
+        self.primary = DatabaseManager(db_path, events=_PrimaryEvents(self))
+        self.replica = SnapshotReader(self.snapshot_path, events=self.events, mmap_size=mmap_size)
+        self.generation = 0
+        self.published_at = None
+        self.publish_seconds = None
+        self._published_version = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_database(self):
+        """Bring the primary up to date, publish a first snapshot and start publishing"""
+        self.primary.init_database()
+        conn = self.primary.connect()
+        try:
+            # Persistent in the file; lets the snapshot copy run beside commits
+            conn.execute("PRAGMA journal_mode = WAL")
+        finally:
+            conn.close()
+        self.publish()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='snapshot-publisher', daemon=True)
+            self._thread.start()
+
+    def _written(self, event):
+        with self._lock:
+            self._pending.append(event)
+        self._dirty.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._dirty.wait(self.interval) and self.primary.data_version() == self._published_version:
+                continue
+            # Let a burst of writes settle into one snapshot
+            if self._stop.wait(max((self.published_at or 0) + self.min_interval - time.time(), 0)):
+                return
+            try:
+                self.publish()
+            except Exception as e:
+                self.logger.error(f"Error publishing read snapshot: {e}")
+                self._stop.wait(self.min_interval)
+
+    def publish(self):
+        """Copy the primary to a new snapshot and swap it in; returns the generation"""
+        with self._publish_lock:
+            self._dirty.clear()
+            with self._lock:
+                # Writes notified so far are committed, so the copy includes them
+                events, self._pending = self._pending, []
+            version = self.primary.data_version()
+
+            started = time.perf_counter()
+            temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            source = sqlite3.connect(self.db_path)
+            target = sqlite3.connect(temp_path)
+            try:
+                self._copy(source, target)
+                # A snapshot is opened immutable and must not expect a WAL file
+                target.execute("PRAGMA journal_mode = DELETE")
+            except Exception:
+                target.close()
+                os.remove(temp_path)
+                with self._lock:
+                    self._pending[:0] = events
+                raise
+            finally:
+                source.close()
+            target.close()
+            os.replace(temp_path, self.snapshot_path)
+
+            self.generation += 1
+            self.published_at = time.time()
+            self.publish_seconds = time.perf_counter() - started
+            self._published_version = version
+            generation = self.generation
+
+        self.logger.info(f"Published read snapshot {generation} in {self.publish_seconds:.2f}s")
+        for event in events:
+            self.events.notify(event)
+        return generation
+
+    def _copy(self, source, target):
+        # One step: a stepped copy restarts whenever ingest writes mid-copy
+        source.backup(target)
+
+    def data_version(self):
+        """The snapshot generation, so caches drop results when a new one is live"""
+        return self.generation
+
+    def snapshot_stats(self):
+        return {
+            'generation': self.generation,
+            'published_at': self.published_at,
+            'publish_seconds': round(self.publish_seconds, 3) if self.publish_seconds is not None else None,
+            'pending_writes': len(self._pending),
+            'bytes': os.path.getsize(self.snapshot_path) if os.path.exists(self.snapshot_path) else 0
+        }
+
+    def connect(self):
+        """Read-only connection to the current snapshot"""
+        return self.replica.connect()
+
+    def close(self):
+        """Stop the snapshot publisher and close the stores"""
+        self._stop.set()
+        self._dirty.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.primary.close()
+        self.replica.close()
+
+    def save_listings(self, listings):
+        return self.primary.save_listings(listings)
+
+    def search_listings(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, **options):
+        return self.replica.search_listings(location, min_price, max_price, bedrooms, amenities,
+                                            near=near, bounds=bounds, **options)
+
+    def search_facets(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                      near=None, bounds=None, **filters):
+        return self.replica.search_facets(location, min_price, max_price, bedrooms, amenities,
+                                          near=near, bounds=bounds, **filters)
+
+    def search_listings_encoded(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                                near=None, bounds=None, **options):
+        return self.replica.search_listings_encoded(location, min_price, max_price, bedrooms, amenities,
+                                                    near=near, bounds=bounds, **options)
+
+    def get_all_listings(self, limit=100):
+        return self.replica.get_all_listings(limit)
+
+    def get_all_listings_encoded(self, limit=100):
+        return self.replica.get_all_listings_encoded(limit)
+
+    def get_listing_keys(self, location):
+        return self.replica.get_listing_keys(location)
+
+    def get_listings_by_id(self, ids):
+        return self.replica.get_listings_by_id(ids)
+
+    def get_stats(self):
+        stats = self.replica.get_stats()
+        stats['snapshot'] = self.snapshot_stats()
+        return stats
+
+    def clean_old_listings(self, days=30):
+        return self.primary.clean_old_listings(days)
+
+    def start_maintenance(self, days=30):
+        return self.primary.start_maintenance(days)
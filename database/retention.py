@@ -0,0 +1,193 @@
+import gzip
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from database import serialization
+
+
+class RetentionWorker:
+    """Deletes expired listings in small batches and compacts the database
+
+    Each batch is its own short write transaction followed by a pause, so
+    readers and scrapers never wait long on the write lock. Expired rows are
+    copied to the listings_archive table (archive='table'), appended to a
+    gzipped NDJSON file (archive=<path>), or dropped (archive=None).
+    Compaction (incremental vacuum and PRAGMA optimize) only runs inside
+    quiet_hours, a (start_hour, end_hour) range in local time.
+    """
+
+    def __init__(self, db, days=30, batch_size=500, pause=0.05, archive='table',
+                 quiet_hours=(2, 5), vacuum_step_pages=1000):
+        self.db = db
+        self.days = days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archive = archive
+        self.quiet_hours = quiet_hours
+        self.vacuum_step_pages = vacuum_step_pages
+        self.logger = logging.getLogger(__name__)
+        self.last_report = None
+        self._last_maintenance = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def purge_expired(self):
+        """Delete (and archive) listings older than the retention window
+
+        Returns the number of listings removed.
+        """
+        # created_at is stored by SQLite as UTC text
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.days)).strftime('%Y-%m-%d %H:%M:%S')
+        deleted = 0
+
+        conn = self.db.connect()
+        try:
+            cursor = conn.cursor()
+            columns = self._listing_columns(cursor)
+            if self.archive == 'table':
+                self._ensure_archive_table(cursor, columns)
+                conn.commit()
+
+            while not self._stop.is_set():
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor.execute(
+                        "SELECT id FROM listings WHERE created_at < ? ORDER BY created_at LIMIT ?",
+                        (cutoff, self.batch_size)
+                    )
+                    ids = [row[0] for row in cursor.fetchall()]
+                    if not ids:
+                        conn.rollback()
+                        break
+
+                    placeholders = ', '.join('?' * len(ids))
+                    if self.archive == 'table':
+                        column_list = ', '.join(columns)
+                        cursor.execute(f'''
+                            INSERT OR REPLACE INTO listings_archive ({column_list}, archived_at)
+                            SELECT {column_list}, CURRENT_TIMESTAMP FROM listings WHERE id IN ({placeholders})
+                        ''', ids)
+                    elif self.archive:
+                        self._archive_to_file(cursor, columns, placeholders, ids)
+
+                    cursor.execute(f"DELETE FROM listings WHERE id IN ({placeholders})", ids)
+                    deleted += cursor.rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+                self.db.events.notify({'type': 'write', 'count': len(ids), 'deleted': ids})
+
+                # Let readers and other writers in between batches
+                time.sleep(self.pause)
+        finally:
+            conn.close()
+
+        self.logger.info(f"Retention removed {deleted} listings older than {self.days} days")
+        return deleted
+
+    def compact(self):
+        """Return free pages to the filesystem and refresh planner statistics
+
+        Returns the number of bytes reclaimed.
+        """
+        conn = self.db.connect()
+        try:
+            cursor = conn.cursor()
+            page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+            pages_before = cursor.execute("PRAGMA page_count").fetchone()[0]
+            auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+            if auto_vacuum == 2:
+                # Incremental mode: free a few pages at a time between pauses
+                while not self._stop.is_set() and cursor.execute("PRAGMA freelist_count").fetchone()[0]:
+                    cursor.execute(f"PRAGMA incremental_vacuum({self.vacuum_step_pages})").fetchall()
+                    time.sleep(self.pause)
+            elif cursor.execute("PRAGMA freelist_count").fetchone()[0]:
+                # Databases created before incremental mode need one full
+                # VACUUM to switch over; quiet hours are the time for it
+                self.logger.info("Converting database to incremental auto-vacuum")
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")
+
+            cursor.execute("PRAGMA optimize")
+            pages_after = cursor.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            conn.close()
+
+        reclaimed = (pages_before - pages_after) * page_size
+        self.logger.info(f"Compaction reclaimed {reclaimed} bytes")
+        return reclaimed
+
+    def in_quiet_hours(self, now=None):
+        """Whether the local time falls inside the quiet-hours window"""
+        if not self.quiet_hours:
+            return True
+        hour = (now or datetime.now()).hour
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def run_once(self, now=None):
+        """Purge, and compact when in quiet hours; returns a report dict"""
+        started = time.perf_counter()
+        report = {'deleted': self.purge_expired(), 'reclaimed_bytes': 0, 'compacted': False}
+
+        # Compact at most once per quiet-hours window
+        if self.in_quiet_hours(now) and time.time() - self._last_maintenance > 12 * 3600:
+            report['reclaimed_bytes'] = self.compact()
+            report['compacted'] = True
+            self._last_maintenance = time.time()
+
+        report['duration_seconds'] = round(time.perf_counter() - started, 3)
+        self.last_report = report
+        return report
+
+    def start(self, interval=3600):
+        """Run the worker in a background thread every interval seconds"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    self.logger.error(f"Error in retention worker: {e}")
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='retention', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Ask the background thread to finish after its current batch"""
+        self._stop.set()
+
+    def _listing_columns(self, cursor):
+        cursor.execute("PRAGMA table_info(listings)")
+        return [row[1] for row in cursor.fetchall()]
+
+    def _ensure_archive_table(self, cursor, columns):
+        """Create listings_archive, adding any columns listings has gained"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS listings_archive (
+                id INTEGER PRIMARY KEY,
+                archived_at TIMESTAMP
+            )
+        ''')
+        cursor.execute("PRAGMA table_info(listings_archive)")
+        existing = {row[1] for row in cursor.fetchall()}
+        for column in columns:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE listings_archive ADD COLUMN {column}")
+
+    def _archive_to_file(self, cursor, columns, placeholders, ids):
+        """Append the given listings to a gzipped NDJSON archive file"""
+        select = serialization.json_object_sql(columns)
+        cursor.execute(f"SELECT {select} FROM listings WHERE id IN ({placeholders})", ids)
+        lines = ''.join(row[0] + '\n' for row in cursor.fetchall())
+        # Each append is a separate gzip member; readers see one stream
+        with gzip.open(self.archive, 'ab') as archive:
+            archive.write(lines.encode('utf-8'))
@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from database import serialization
+from database.db_manager import _normalize_amenity
+
+
+class SearchCache:
+    """Search results cached until the next write to the listings
+
+    Any write (a save or an expiry) empties the cache through the store's
+    event bus. Writes that bypass it, from another worker process or a
+    bulk import, are caught by the store's data_version(): each entry
+    remembers the version it was computed at and is dropped once that
+    changes. Backends without one rely on entries expiring after ttl
+    seconds. A warming thread then recomputes the plain location searches
+    for the most-demanded locations, so the common dashboard query is
+    served from memory even right after an ingest. Misses are answered by
+    index (a ListingIndex) when one is given, else by the database.
+    """
+
+    def __init__(self, db, max_entries=512, debounce=1.0, index=None, ttl=60):
+        self.db = db
+        self.index = index
+        self.max_entries = max_entries
+        self.debounce = debounce
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._written = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        db.events.add_listener(self._on_write)
+
+    def _on_write(self, event):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+        self._written.set()
+
+    def _key(self, location, min_price, max_price, bedrooms, amenities, options=None):
+        terms = tuple(sorted({_normalize_amenity(term) for term in amenities or []} - {''}))
+        # Defaults and their absence are the same search
+        refinements = tuple(sorted(
+            (name, tuple(sorted(value)) if isinstance(value, list) else value)
+            for name, value in (options or {}).items()
+            if value and not (name == 'sort' and value == 'newest')
+        ))
+        return (location.strip().lower(), min_price, max_price, bedrooms, terms, refinements)
+
+    def _lookup(self, key, version):
+        """Cached value for key if still current, else None; call with the lock held"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != version or time.monotonic() - entry[1] > self.ttl:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _cached(self, key, compute):
+        """Cached value for key, computed and stored on a miss"""
+        version = self.db.data_version()
+        with self._lock:
+            generation = self._generation
+            entry = self._lookup(key, version)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        stored_at = time.monotonic()
+        value = compute()
+
+        with self._lock:
+            # A write during the query means these results may already be
+            # stale; one from another process shows up as a new version
+            if generation == self._generation:
+                self._entries[key] = (version, stored_at, value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def search(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+               near=None, bounds=None, **options):
+        """search_listings_encoded, answered from the cache when possible
+
+        options are search_listings' bathroom, size and source filters and
+        sort. Entries hold the encoded rows, so a hit costs no encoding.
+        """
+        if near or bounds:
+            # Map searches rarely repeat exactly; caching them would only evict useful entries
+            return self.db.search_listings_encoded(location, min_price, max_price, bedrooms, amenities,
+                                                   near=near, bounds=bounds, **options)
+
+        def compute():
+            if self.index is None:
+                return self.db.search_listings_encoded(location, min_price, max_price, bedrooms, amenities, **options)
+            return serialization.encode_listings(
+                self.index.search_listings(location, min_price, max_price, bedrooms, amenities, **options)
+            )
+
+        return self._cached(self._key(location, min_price, max_price, bedrooms, amenities, options), compute)
+
+    def facets(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+               near=None, bounds=None, **filters):
+        """search_facets, answered from the cache when possible"""
+        if near or bounds:
+            return self.db.search_facets(location, min_price, max_price, bedrooms, amenities,
+                                         near=near, bounds=bounds, **filters)
+
+        filters.pop('sort', None)
+        key = ('facets',) + self._key(location, min_price, max_price, bedrooms, amenities, filters)
+        return self._cached(
+            key, lambda: self.db.search_facets(location, min_price, max_price, bedrooms, amenities, **filters)
+        )
+
+    def warm(self, locations):
+        """Precompute the plain search for each location; returns how many were computed"""
+        warmed = 0
+        version = self.db.data_version()
+        for location in locations:
+            with self._lock:
+                cached = self._lookup(self._key(location, 0, 10000, '', None), version) is not None
+            if not cached:
+                self.search(location)
+                warmed += 1
+        return warmed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'index': self.index.stats() if self.index else None
+            }
+
+    def start_warming(self, top_locations):
+        """Re-warm top_locations() in a background thread after every write
+
+        Writes arriving within debounce seconds of each other are warmed once.
+        """
+        def loop():
+            while not self._stop.is_set():
+                if not self._written.wait(timeout=1):
+                    continue
+                time.sleep(self.debounce)
+                self._written.clear()
+                try:
+                    started = time.perf_counter()
+                    warmed = self.warm(top_locations())
+                    self.logger.info(
+                        f"Warmed {warmed} searches in {(time.perf_counter() - started) * 1000:.1f}ms"
+                    )
+                except Exception as e:
+                    self.logger.error(f"Error warming search cache: {e}")
+
+        self._stop.clear()
+        # Warm once at startup as well
+        self._written.set()
+        self._thread = threading.Thread(target=loop, name='cache-warmer', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,102 @@
+import json
+from collections import namedtuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    """Encode obj as compact UTF-8 JSON bytes with the fastest available encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Decode JSON text or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class EncodedListing(namedtuple('EncodedListing', 'image_url json')):
+    """A listing already encoded as JSON object text, with its image URL for thumbnails"""
+
+    __slots__ = ()
+
+    def extended(self, **fields):
+        """Copy with fields added to the JSON object"""
+        return self._replace(json=self.json[:-1] + ',' + dumps(fields)[1:].decode('utf-8'))
+
+
+def encode_listings(listings):
+    """EncodedListing rows for listing dictionaries"""
+    return [EncodedListing(listing.get('image_url'), dumps(listing).decode('utf-8')) for listing in listings]
+
+
+def dumps_response(payload):
+    """dumps() for an API payload whose 'listings' may be EncodedListing rows
+
+    Their JSON is written into the body as it is, so listings that left
+    SQLite as JSON text are never decoded or encoded again.
+    """
+    listings = payload.get('listings')
+    if not listings or not isinstance(listings[0], EncodedListing):
+        return dumps(payload)
+    rest = dumps({key: value for key, value in payload.items() if key != 'listings'})
+    return b''.join((
+        b'{"listings":[', ','.join(listing.json for listing in listings).encode('utf-8'), b']',
+        b',' + rest[1:] if len(rest) > 2 else b'}'
+    ))
+
+
+def rows_to_listings(columns, rows):
+    """Convert plain result tuples to listing dictionaries"""
+    columns = tuple(columns)
+    amenities_index = columns.index('amenities') if 'amenities' in columns else None
+    listings = []
+
+    for row in rows:
+        listing = dict(zip(columns, row))
+
+        # Amenities are stored as JSON text; most rows have none
+        if amenities_index is not None and row[amenities_index]:
+            try:
+                listing['amenities'] = loads(row[amenities_index])
+            except (TypeError, ValueError):
+                listing['amenities'] = []
+
+        listings.append(listing)
+
+    return listings
+
+
+# A real that needs more than 15 significant digits to read back as the
+# same float, written with 17 (x - x is NULL for infinities)
+_PRECISE_SQL = ("CASE WHEN typeof({0}) = 'real' AND {0} - {0} = 0 AND CAST(printf('%.15g', {0}) AS REAL) <> {0}"
+             " THEN json(printf('%!.17g', {0})) ELSE {0} END")
+
+
+def json_object_sql(columns, precise=()):
+    """SQLite expression encoding a row as rows_to_listings() and dumps() would
+
+    Lets SQLite emit each listing's JSON text itself, so a query that is
+    only written out (bulk export, API responses) never builds Python
+    objects per row. Amenities are embedded as JSON, and unreadable ones
+    become []. SQLite writes reals with 15 significant digits, which keeps
+    the short decimals listings store exact; columns named in precise,
+    such as computed distances, get all 17 where they need them.
+    """
+    values = []
+    for column in columns:
+        if column == 'amenities':
+            expression = ("CASE WHEN amenities IS NULL OR amenities = '' THEN amenities"
+                          " WHEN json_valid(amenities) THEN json(amenities) ELSE json('[]') END")
+        elif column in precise:
+            expression = _PRECISE_SQL.format(column)
+        else:
+            expression = column
+        values.append(f"'{column}', {expression}")
+    return f"json_object({', '.join(values)})"
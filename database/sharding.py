@@ -0,0 +1,383 @@
+import glob
+import logging
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from database.db_manager import DatabaseManager, build_facets, extract_city, merge_facets, sort_listings
+from database.events import EventBus
+from database.storage import ListingStore
+
+# Each shard hands out ids from its own block so merged results never collide;
+# 2**32 ids per shard keeps every id below 2**53 for JavaScript clients
+SHARD_ID_BITS = 32
+
+# SQLite's default limit on databases attached to one connection
+MAX_ATTACHED = 10
+
+_SHARD_NAME = re.compile(r'[a-z0-9_-]+')
+
+# Columns of an empty store's combined view
+LISTING_COLUMNS = (
+    'id', 'source', 'title', 'address', 'price', 'price_max', 'bedrooms', 'bathrooms',
+    'square_feet', 'url', 'image_url', 'amenities', 'phone', 'description', 'latitude',
+    'longitude', 'city', 'scraped_at', 'created_at'
+)
+
+class _ShardEvents(EventBus):
+    """Event bus of the shards: write notifications go straight out, ingest
+    events are collected so each save publishes one event for all the
+    shards it wrote to"""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def has_subscribers(self):
+        return self.store.events.has_subscribers()
+
+    def notify(self, event):
+        self.store.events.notify(event)
+
+    def publish(self, event):
+        self.store._collect(event)
+
+
+class ShardedDatabaseManager(ListingStore):
+    """SQLite storage split into one database file per metro or region
+
+    Listings are routed by the city in their address: cities listed in
+    metros go to that metro's shard, everything else to a shard for its
+    state ("tx.db"), or "other.db" when the address has no state. Writes for
+    different shards run in parallel, searches fan out to every shard (or
+    just those of a "City, ST" location's state) and merge the results.
+    """
+
+    dialect = 'sqlite'
+
+    def __init__(self, directory, metros=None, events=None, max_workers=8):
+        self.directory = directory
+        self.metros = {city: name.lower() for city, name in (metros or {}).items()}
+        self.logger = logging.getLogger(__name__)
+        self.events = events or EventBus()
+        self._shard_events = _ShardEvents(self)
+        self._shards = {}
+        self._priced = {}
+        # Ingest events of the shard save running on this thread
+        self._collected = threading.local()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard')
+
+        for name in self.metros.values():
+            if not _SHARD_NAME.fullmatch(name):
+                raise ValueError(f"Invalid shard name: {name!r}")
+
+    def shard_name(self, address):
+        """Name of the shard a listing with this address belongs to"""
+        city = extract_city(address)
+        if city in self.metros:
+            return self.metros[city]
+        if city and ', ' in city:
+            return city.rsplit(', ', 1)[1].lower()
+        return 'other'
+
+    def partitions(self):
+        """Every shard, in name order"""
+        return [shard for _, shard in sorted(self.shards().items())]
+
+    def shards(self):
+        """Every shard in the directory, by name"""
+        with self._lock:
+            self._discover()
+            return dict(self._shards)
+
+    def _discover(self):
+        """Pick up shard files created since the last look (lock held)"""
+        for path in glob.glob(os.path.join(self.directory, '*.db')):
+            name = os.path.basename(path)[:-3]
+            if name not in self._shards and _SHARD_NAME.fullmatch(name):
+                self._shards[name] = DatabaseManager(path, events=self._shard_events)
+
+    def _shard(self, name):
+        """Open a shard, creating its database on first use"""
+        with self._lock:
+            self._discover()
+            if name in self._shards:
+                return self._shards[name]
+
+            path = os.path.join(self.directory, f'{name}.db')
+            shard = DatabaseManager(path, events=self._shard_events)
+            shard.init_database()
+            self._assign_id_block(shard)
+            self._shards[name] = shard
+            return shard
+
+    def _assign_id_block(self, shard):
+        """Start a new shard's listing ids in a block no other shard uses"""
+        conn = shard.connect()
+        try:
+            cursor = conn.cursor()
+            if cursor.execute("PRAGMA user_version").fetchone()[0]:
+                return
+
+            # user_version holds the shard's block number; pick the next free one
+            used = [0]
+            for other in self._shards.values():
+                other_conn = other.connect()
+                used.append(other_conn.execute("PRAGMA user_version").fetchone()[0])
+                other_conn.close()
+            block = max(used) + 1
+
+            cursor.execute(f"PRAGMA user_version = {block}")
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'listings'")
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'listings', MAX(?, IFNULL(MAX(id), 0)) FROM listings",
+                (block << SHARD_ID_BITS,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _fan_out(self, shards, method, *args, **kwargs):
+        """Call a method on each shard in parallel, returning the results"""
+        return list(self._executor.map(lambda shard: getattr(shard, method)(*args, **kwargs), shards))
+
+    def init_database(self):
+        """Create the shard directory and bring existing shards up to date"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._fan_out(self.shards().values(), 'init_database')
+            self.logger.info(f"Sharded database initialized in {self.directory}")
+        except Exception as e:
+            self.logger.error(f"Error initializing sharded database: {e}")
+
+    def connect(self):
+        """Read-only connection exposing every shard as one `listings` view
+
+        Limited to SQLite's ten attached databases; whole-table readers
+        (bulk export, analytics, the listing index) go through partitions()
+        instead, so they work with any number of shards.
+        """
+        shards = self.shards()
+        if len(shards) > MAX_ATTACHED:
+            raise RuntimeError(f"Cannot combine more than {MAX_ATTACHED} shards in one connection")
+
+        conn = sqlite3.connect(':memory:', uri=True)
+        columns = ', '.join(LISTING_COLUMNS)
+        selects = []
+        for index, (name, shard) in enumerate(sorted(shards.items())):
+            uri = 'file:' + urllib.parse.quote(os.path.abspath(shard.db_path)) + '?mode=ro'
+            conn.execute(f"ATTACH DATABASE ? AS shard_{index}", (uri,))
+            # Select by name: migrated shards may order their columns differently
+            selects.append(f"SELECT {columns} FROM shard_{index}.listings")
+
+        if not selects:
+            selects.append(f"SELECT {', '.join(f'NULL AS {column}' for column in LISTING_COLUMNS)} WHERE 0")
+        conn.execute(f"CREATE TEMP VIEW listings AS {' UNION ALL '.join(selects)}")
+        return conn
+
+    def data_version(self):
+        """Every shard's data_version, in name order"""
+        return tuple(shard.data_version() for shard in self.partitions())
+
+    def close(self):
+        """Shut down the fan-out pool and the shards"""
+        self._executor.shutdown(wait=False)
+        for shard in self.partitions():
+            shard.close()
+
+    def save_listings(self, listings):
+        """Save listings, writing each shard's share in parallel"""
+        if not listings:
+            return 0
+
+        try:
+            batches = {}
+            for listing in listings:
+                batches.setdefault(self.shard_name(listing.get('address')), []).append(listing)
+
+            shards = [self._shard(name) for name in batches]
+            if not self.events.has_subscribers():
+                return sum(self._executor.map(lambda shard, batch: shard.save_listings(batch), shards, batches.values()))
+
+            # Each shard reports its new and changed listings with the stats
+            # delta of its own save; those add up, except for the average
+            # price, which is recomputed from every shard's priced totals
+            average_before = self._average_price()
+            results = list(self._executor.map(self._save_collecting, shards, batches.values()))
+            events = [event for _, shard_events in results for event in shard_events]
+            if events:
+                delta = {
+                    key: sum(event['stats_delta'][key] for event in events)
+                    for key in ('total_listings', 'recent_listings')
+                }
+                delta['average_price'] = round(self._average_price() - average_before, 2)
+                by_source = sum((Counter(event['stats_delta']['by_source']) for event in events), Counter())
+                delta['by_source'] = {source: change for source, change in by_source.items() if change}
+                self.events.publish({
+                    'type': 'ingest',
+                    'new': [listing for event in events for listing in event['new']],
+                    'changed': [listing for event in events for listing in event['changed']],
+                    'stats_delta': delta
+                })
+            return sum(saved for saved, _ in results)
+
+        except Exception as e:
+            self.logger.error(f"Error saving listings to shards: {e}")
+            return 0
+
+    def _save_collecting(self, shard, batch):
+        """Save a batch to a shard; returns (saved, the shard's ingest events)"""
+        self._collected.events = []
+        try:
+            return shard.save_listings(batch), self._collected.events
+        finally:
+            self._collected.events = None
+
+    def _collect(self, event):
+        """Hold a shard's ingest event for the save running on this thread"""
+        events = getattr(self._collected, 'events', None)
+        if events is not None:
+            events.append(event)
+        else:
+            self.events.publish(event)
+
+    def _search_shards(self, location):
+        """Shards a search for location has to visit
+
+        Locations match addresses as substrings, so "Chicago, IL" also finds
+        "North Chicago, IL", which may sit in another shard than Chicago's
+        metro. A "City, ST" search visits every shard that can hold an
+        address in that state: the state's, its metros' and "other", where
+        addresses whose state could not be read end up.
+        """
+        shards = self.shards()
+        city = extract_city(location)
+        if city and ', ' in city:
+            state = city.rsplit(', ', 1)[1]
+            names = {state.lower(), 'other'} | {
+                name for metro, name in self.metros.items() if metro.rsplit(', ', 1)[-1].upper() == state
+            }
+            shards = {name: shard for name, shard in shards.items() if name in names}
+        return shards
+
+    def search_listings(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, sort='newest', **filters):
+        """Search every relevant shard in parallel and merge the first results in sort order"""
+        try:
+            results = self._fan_out(
+                self._search_shards(location).values(), 'search_listings', location, min_price, max_price,
+                bedrooms, amenities, near, bounds, sort=sort, **filters
+            )
+            return sort_listings([listing for listings in results for listing in listings], sort)[:100]
+
+        except Exception as e:
+            self.logger.error(f"Error searching shards: {e}")
+            return []
+
+    def search_facets(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                      near=None, bounds=None, **filters):
+        """Facet counts of a search, added up across the relevant shards"""
+        try:
+            return merge_facets(self._fan_out(
+                self._search_shards(location).values(), 'search_facets', location, min_price, max_price,
+                bedrooms, amenities, near, bounds, **filters
+            ))
+
+        except Exception as e:
+            self.logger.error(f"Error counting facets across shards: {e}")
+            return build_facets([])
+
+    def get_all_listings(self, limit=100):
+        """Get the newest listings across all shards"""
+        try:
+            results = self._fan_out(self.shards().values(), 'get_all_listings', limit)
+            return self._newest([listing for listings in results for listing in listings], limit)
+
+        except Exception as e:
+            self.logger.error(f"Error getting all listings from shards: {e}")
+            return []
+
+    def get_listing_keys(self, location):
+        """Every stored (source, address, price) matching location, from the shards that can hold it"""
+        return set().union(*self._fan_out(self._search_shards(location).values(), 'get_listing_keys', location))
+
+    def get_listings_by_id(self, ids):
+        """Load listings for the given ids from whichever shards hold them"""
+        ids = list(ids)
+        results = self._fan_out(self.shards().values(), 'get_listings_by_id', ids)
+        return sorted((listing for listings in results for listing in listings), key=lambda listing: listing['id'])
+
+    def _newest(self, listings, limit):
+        listings.sort(key=lambda listing: listing.get('created_at') or '', reverse=True)
+        return listings[:limit]
+
+    def get_stats(self):
+        """Platform statistics aggregated across shards"""
+        try:
+            shards = self.shards()
+            parts = dict(zip(shards, self._fan_out(shards.values(), 'get_stats')))
+            stats_list = [part for part in parts.values() if part]
+
+            stats = {
+                'total_listings': sum(part['total_listings'] for part in stats_list),
+                'by_source': dict(sum((Counter(part['by_source']) for part in stats_list), Counter())),
+                'recent_listings': sum(part['recent_listings'] for part in stats_list)
+            }
+
+            stats['average_price'] = self._average_price(shards.values())
+
+            ranges = [part['price_range'] for part in stats_list if part['price_range']['max']]
+            stats['price_range'] = {
+                'min': min((price_range['min'] for price_range in ranges), default=0),
+                'max': max((price_range['max'] for price_range in ranges), default=0)
+            }
+
+            bedrooms = sum((Counter(part['bedroom_distribution']) for part in stats_list), Counter())
+            stats['bedroom_distribution'] = {
+                beds: bedrooms[beds] for beds in sorted(bedrooms, key=lambda beds: (len(beds), beds))
+            }
+
+            locations = sum((Counter(part['top_locations']) for part in stats_list), Counter())
+            stats['top_locations'] = dict(locations.most_common(10))
+
+            stats['shards'] = {name: part.get('total_listings', 0) for name, part in parts.items()}
+            return stats
+
+        except Exception as e:
+            self.logger.error(f"Error getting stats from shards: {e}")
+            return {}
+
+    def _average_price(self, shards=None):
+        """Average positive price across shards, weighting each by its number of priced listings"""
+        priced = list(self._executor.map(self._priced_totals, self.partitions() if shards is None else shards))
+        count = sum(count for count, _ in priced)
+        return round(sum(total for _, total in priced) / count, 2) if count else 0
+
+    def _priced_totals(self, shard):
+        """(count, sum) of a shard's positive prices, remembered until the shard changes"""
+        version = shard.data_version()
+        with self._lock:
+            cached = self._priced.get(shard.db_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        conn = shard.connect()
+        try:
+            count, total = conn.execute("SELECT COUNT(price), SUM(price) FROM listings WHERE price > 0").fetchone()
+        finally:
+            conn.close()
+        with self._lock:
+            self._priced[shard.db_path] = (version, (count, total or 0))
+        return count, total or 0
+
+    def clean_old_listings(self, days=30):
+        """Remove listings older than specified days from every shard"""
+        return sum(self._fan_out(self.shards().values(), 'clean_old_listings', days))
+
+    def start_maintenance(self, days=30):
+        """Run retention and compaction on every shard"""
+        return [shard.start_maintenance(days) for shard in self.shards().values()]
@@ -0,0 +1,125 @@
+import os
+from abc import ABC, abstractmethod
+from database import serialization
+
+
+class ListingStore(ABC):
+    """Interface shared by the listing storage backends
+
+    DatabaseManager implements it on SQLite and PostgresDatabaseManager on
+    PostgreSQL; use open_database() to pick one from a path or URL. Every
+    backend also exposes an `events` EventBus: save_listings publishes
+    ingest events to it, and every write notifies its listeners with a
+    {'type': 'write', 'count', 'ids' (saved), 'deleted'} event.
+    """
+
+    # Short backend name ('sqlite' or 'postgresql') for the few callers that
+    # issue their own SQL
+    dialect = None
+
+    # Column list for "SELECT ... FROM listings" that yields the same
+    # columns and value types on every backend
+    select_columns = '*'
+
+    @abstractmethod
+    def init_database(self):
+        """Create tables and indexes if they do not exist"""
+
+    @abstractmethod
+    def connect(self):
+        """Open a new DB-API connection; the caller closes it"""
+
+    def partitions(self):
+        """Stores that together hold every listing, for readers of the whole table
+
+        A single database is its own only partition; a sharded store
+        returns its shards.
+        """
+        return [self]
+
+    def data_version(self):
+        """A value that changes when any process commits a write, or None
+
+        Lets caches notice writes that never reached this process's event
+        bus. None means the backend has no cheap way to tell.
+        """
+        return None
+
+    def close(self):
+        """Release pooled resources"""
+
+    @abstractmethod
+    def save_listings(self, listings):
+        """Insert or update listings, returning how many were saved"""
+
+    @abstractmethod
+    def search_listings(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                        near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                        sources=None, sort='newest'):
+        """Search for listings based on criteria, in one of the SEARCH_SORTS orders"""
+
+    @abstractmethod
+    def search_facets(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                      near=None, bounds=None, min_bathrooms=None, min_sqft=None, max_sqft=None,
+                      sources=None):
+        """Counts by bedrooms, source and price bucket of the listings a search matches"""
+
+    @abstractmethod
+    def get_all_listings(self, limit=100):
+        """Get the newest listings"""
+
+    def search_listings_encoded(self, location="", min_price=0, max_price=10000, bedrooms="", amenities=None,
+                                near=None, bounds=None, **options):
+        """search_listings as serialization.EncodedListing rows, to write straight into a response"""
+        return serialization.encode_listings(self.search_listings(
+            location, min_price, max_price, bedrooms, amenities, near=near, bounds=bounds, **options
+        ))
+
+    def get_all_listings_encoded(self, limit=100):
+        """get_all_listings as serialization.EncodedListing rows"""
+        return serialization.encode_listings(self.get_all_listings(limit))
+
+    @abstractmethod
+    def get_listing_keys(self, location):
+        """Every stored (source, address, price) whose address contains location"""
+
+    @abstractmethod
+    def get_listings_by_id(self, ids):
+        """Load listings for the given ids as dictionaries"""
+
+    @abstractmethod
+    def get_stats(self):
+        """Get platform statistics"""
+
+    @abstractmethod
+    def clean_old_listings(self, days=30):
+        """Remove listings older than specified days"""
+
+    @abstractmethod
+    def start_maintenance(self, days=30):
+        """Start background expiry of listings older than days"""
+
+
+def open_database(target, **options):
+    """Open the storage backend for a SQLite path, a shard directory or a postgresql:// URL
+
+    A target ending in a path separator, or naming an existing directory,
+    opens a ShardedDatabaseManager with one SQLite file per metro. A SQLite
+    file opened with snapshot_path=<path> gets a ReplicatedDatabaseManager,
+    which serves reads from a snapshot published to that path.
+    """
+    if target.startswith(('postgres://', 'postgresql://')):
+        # Imported here so SQLite deployments never load psycopg2
+        from database.postgres_manager import PostgresDatabaseManager
+        return PostgresDatabaseManager(target, **options)
+
+    if target.endswith(('/', os.sep)) or os.path.isdir(target):
+        from database.sharding import ShardedDatabaseManager
+        return ShardedDatabaseManager(target, **options)
+
+    if options.get('snapshot_path'):
+        from database.replica import ReplicatedDatabaseManager
+        return ReplicatedDatabaseManager(target, **options)
+
+    from database.db_manager import DatabaseManager
+    return DatabaseManager(target, **options)
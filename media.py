@@ -0,0 +1,395 @@
+"""
+Local copies of listing images.
+
+After each save the ImagePrefetcher downloads the images of the saved
+listings in the background, shrinks them to thumbnails and stores them in
+a MediaCache. Files are named by the SHA-256 of their content, so the same
+photo used by several listings is stored once and a file's URL never
+changes meaning, which lets /media/<hash> be cached by browsers forever.
+The cache keeps its total size under max_bytes by deleting the least
+recently served files.
+
+Thumbnails are made with Pillow when it is installed. Without it images
+are stored as downloaded, as long as they are no larger than
+max_original_bytes.
+"""
+
+import functools
+import hashlib
+import io
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# File signatures of the image formats kept in the cache
+IMAGE_TYPES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+
+_DIGEST = re.compile(r'[0-9a-f]{64}')
+_MEDIA_FILE = re.compile(r'([0-9a-f]{64})\.(jpg|png|gif|webp)')
+
+
+def image_type(data):
+    """File extension of an image's format from its first bytes, or None"""
+    for signature, extension in IMAGE_TYPES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def pillow():
+    """PIL.Image, imported on first use so the app loads without it; None if not installed"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def make_thumbnail(data, size=(400, 300), quality=80, max_original_bytes=256 * 1024):
+    """(bytes, extension) of a thumbnail of an image, or None if it can't be used
+
+    Without Pillow the image itself is the thumbnail when it is small enough.
+    """
+    extension = image_type(data)
+    if extension is None:
+        return None
+    Image = pillow()
+    if Image is None:
+        return (data, extension) if len(data) <= max_original_bytes else None
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail(size)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=quality, optimize=True)
+            return output.getvalue(), 'jpg'
+    except Exception:
+        return None
+
+
+class MediaCache:
+    """Content-addressed image files with least-recently-served eviction
+
+    Files live under directory/<first two hash digits>/<hash>.<ext>, and
+    directory/media.db maps each source URL to the hash of its thumbnail.
+    The order files were last served in is kept in memory and persisted in
+    their modification times, so it survives restarts.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self.total_bytes = 0
+        self.evictions = 0
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS images (url TEXT PRIMARY KEY, hash TEXT NOT NULL, fetched_at REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_images_hash ON images(hash)")
+        conn.commit()
+        conn.close()
+        self._load()
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.directory, 'media.db'), timeout=30)
+
+    def _path(self, digest, extension):
+        return os.path.join(self.directory, digest[:2], f'{digest}.{extension}')
+
+    def _load(self):
+        """Index the files already on disk, least recently served first"""
+        found = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                match = _MEDIA_FILE.fullmatch(name)
+                if match:
+                    stat = os.stat(os.path.join(root, name))
+                    found.append((stat.st_mtime, match.group(1), match.group(2), stat.st_size))
+        for _, digest, extension, size in sorted(found):
+            self._files[digest] = (extension, size)
+            self.total_bytes += size
+        self._evict()
+
+    def put(self, url, data, extension):
+        """Store image bytes for a source URL; returns their hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, extension)
+        with self._lock:
+            known = digest in self._files
+        if not known or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO images (url, hash, fetched_at) VALUES (?, ?, ?)",
+                         (url, digest, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            if digest not in self._files:
+                self._files[digest] = (extension, len(data))
+                self.total_bytes += len(data)
+            self._files.move_to_end(digest)
+        self._evict()
+        return digest
+
+    def _evict(self):
+        """Delete least recently served files until the cache fits in max_bytes"""
+        evicted = []
+        with self._lock:
+            while self.total_bytes > self.max_bytes and len(self._files) > 1:
+                digest, (extension, size) = self._files.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+                evicted.append((digest, extension))
+        if not evicted:
+            return
+
+        conn = self._connect()
+        try:
+            # Forget the URLs so their images are fetched again if needed
+            conn.executemany("DELETE FROM images WHERE hash = ?", [(digest,) for digest, _ in evicted])
+            conn.commit()
+        finally:
+            conn.close()
+        for digest, extension in evicted:
+            try:
+                os.remove(self._path(digest, extension))
+            except OSError:
+                pass
+
+    def _adopt(self, digest):
+        """Index a file another process stored since this cache was loaded; call with the lock held"""
+        for extension in MIMETYPES:
+            try:
+                size = os.path.getsize(self._path(digest, extension))
+            except OSError:
+                continue
+            self._files[digest] = (extension, size)
+            self.total_bytes += size
+            return self._files[digest]
+        return None
+
+    def get(self, digest):
+        """(path, mimetype) of a cached file, marking it recently served; None if absent"""
+        if not _DIGEST.fullmatch(digest):
+            return None
+        with self._lock:
+            entry = self._files.get(digest) or self._adopt(digest)
+            if entry is None:
+                return None
+            self._files.move_to_end(digest)
+        path = self._path(digest, entry[0])
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path, MIMETYPES[entry[0]]
+
+    def lookup(self, urls):
+        """{url: hash} for the given source URLs that have a cached image"""
+        urls = list(set(url for url in urls if url))
+        if not urls:
+            return {}
+        found = {}
+        conn = self._connect()
+        try:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                found.update(conn.execute(
+                    f"SELECT url, hash FROM images WHERE url IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        finally:
+            conn.close()
+        with self._lock:
+            # Workers share the directory, so a hash may be newer than _files
+            return {
+                url: digest for url, digest in found.items()
+                if digest in self._files or self._adopt(digest)
+            }
+
+    def with_thumbnails(self, listings):
+        """Copies of EncodedListing rows with a thumbnail URL (/media/<hash>) where one is cached"""
+        cached = self.lookup(listing.image_url for listing in listings)
+        if not cached:
+            return listings
+        return [
+            listing.extended(thumbnail=f"/media/{cached[listing.image_url]}")
+            if listing.image_url in cached else listing
+            for listing in listings
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+
+class ImagePrefetcher:
+    """Downloads and caches the images of newly saved listings in the background
+
+    It listens for write events on the store. Saved ids are queued and a
+    feeder thread loads their listings and hands every image URL that is
+    not cached yet to a pool of workers downloading over the shared pooled
+    session. URLs that failed are not retried for retry_after seconds.
+    """
+
+    def __init__(self, db, cache, workers=8, max_download_bytes=10 * 1024 * 1024, timeout=15,
+                 retry_after=3600):
+        self.db = db
+        self.cache = cache
+        self.workers = workers
+        self.max_download_bytes = max_download_bytes
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.logger = logging.getLogger(__name__)
+        self.fetched = 0
+        self.failed = 0
+        self._ids = queue.Queue(maxsize=10000)
+        self._in_flight = set()
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._thread = None
+
+    def start(self, backfill=500):
+        """Start fetching after writes, first queueing the images of the newest backfill listings"""
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='media')
+        self._thread = threading.Thread(target=self._run, name='image-prefetch', daemon=True)
+        self._thread.start()
+        self.db.events.add_listener(self._on_write)
+        if backfill:
+            self._executor.submit(lambda: self.prefetch(self.db.get_all_listings(limit=backfill)))
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.db.events.remove_listener(self._on_write)
+        self._ids.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+
+    def _on_write(self, event):
+        # Runs on the writer's thread: only queue the ids
+        for listing_id in event.get('ids') or ():
+            try:
+                self._ids.put_nowait(listing_id)
+            except queue.Full:
+                # A backlog this deep means fetching can't keep up; skip rather than block saves
+                return
+
+    def _run(self):
+        while True:
+            ids = [self._ids.get()]
+            while len(ids) < 500:
+                try:
+                    ids.append(self._ids.get_nowait())
+                except queue.Empty:
+                    break
+            if None in ids:
+                return
+            try:
+                self.prefetch(self.db.get_listings_by_id(ids))
+            except Exception as e:
+                self.logger.error(f"Error loading listings for image prefetch: {e}")
+
+    def prefetch(self, listings):
+        """Queue downloads for the listings' images that are not cached yet"""
+        urls = {listing.get('image_url') for listing in listings} - {None, ''}
+        urls -= set(self.cache.lookup(urls))
+        now = time.time()
+        with self._lock:
+            urls = {
+                url for url in urls
+                if url not in self._in_flight and now - self._failures.get(url, 0) > self.retry_after
+            }
+            self._in_flight |= urls
+        for url in urls:
+            self._executor.submit(self._fetch, url)
+        return len(urls)
+
+    @property
+    def session(self):
+        if self._session is None:
+            from scrapers.base import create_session
+            self._session = create_session(pool_size=self.workers, retries=1)
+        return self._session
+
+    def _fetch(self, url):
+        try:
+            data = self._download(url)
+            thumbnail = make_thumbnail(data) if data else None
+            if thumbnail is None:
+                raise ValueError("not a usable image")
+            self.cache.put(url, *thumbnail)
+            with self._lock:
+                self.fetched += 1
+        except Exception as e:
+            self.logger.debug(f"Could not cache image {url}: {e}")
+            with self._lock:
+                self.failed += 1
+                self._failures[url] = time.time()
+                while len(self._failures) > 10000:
+                    self._failures.popitem(last=False)
+        finally:
+            with self._lock:
+                self._in_flight.discard(url)
+
+    def _download(self, url):
+        """Image bytes, or None on an HTTP error or when larger than max_download_bytes"""
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > self.max_download_bytes:
+                    return None
+            return bytes(data)
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {
+            'fetched': self.fetched,
+            'failed': self.failed,
+            'in_flight': in_flight,
+            'queued_ids': self._ids.qsize(),
+            'cache': self.cache.stats()
+        }
@@ -0,0 +1,337 @@
+"""
+Adaptive scrape scheduling.
+
+Every scheduled location has its own refresh interval. After each run the
+interval shrinks for locations whose listings churn (many listings we had
+not seen before) and for locations users search for often, and grows back
+towards the base interval when neither is true. Due locations are
+dispatched concurrently, highest priority first, for as long as the
+upstream request budget allows.
+
+Searched-for "City, ST" locations that are not configured get scheduled
+on demand once they are searched often, or searched again while we hold
+no data for them, and are dropped again when the searches stop.
+"""
+
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from database.batch_writer import BatchWriter
+from database.db_manager import extract_city
+from scrapers import scraper_names, stream_scrape
+
+DEFAULT_LOCATIONS = (
+    "New York, NY",
+    "Los Angeles, CA",
+    "Chicago, IL",
+    "Houston, TX",
+    "Phoenix, AZ"
+)
+
+
+def location_key(location):
+    """Case- and whitespace-insensitive key for matching locations"""
+    return ' '.join((location or '').split()).lower()
+
+
+class RequestBudget:
+    """Token bucket of upstream requests, refilled continuously"""
+
+    def __init__(self, per_hour):
+        self.capacity = float(per_hour)
+        self.tokens = float(per_hour)
+        self.rate = per_hour / 3600.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, requests):
+        """Take requests tokens if they are all available"""
+        with self._lock:
+            self._refill()
+            if self.tokens < requests:
+                return False
+            self.tokens -= requests
+            return True
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return int(self.tokens)
+
+
+class LocationSchedule:
+    """Refresh state for one scheduled location"""
+
+    __slots__ = ('location', 'interval', 'next_run', 'last_run', 'churn', 'last_count', 'running', 'pinned')
+
+    def __init__(self, location, interval, next_run, pinned=True):
+        self.location = location
+        # Configured locations are pinned; demand-added ones can be retired
+        self.pinned = pinned
+        self.interval = interval
+        self.next_run = next_run
+        self.last_run = None
+        # Exponentially weighted share of scraped listings that were new
+        self.churn = 0.0
+        self.last_count = 0
+        self.running = False
+
+
+class AdaptiveScheduler:
+    """Per-location scrape scheduling driven by churn and search demand"""
+
+    def __init__(self, db, locations=DEFAULT_LOCATIONS, sources=None,
+                 base_interval=6 * 3600, min_interval=1800, max_interval=24 * 3600,
+                 requests_per_hour=120, max_pages=5, max_workers=4,
+                 demand_half_life=6 * 3600, churn_smoothing=0.3, promote_demand=3,
+                 stale_after=2 * 3600, max_demand_locations=20):
+        self.db = db
+        # Every registered source unless told otherwise
+        self.sources = tuple(sources or scraper_names())
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_pages = max_pages
+        self.demand_half_life = demand_half_life
+        self.churn_smoothing = churn_smoothing
+        self.promote_demand = promote_demand
+        self.stale_after = stale_after
+        self.max_demand_locations = max_demand_locations
+        self.budget = RequestBudget(requests_per_hour)
+        self.logger = logging.getLogger(__name__)
+        self._entries = {}
+        self._demand = {}
+        self._has_data = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scrape')
+        self._stop = threading.Event()
+        self._thread = None
+
+        for location in locations:
+            self.add_location(location)
+
+    def add_location(self, location, next_run=None, pinned=True):
+        """Schedule a location; by default its first run is due immediately"""
+        with self._lock:
+            key = location_key(location)
+            if key not in self._entries:
+                self._entries[key] = LocationSchedule(
+                    location, self.base_interval, time.time() if next_run is None else next_run, pinned
+                )
+            return self._entries[key]
+
+    def remove_location(self, location):
+        with self._lock:
+            return self._entries.pop(location_key(location), None) is not None
+
+    def record_search(self, location, now=None):
+        """Count one search for a location towards its demand"""
+        key = location_key(location)
+        if not key:
+            return
+        now = now or time.time()
+        with self._lock:
+            # Keep the first spelling seen for display and scraping
+            spelling = self._demand[key][2] if key in self._demand else location.strip()
+            self._demand[key] = (self._decayed_demand(key, now) + 1, now, spelling)
+
+    def demand(self, location, now=None):
+        """Recent searches for a location, halving every demand_half_life seconds"""
+        with self._lock:
+            return self._decayed_demand(location_key(location), now or time.time())
+
+    def _decayed_demand(self, key, now):
+        value, updated, _ = self._demand.get(key, (0.0, now, None))
+        return value * 0.5 ** ((now - updated) / self.demand_half_life)
+
+    def top_demand(self, limit=10, now=None):
+        """The most-searched locations as (location, demand), highest first"""
+        now = now or time.time()
+        with self._lock:
+            ranked = [(location, self._decayed_demand(key, now)) for key, (_, _, location) in self._demand.items()]
+            # Forget locations nobody has searched for in a long while
+            for key in [key for key in self._demand if self._decayed_demand(key, now) < 0.01]:
+                del self._demand[key]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    def top_locations(self, limit=10):
+        """The most-searched locations, highest demand first"""
+        return [location for location, _ in self.top_demand(limit)]
+
+    def holds_data(self, location, now=None):
+        """Whether the database has listings for location, remembered for stale_after seconds"""
+        key = location_key(location)
+        now = now or time.time()
+        with self._lock:
+            known = self._has_data.get(key)
+        if known is not None and now - known[1] < self.stale_after:
+            return known[0]
+        found = bool(self.db.search_listings(location))
+        with self._lock:
+            self._has_data[key] = (found, now)
+        return found
+
+    def promote_demand_locations(self, now=None):
+        """Bring forward scrapes for searched-for locations with missing or stale data
+
+        An unscheduled location must name a city ("City, ST") to be scraped.
+        It is added once its demand reaches promote_demand, or once it has been
+        searched for more than once recently and we hold no listings for
+        it. A scheduled one runs now if its demand reaches promote_demand
+        and its last run is older than stale_after. Returns the promoted
+        locations.
+        """
+        now = now or time.time()
+        promoted = []
+        for location, demand in self.top_demand(self.max_demand_locations, now):
+            with self._lock:
+                entry = self._entries.get(location_key(location))
+                added = sum(not other.pinned for other in self._entries.values())
+
+            if entry is None:
+                if added >= self.max_demand_locations or extract_city(location) is None:
+                    continue
+                if demand >= self.promote_demand or (demand > 1 and not self.holds_data(location, now)):
+                    self.add_location(location, next_run=now, pinned=False)
+                    promoted.append(location)
+            elif demand >= self.promote_demand:
+                with self._lock:
+                    stale = entry.last_run is None or now - entry.last_run > self.stale_after
+                    if stale and not entry.running and entry.next_run > now:
+                        entry.next_run = now
+                        promoted.append(entry.location)
+
+        # Retire demand-added locations once their searches have faded
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if not entry.pinned and not entry.running and self._decayed_demand(key, now) < 0.5:
+                    del self._entries[key]
+            for key in [key for key in self._has_data if key not in self._demand]:
+                del self._has_data[key]
+
+        if promoted:
+            self.logger.info(f"Promoted scrapes for searched locations: {', '.join(promoted)}")
+        return promoted
+
+    def interval_for(self, entry, now=None):
+        """Refresh interval from the entry's churn and current search demand"""
+        demand = self._decayed_demand(location_key(entry.location), now or time.time())
+        # Full churn refreshes four times as often; demand adds a log boost
+        factor = (1 + 3 * entry.churn) * (1 + math.log1p(demand))
+        return max(self.min_interval, min(self.max_interval, self.base_interval / factor))
+
+    def _priority(self, entry, now):
+        """How overdue an entry is relative to its interval, boosted by demand"""
+        overdue = (now - entry.next_run) / entry.interval + 1
+        return overdue * (1 + math.log1p(self._decayed_demand(location_key(entry.location), now)))
+
+    def job_cost(self):
+        """Upper bound on upstream requests for one location run"""
+        return len(self.sources) * self.max_pages
+
+    def run_pending(self, now=None):
+        """Dispatch due locations while the request budget lasts
+
+        Returns the futures of the dispatched jobs.
+        """
+        now = now or time.time()
+        self.promote_demand_locations(now)
+        with self._lock:
+            due = [entry for entry in self._entries.values() if not entry.running and entry.next_run <= now]
+            due.sort(key=lambda entry: self._priority(entry, now), reverse=True)
+
+        futures = []
+        for entry in due:
+            if not self.budget.try_acquire(self.job_cost()):
+                self.logger.info(f"Request budget exhausted; {len(due) - len(futures)} locations wait")
+                break
+            with self._lock:
+                entry.running = True
+            futures.append(self._executor.submit(self._run_job, entry))
+        return futures
+
+    def _run_job(self, entry):
+        """Scrape every source for one location, save, and reschedule it"""
+        try:
+            # Churn is measured against what we already held for the location
+            known = self.db.get_listing_keys(entry.location)
+            counts = {'scraped': 0, 'new': 0}
+            counts_lock = threading.Lock()
+
+            with BatchWriter(self.db) as writer:
+                def sink(listing):
+                    with counts_lock:
+                        counts['scraped'] += 1
+                        counts['new'] += (listing.get('source'), listing.get('address'), listing.get('price')) not in known
+                    writer.add(listing)
+
+                stream_scrape(entry.location, sink, self.max_pages, self.sources)
+
+            self.record_scrape(entry.location, counts['scraped'], counts['new'])
+            self.logger.info(f"Scheduled scrape of {entry.location}: {counts['scraped']} listings, {counts['new']} new")
+            return counts['scraped']
+        finally:
+            with self._lock:
+                entry.running = False
+                entry.last_run = time.time()
+                entry.interval = self.interval_for(entry, entry.last_run)
+                entry.next_run = entry.last_run + entry.interval
+
+    def record_scrape(self, location, scraped, new):
+        """Fold the share of new listings from one run into the location's churn"""
+        with self._lock:
+            entry = self._entries.get(location_key(location))
+            if entry is None or not scraped:
+                return
+            rate = new / scraped
+            entry.churn += self.churn_smoothing * (rate - entry.churn)
+            entry.last_count = scraped
+
+    def status(self, now=None):
+        """Schedule of every location, soonest first"""
+        now = now or time.time()
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry.next_run)
+            return {
+                'request_budget': self.budget.available(),
+                'locations': [
+                    {
+                        'location': entry.location,
+                        'interval_minutes': round(entry.interval / 60, 1),
+                        'next_run_in_minutes': round(max(entry.next_run - now, 0) / 60, 1),
+                        'churn': round(entry.churn, 3),
+                        'demand': round(self._decayed_demand(location_key(entry.location), now), 2),
+                        'last_count': entry.last_count,
+                        'running': entry.running,
+                        'on_demand': not entry.pinned
+                    }
+                    for entry in entries
+                ]
+            }
+
+    def start(self, tick=60):
+        """Check for due locations every tick seconds in a background thread"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.run_pending()
+                except Exception as e:
+                    self.logger.error(f"Error in scrape scheduler: {e}")
+                self._stop.wait(tick)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='scheduler', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop dispatching; running jobs finish on their own"""
+        self._stop.set()
@@ -1 +1,90 @@
-# Scrapers package for rental listing platform
\ No newline at end of file
+# Scrapers package for rental listing platform
+import importlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Scraper classes are imported on first use so that importing the package
+# (or the Flask app) does not pull in requests/bs4.
+SCRAPER_CLASSES = {
+    'zillow': ('scrapers.zillow_scraper', 'ZillowScraper'),
+    'apartments': ('scrapers.apartments_scraper', 'ApartmentsScraper'),
+}
+
+_instances = {}
+_lock = threading.Lock()
+_executor = None
+logger = logging.getLogger(__name__)
+
+
+def register_scraper(name, module_name, class_name):
+    """Add a source: class_name in module_name, a BaseScraper subclass"""
+    with _lock:
+        SCRAPER_CLASSES[name] = (module_name, class_name)
+        _instances.pop(name, None)
+
+
+def scraper_names():
+    """Registry keys of every source"""
+    return tuple(SCRAPER_CLASSES)
+
+
+def get_scraper(name):
+    """Return the shared scraper instance for a source, creating it on first use"""
+    scraper = _instances.get(name)
+    if scraper is not None:
+        return scraper
+
+    with _lock:
+        if name not in _instances:
+            module_name, class_name = SCRAPER_CLASSES[name]
+            scraper_class = getattr(importlib.import_module(module_name), class_name)
+            _instances[name] = scraper_class()
+        return _instances[name]
+
+
+def _fan_out(location, sources, scrape):
+    """Run scrape(source) for each source in parallel; returns {source: result}"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='source')
+
+    futures = {source: _executor.submit(scrape, source) for source in sources}
+    results = {}
+    for source, future in futures.items():
+        try:
+            results[source] = future.result()
+        except Exception as e:
+            logger.error(f"Error scraping {source} for {location}: {e}")
+            results[source] = None
+    return results
+
+
+def scrape_all(location, max_pages=5, sources=None):
+    """Scrape a location from every source (or the given ones) concurrently
+
+    Returns {source: listings}; a source that fails contributes an empty list.
+    """
+    results = _fan_out(
+        location, tuple(sources or scraper_names()),
+        lambda source: get_scraper(source).scrape_listings(location, max_pages=max_pages)
+    )
+    return {source: listings or [] for source, listings in results.items()}
+
+
+def stream_scrape(location, sink, max_pages=5, sources=None):
+    """Scrape sources concurrently, calling sink(listing) as soon as each listing is parsed
+
+    sink is called from several threads at once; a BatchWriter's add() is
+    a suitable sink. Returns {source: listings streamed}.
+    """
+    def scrape(source):
+        count = 0
+        for listing in get_scraper(source).iter_listings(location, max_pages=max_pages):
+            sink(listing)
+            count += 1
+        return count
+
+    results = _fan_out(location, tuple(sources or scraper_names()), scrape)
+    return {source: count or 0 for source, count in results.items()}
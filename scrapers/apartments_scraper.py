@@ -1,113 +1,41 @@
-import requests
-from bs4 import BeautifulSoup
-import json
 import re
-import time
-import random
-from urllib.parse import urlencode, quote
-from datetime import datetime
-import logging
+from urllib.parse import quote
+from scrapers.base import BaseScraper, parse_number, parse_prices
 
-class ApartmentsScraper:
-    def __init__(self):
-        self.base_url = "https://www.apartments.com"
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Referer': 'https://www.apartments.com'
-        }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
-        
-        # Setup logging
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger(__name__)
+class ApartmentsScraper(BaseScraper):
+    name = 'apartments'
+    source = 'Apartments.com'
+    base_url = "https://www.apartments.com"
+    headers = {'Referer': 'https://www.apartments.com'}
+    stop_on_error = True
+
+    def page_url(self, location, page):
+        """Search URL for a location slug, with pagination"""
+        url = f"{self.base_url}/{quote(location.lower().replace(' ', '-').replace(',', ''))}"
+        return url if page == 1 else url + f"/{page}"
 
-    def scrape_listings(self, location, max_pages=5):
-        """Scrape rental listings from Apartments.com for a given location"""
-        listings = []
+    def extract_listings(self, soup):
+        """Listings from the property cards on a results page"""
+        # Find property listings using multiple selectors
+        property_cards = soup.find_all('article', class_=re.compile('placard'))
         
-        try:
-            # Build search URL
-            search_url = f"{self.base_url}/{quote(location.lower().replace(' ', '-').replace(',', ''))}"
-            
-            self.logger.info(f"Scraping Apartments.com for: {location}")
-            
-            for page in range(1, max_pages + 1):
-                try:
-                    # Add pagination
-                    page_url = search_url
-                    if page > 1:
-                        page_url += f"/{page}"
-                    
-                    response = self.session.get(page_url)
-                    
-                    if response.status_code == 200:
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        
-                        # Find property listings using multiple selectors
-                        property_cards = soup.find_all('article', class_=re.compile('placard'))
-                        
-                        if not property_cards:
-                            # Alternative selectors
-                            property_cards = soup.find_all('div', class_=re.compile('property-information'))
-                            
-                        if not property_cards:
-                            # Another alternative
-                            property_cards = soup.find_all('li', class_=re.compile('mortar-wrapper'))
-                        
-                        # Parse property cards
-                        for card in property_cards:
-                            listing = self._parse_property_card(card)
-                            if listing:
-                                listings.append(listing)
-                        
-                        self.logger.info(f"Found {len(property_cards)} listings on page {page}")
-                        
-                        # Check if there are more pages
-                        next_page = soup.find('a', {'aria-label': 'Next page'})
-                        if not next_page:
-                            break
-                        
-                        # Rate limiting
-                        time.sleep(random.uniform(2, 4))
-                        
-                    else:
-                        self.logger.warning(f"Failed to fetch page {page}: {response.status_code}")
-                        break
-                        
-                except Exception as e:
-                    self.logger.error(f"Error scraping page {page}: {e}")
-                    continue
-            
-            # Remove duplicates based on address
-            unique_listings = []
-            seen_addresses = set()
+        if not property_cards:
+            # Alternative selectors
+            property_cards = soup.find_all('div', class_=re.compile('property-information'))
             
-            for listing in listings:
-                addr = listing.get('address', '').lower()
-                if addr and addr not in seen_addresses:
-                    seen_addresses.add(addr)
-                    unique_listings.append(listing)
-            
-            self.logger.info(f"Scraped {len(unique_listings)} unique Apartments.com listings for {location}")
-            return unique_listings
-            
-        except Exception as e:
-            self.logger.error(f"Error scraping Apartments.com for {location}: {e}")
-            return []
+        if not property_cards:
+            # Another alternative
+            property_cards = soup.find_all('li', class_=re.compile('mortar-wrapper'))
+        
+        return [self._parse_property_card(card) for card in property_cards]
+
+    def has_next_page(self, soup):
+        return soup.find('a', {'aria-label': 'Next page'}) is not None
 
     def _parse_property_card(self, card):
         """Parse individual property card"""
         try:
-            listing = {
-                'source': 'Apartments.com',
-                'scraped_at': datetime.now().isoformat()
-            }
+            listing = self.new_listing()
             
             # Extract property name and address
             title_elem = card.find('h3') or card.find('a', class_=re.compile('property-link'))
@@ -128,14 +56,13 @@ class ApartmentsScraper:
                 price_elem = card.find('div', class_=re.compile('price-range'))
             
             if price_elem:
-                price_text = price_elem.get_text(strip=True)
                 # Look for price patterns like $1,200 - $1,500 or $1,200+
-                price_matches = re.findall(r'\$([0-9,]+)', price_text)
-                if price_matches:
+                prices = parse_prices(price_elem.get_text(strip=True))
+                if prices:
                     # Take the first price if multiple found
-                    listing['price'] = int(price_matches[0].replace(',', ''))
-                    if len(price_matches) > 1:
-                        listing['price_max'] = int(price_matches[1].replace(',', ''))
+                    listing['price'] = prices[0]
+                    if len(prices) > 1:
+                        listing['price_max'] = prices[1]
             
             # Extract bedrooms and bathrooms
             beds_baths_elem = card.find('p', class_=re.compile('property-beds')) or card.find('span', class_=re.compile('bed-bath'))
@@ -146,43 +73,31 @@ class ApartmentsScraper:
                 text = beds_baths_elem.get_text(strip=True)
                 
                 # Extract bedrooms
-                bed_match = re.search(r'(\d+)\s*(?:bed|bd|bedroom)', text, re.IGNORECASE)
-                if bed_match:
-                    listing['bedrooms'] = int(bed_match.group(1))
+                bedrooms = parse_number(r'(\d+)\s*(?:bed|bd|bedroom)', text)
+                if bedrooms is not None:
+                    listing['bedrooms'] = bedrooms
                 elif 'studio' in text.lower():
                     listing['bedrooms'] = 0
                 
                 # Extract bathrooms
-                bath_match = re.search(r'(\d+(?:\.\d+)?)\s*(?:bath|ba|bathroom)', text, re.IGNORECASE)
-                if bath_match:
-                    listing['bathrooms'] = float(bath_match.group(1))
+                bathrooms = parse_number(r'(\d+(?:\.\d+)?)\s*(?:bath|ba|bathroom)', text, float)
+                if bathrooms is not None:
+                    listing['bathrooms'] = bathrooms
                 
                 # Extract square footage
-                sqft_match = re.search(r'(\d+(?:,\d+)?)\s*(?:sq\.?\s*ft|sqft)', text, re.IGNORECASE)
-                if sqft_match:
-                    listing['square_feet'] = int(sqft_match.group(1).replace(',', ''))
+                square_feet = parse_number(r'(\d+(?:,\d+)?)\s*(?:sq\.?\s*ft|sqft)', text)
+                if square_feet is not None:
+                    listing['square_feet'] = square_feet
             
             # Extract property link
             link_elem = card.find('a', href=True)
             if link_elem:
-                href = link_elem['href']
-                if href.startswith('/'):
-                    listing['url'] = self.base_url + href
-                elif href.startswith('http'):
-                    listing['url'] = href
-                else:
-                    listing['url'] = self.base_url + '/' + href
+                listing['url'] = self.absolute_url(link_elem['href'])
             
             # Extract image
             img_elem = card.find('img', src=True)
             if img_elem:
-                src = img_elem['src']
-                if src.startswith('//'):
-                    listing['image_url'] = 'https:' + src
-                elif src.startswith('/'):
-                    listing['image_url'] = self.base_url + src
-                else:
-                    listing['image_url'] = src
+                listing['image_url'] = self.absolute_url(img_elem['src'])
             
             # Extract amenities if available
             amenities_elem = card.find('div', class_=re.compile('amenity')) or card.find('ul', class_=re.compile('amenity'))
@@ -206,8 +121,9 @@ class ApartmentsScraper:
 
     def get_property_details(self, property_url):
         """Get detailed information for a specific property"""
+        from bs4 import BeautifulSoup
         try:
-            response = self.session.get(property_url)
+            response = self.session.get(property_url, timeout=self.timeout)
             
             if response.status_code == 200:
                 soup = BeautifulSoup(response.content, 'html.parser')
@@ -239,13 +155,7 @@ class ApartmentsScraper:
                 if image_gallery:
                     images = []
                     for img in image_gallery.find_all('img', src=True):
-                        src = img['src']
-                        if src.startswith('//'):
-                            images.append('https:' + src)
-                        elif src.startswith('/'):
-                            images.append(self.base_url + src)
-                        else:
-                            images.append(src)
+                        images.append(self.absolute_url(img['src']))
                     details['images'] = images
                 
                 return details
@@ -0,0 +1,202 @@
+import fcntl
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_SEGMENT = re.compile(r'segment-(\d{6})\.dat')
+
+_archive = None
+
+
+def set_archive(archive):
+    """Archive every results page fetched from now on in archive (None to stop)
+
+    The archive it replaces is closed.
+    """
+    global _archive
+    previous, _archive = _archive, archive
+    if previous is not None and previous is not archive:
+        previous.close()
+
+
+def get_archive():
+    """The PageArchive fetched pages go to, or None"""
+    return _archive
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read zstd-compressed pages")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class PageArchive:
+    """Append-only, compressed store of raw results pages
+
+    Each page is compressed on its own (a zstd frame when zstandard is
+    installed, otherwise a gzip member) and appended to the current segment
+    file, segment-NNNNNN.dat, until it reaches segment_bytes and a new one
+    is started. Segments are never rewritten, so a crash can at worst leave
+    an unindexed tail. index.db records where each page is, keyed by
+    (source, location, page, fetched_at).
+
+    Several processes (e.g. web workers) can share a directory: appends
+    hold an exclusive lock on archive.lock and take the offset from the
+    segment's size on disk, so each page lands where it is indexed.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, codec=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.codec = codec or ('zstd' if zstandard is not None else 'gzip')
+        if self.codec == 'zstd' and zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._file = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, 'archive.lock'), 'a')
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.db'), timeout=30, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                location TEXT NOT NULL COLLATE NOCASE,
+                page INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                url TEXT,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                codec TEXT NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pages_key ON pages(source, location, page, fetched_at)"
+        )
+        self._conn.commit()
+
+        segments = sorted(name for name in os.listdir(directory) if _SEGMENT.fullmatch(name))
+        self._segment = segments[-1] if segments else 'segment-000001.dat'
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, segment)
+
+    def _open_segment(self, length):
+        """(file, offset) to append length bytes at, rolling over when full (both locks held)
+
+        Another process may have written to or filled the segment since
+        the last append, so its size is read from disk each time and
+        segments already full are skipped.
+        """
+        while True:
+            if self._file is None:
+                self._file = open(self._segment_path(self._segment), 'ab')
+            size = os.fstat(self._file.fileno()).st_size
+            if not size or size + length <= self.segment_bytes:
+                return self._file, size
+            self._file.close()
+            self._file = None
+            number = int(_SEGMENT.fullmatch(self._segment).group(1)) + 1
+            self._segment = f'segment-{number:06d}.dat'
+
+    def append(self, source, location, page, url, content, fetched_at=None):
+        """Store one fetched page; returns its index id"""
+        blob = compress(content, self.codec)
+        with self._lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                segment_file, offset = self._open_segment(len(blob))
+                segment_file.write(blob)
+                segment_file.flush()
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            cursor = self._conn.execute(
+                "INSERT INTO pages (source, location, page, fetched_at, url, segment, offset, length, size, codec)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, location, page, fetched_at or time.time(), url, self._segment, offset,
+                 len(blob), len(content), self.codec)
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def entries(self, source=None, location=None, since=None, latest=True):
+        """Index entries, oldest first, as dicts
+
+        With latest only the newest fetch of each (source, location, page)
+        is returned. since is a Unix timestamp.
+        """
+        query = "SELECT id, source, location, page, fetched_at, url, segment, offset, length, codec"
+        query += ", MAX(fetched_at)" if latest else ""
+        query += " FROM pages WHERE 1=1"
+        params = []
+        if source:
+            query += " AND source = ?"
+            params.append(source)
+        if location:
+            query += " AND location = ?"
+            params.append(location)
+        if since:
+            query += " AND fetched_at >= ?"
+            params.append(since)
+        if latest:
+            # SQLite takes the other columns from the row holding the MAX()
+            query += " GROUP BY source, location, page"
+        query += " ORDER BY fetched_at, id"
+
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            columns = [d[0] for d in cursor.description][:10]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def read(self, entry):
+        """Raw content of an archived page, given its index entry"""
+        return read_page(self.directory, entry)
+
+    def stats(self):
+        with self._lock:
+            pages, stored, raw = self._conn.execute(
+                "SELECT COUNT(*), IFNULL(SUM(length), 0), IFNULL(SUM(size), 0) FROM pages"
+            ).fetchone()
+        return {
+            'pages': pages,
+            'stored_bytes': stored,
+            'raw_bytes': raw,
+            'ratio': round(raw / stored, 2) if stored else None,
+            'segment': self._segment,
+            'codec': self.codec
+        }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._lock_file.close()
+            self._conn.close()
+
+
+def read_page(directory, entry):
+    """Raw content of an archived page; needs only the directory, so worker processes can call it"""
+    with open(os.path.join(directory, entry['segment']), 'rb') as f:
+        f.seek(entry['offset'])
+        return decompress(f.read(entry['length']), entry['codec'])
@@ -0,0 +1,212 @@
+import importlib.util
+import logging
+import random
+import re
+import time
+from datetime import datetime
+from urllib.parse import urljoin
+from scrapers.archive import get_archive
+from scrapers.health import get_breaker
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+# Transient upstream errors worth retrying; 403/429 mean we are being
+# blocked and are left to the circuit breaker instead
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+def create_session(headers=None, pool_size=8, retries=3, backoff=1.0):
+    """requests session with a bounded keep-alive pool, retries and compression
+
+    Connections to each host are reused up to pool_size at a time. GETs
+    that fail to connect or get a 5xx answer are retried with exponential
+    backoff (honouring Retry-After). Responses are accepted gzip or deflate
+    compressed, and brotli compressed when a brotli package is installed.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    encodings = ['gzip', 'deflate']
+    if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi'):
+        encodings.append('br')
+    session.headers.update(DEFAULT_HEADERS)
+    session.headers['Accept-Encoding'] = ', '.join(encodings)
+    session.headers.update(headers or {})
+    return session
+
+
+def parse_prices(text):
+    """Dollar amounts in text, in order ("$1,200 - $1,500" gives [1200, 1500])"""
+    return [int(amount.replace(',', '')) for amount in re.findall(r'\$([0-9,]+)', text or '')]
+
+
+def parse_number(pattern, text, cast=int):
+    """First group of pattern in text (case-insensitive, commas dropped), or None"""
+    match = re.search(pattern, text or '', re.IGNORECASE)
+    return cast(match.group(1).replace(',', '')) if match else None
+
+
+class BaseScraper:
+    """Common page loop for a listing source
+
+    A source sets name (its registry key), source (the label stored with
+    each listing) and base_url, and implements page_url() and
+    extract_listings(). The base class fetches pages through a shared
+    pooled session, stops early when the source's circuit is open, rate
+    limits between pages and removes duplicate addresses.
+    """
+
+    name = None
+    source = None
+    base_url = None
+    headers = {}
+    # Stop paging at the first HTTP error instead of trying later pages
+    stop_on_error = False
+    # Seconds to wait between pages
+    page_delay = (2, 4)
+    timeout = 30
+
+    def __init__(self):
+        self._session = None
+        self.breaker = get_breaker(self.name)
+        self.logger = logging.getLogger(type(self).__module__)
+
+    @property
+    def session(self):
+        """HTTP session, created on first request"""
+        if self._session is None:
+            self._session = create_session(self.headers)
+        return self._session
+
+    def page_url(self, location, page):
+        """URL of a results page (1-based) for a location"""
+        raise NotImplementedError
+
+    def extract_listings(self, soup):
+        """Listings on a parsed results page; None entries are skipped"""
+        raise NotImplementedError
+
+    def has_next_page(self, soup):
+        """Whether another results page follows this one"""
+        return True
+
+    def absolute_url(self, href):
+        return urljoin(self.base_url + '/', href)
+
+    def new_listing(self):
+        """Listing dict with the fields every source sets"""
+        return {
+            'source': self.source,
+            'scraped_at': datetime.now().isoformat()
+        }
+
+    def parse_page(self, content):
+        """Listings on a results page's HTML and whether another page follows"""
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(content, 'html.parser')
+        return [listing for listing in self.extract_listings(soup) if listing], self.has_next_page(soup)
+
+    def _archive_page(self, location, page, response):
+        archive = get_archive()
+        if archive is None:
+            return
+        try:
+            archive.append(self.name, location, page, response.url, response.content)
+        except Exception as e:
+            # Losing the raw copy must not lose the scrape
+            self.logger.error(f"Error archiving page {page}: {e}")
+
+    def scrape_page(self, location, page):
+        """Fetch and parse one results page (1-based)
+
+        Returns (listings, has_more). listings is None when the page could
+        not be fetched; the failure is logged and counted against the
+        source's circuit breaker. has_more says whether a later page is
+        worth requesting. Fetched pages are kept in the page archive when
+        one is set.
+        """
+        try:
+            response = self.session.get(self.page_url(location, page), timeout=self.timeout)
+
+            if response.status_code != 200:
+                self.logger.warning(f"Failed to fetch page {page}: {response.status_code}")
+                self.breaker.record_failure(f"HTTP {response.status_code}")
+                return None, not self.stop_on_error
+
+            self._archive_page(location, page, response)
+            page_listings, has_more = self.parse_page(response.content)
+            self.logger.info(f"Found {len(page_listings)} listings on page {page}")
+
+            # A page without listings is usually a CAPTCHA or block page
+            if page_listings:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure(f"no listings on page {page}")
+            return page_listings, has_more
+
+        except Exception as e:
+            self.logger.error(f"Error scraping page {page}: {e}")
+            self.breaker.record_failure(str(e))
+            return None, True
+
+    def iter_listings(self, location, max_pages=5):
+        """Yield listings for a location as each results page is parsed
+
+        Repeated addresses are skipped. Nothing is held beyond the current
+        page and the set of addresses seen, so memory stays flat however
+        many pages are scraped.
+        """
+        seen_addresses = set()
+
+        self.logger.info(f"Scraping {self.source} for: {location}")
+
+        for page in range(1, max_pages + 1):
+            if not self.breaker.allow():
+                self.logger.warning(f"{self.source} circuit is open; skipping {location} from page {page}")
+                break
+
+            page_listings, has_more = self.scrape_page(location, page)
+
+            for listing in page_listings or []:
+                addr = listing.get('address', '').lower()
+                if addr and addr not in seen_addresses:
+                    seen_addresses.add(addr)
+                    yield listing
+
+            if page == max_pages or not has_more:
+                break
+
+            # Rate limiting
+            if page_listings is not None:
+                time.sleep(random.uniform(*self.page_delay))
+
+        self.logger.info(f"Scraped {len(seen_addresses)} unique {self.source} listings for {location}")
+
+    def scrape_listings(self, location, max_pages=5):
+        """Scrape rental listings for a location, up to max_pages result pages"""
+        try:
+            return list(self.iter_listings(location, max_pages))
+        except Exception as e:
+            self.logger.error(f"Error scraping {self.source} for {location}: {e}")
+            return []
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Health of one scraper source, with a circuit breaker over its requests
+
+    After failure_threshold consecutive failed pages (an HTTP error, a
+    block page or a page without any listing cards) the circuit opens and
+    allow() refuses requests, so scrapes of that source return at once.
+    After reset_timeout seconds one probe request is let through: if it
+    succeeds the circuit closes again, otherwise it stays open for twice as
+    long (up to max_reset_timeout).
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=300, max_reset_timeout=3600):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.logger = logging.getLogger(__name__)
+        self.state = CLOSED
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.last_success = None
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self, now=None):
+        """Whether a request may go out now; in the half-open state only one probe does"""
+        now = now or time.time()
+        with self._lock:
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                self.logger.info(f"Probing {self.name} after {self.reset_timeout:.0f}s open")
+                return True
+            self.rejected += 1
+            return False
+
+    def reset(self):
+        """Close the circuit and forget past failures"""
+        with self._lock:
+            self.state = CLOSED
+            self.reset_timeout = self.base_reset_timeout
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_success(self, now=None):
+        with self._lock:
+            if self.state != CLOSED:
+                self.logger.info(f"Circuit for {self.name} closed")
+            self.state = CLOSED
+            self.reset_timeout = self.base_reset_timeout
+            self.consecutive_failures = 0
+            self._probing = False
+            self.successes += 1
+            self.last_success = now or time.time()
+
+    def record_failure(self, error, now=None):
+        now = now or time.time()
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            if self.state == HALF_OPEN:
+                # The probe failed: back off further before the next one
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self._open(now)
+            elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self._probing = False
+        self.logger.warning(
+            f"Circuit for {self.name} opened after {self.consecutive_failures} failures "
+            f"({self.last_error}); retrying in {self.reset_timeout:.0f}s"
+        )
+
+    def status(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = round(max(self.opened_at + self.reset_timeout - now, 0))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+                'last_success': self.last_success,
+                'retry_in_seconds': retry_in
+            }
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Return the shared circuit breaker for a source, creating it on first use"""
+    with _lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def health_status():
+    """Circuit state of every source that has been scraped"""
+    with _lock:
+        breakers = dict(_breakers)
+    return {name: breaker.status() for name, breaker in sorted(breakers.items())}
+
+
+def reset_health():
+    """Close every source's circuit"""
+    with _lock:
+        breakers = list(_breakers.values())
+    for breaker in breakers:
+        breaker.reset()
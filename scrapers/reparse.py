@@ -0,0 +1,110 @@
+"""
+Re-run the current extractors over archived results pages.
+
+    python -m scrapers.reparse --archive page_archive
+    python -m scrapers.reparse --archive page_archive --source zillow --location "Austin, TX" --since 2024-05-01
+
+Pages come from the PageArchive the app writes when PAGE_ARCHIVE_DIR is
+set, so nothing is fetched from the sites. By default only the newest copy
+of each (source, location, page) is parsed. Pages are parsed in parallel
+worker processes and the listings are upserted in chunks through
+save_listings, with their scraped_at set to when the page was fetched.
+"""
+
+import argparse
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from database.bulk import Progress, iter_chunks
+from database.storage import open_database
+from scrapers import SCRAPER_CLASSES
+from scrapers.archive import PageArchive, read_page
+
+# Scraper instances of a worker process, by class
+_scrapers = {}
+
+
+def parse_archived_page(task):
+    """Listings on one archived page; task is (directory, module, class, entry)"""
+    directory, module_name, class_name, entry = task
+    key = (module_name, class_name)
+    if key not in _scrapers:
+        _scrapers[key] = getattr(importlib.import_module(module_name), class_name)()
+
+    listings, _ = _scrapers[key].parse_page(read_page(directory, entry))
+    scraped_at = datetime.fromtimestamp(entry['fetched_at']).isoformat()
+    for listing in listings:
+        listing['scraped_at'] = scraped_at
+    return listings
+
+
+def reparse(db, archive, source=None, location=None, since=None, all_versions=False,
+            workers=None, batch_size=1000, progress=None):
+    """Parse archived pages again and save what they contain
+
+    workers is the number of parser processes (default: one per CPU);
+    1 parses in this process. Returns {'pages', 'listings', 'skipped'};
+    pages of sources that are no longer registered are skipped.
+    """
+    progress = progress or Progress("Reparsed")
+    entries = archive.entries(source=source, location=location, since=since, latest=not all_versions)
+    tasks = [
+        (archive.directory, *SCRAPER_CLASSES[entry['source']], entry)
+        for entry in entries if entry['source'] in SCRAPER_CLASSES
+    ]
+
+    def parsed_listings(results):
+        for listings in results:
+            yield from listings
+
+    executor = None
+    if workers == 1:
+        results = map(parse_archived_page, tasks)
+    else:
+        # spawn: the app's threads make forking the parent unsafe
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        results = executor.map(parse_archived_page, tasks, chunksize=8)
+
+    count = 0
+    try:
+        for chunk in iter_chunks(parsed_listings(results), batch_size):
+            db.save_listings(chunk)
+            count += len(chunk)
+            progress.advance(len(chunk))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    progress.finish()
+    return {'pages': len(tasks), 'listings': count, 'skipped': len(entries) - len(tasks)}
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Re-parse archived results pages into the database")
+    parser.add_argument('--db', default='rental_listings.db', help="SQLite database path or postgresql:// URL")
+    parser.add_argument('--archive', default='page_archive', help="page archive directory")
+    parser.add_argument('--source', help="only pages of this source (registry name, e.g. zillow)")
+    parser.add_argument('--location', help="only pages of this location")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="only pages fetched at or after this ISO date/time")
+    parser.add_argument('--all-versions', action='store_true', help="parse every archived copy, not just the newest")
+    parser.add_argument('--workers', type=int, help="parser processes (default: one per CPU)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="listings per save transaction")
+    args = parser.parse_args(argv)
+
+    db = open_database(args.db)
+    db.init_database()
+    archive = PageArchive(args.archive)
+    try:
+        return reparse(
+            db, archive, source=args.source, location=args.location,
+            since=args.since.timestamp() if args.since else None,
+            all_versions=args.all_versions, workers=args.workers, batch_size=args.batch_size
+        )
+    finally:
+        archive.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
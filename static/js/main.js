@@ -3,13 +3,17 @@
 class RentalPlatform {
     constructor() {
         this.listings = [];
+        this.stats = null;
         this.currentSearch = {};
+        this.sourceFilter = null;
+        this.events = null;
         this.init();
     }
 
     init() {
         this.bindEvents();
         this.loadInitialData();
+        this.connectEvents();
     }
 
     bindEvents() {
@@ -46,8 +50,10 @@ class RentalPlatform {
             
             if (data.success) {
                 this.listings = data.listings;
+                this.currentSearch = {};
                 this.displayListings(this.listings);
                 this.updateListingCount(this.listings.length);
+                this.hideFacets();
             } else {
                 this.showToast('Error loading listings: ' + data.error, 'error');
             }
@@ -64,7 +70,8 @@ class RentalPlatform {
             const data = await response.json();
             
             if (data.success) {
-                this.displayStats(data.stats);
+                this.stats = data.stats;
+                this.displayStats(this.stats);
             }
         } catch (error) {
             console.error('Error loading stats:', error);
@@ -76,8 +83,21 @@ class RentalPlatform {
         const bedrooms = document.getElementById('bedrooms').value;
         const minPrice = parseInt(document.getElementById('min-price').value) || 0;
         const maxPrice = parseInt(document.getElementById('max-price').value) || 10000;
+        const amenities = document.getElementById('amenities').value
+            .split(/\s*,\s*|\s+and\s+/i)
+            .map(term => term.trim())
+            .filter(term => term);
 
-        this.currentSearch = { location, bedrooms, min_price: minPrice, max_price: maxPrice };
+        const minBathrooms = parseFloat(document.getElementById('min-bathrooms').value) || null;
+        const minSqft = parseInt(document.getElementById('min-sqft').value) || null;
+        const sort = document.getElementById('sort').value;
+        const sources = this.sourceFilter ? [this.sourceFilter] : [];
+
+        // Filtering, sorting and facet counts all happen on the server
+        this.currentSearch = {
+            location, bedrooms, min_price: minPrice, max_price: maxPrice, amenities,
+            min_bathrooms: minBathrooms, min_sqft: minSqft, sources, sort, facets: true
+        };
 
         try {
             this.showLoading();
@@ -96,6 +116,7 @@ class RentalPlatform {
                 this.listings = data.listings;
                 this.displayListings(this.listings);
                 this.updateListingCount(this.listings.length);
+                this.displayFacets(data.facets);
                 
                 if (this.listings.length === 0) {
                     this.showNoResults();
@@ -132,11 +153,13 @@ class RentalPlatform {
             if (data.success) {
                 this.showToast(data.message, 'success');
                 
-                // Refresh listings after a delay
-                setTimeout(() => {
-                    this.loadListings();
-                    this.loadStats();
-                }, 5000);
+                // Without a live event stream, fall back to refreshing after a delay
+                if (!this.events || this.events.readyState === EventSource.CLOSED) {
+                    setTimeout(() => {
+                        this.loadListings();
+                        this.loadStats();
+                    }, 5000);
+                }
             } else {
                 this.showToast('Scraping error: ' + data.error, 'error');
             }
@@ -145,6 +168,87 @@ class RentalPlatform {
         }
     }
 
+    connectEvents() {
+        if (!window.EventSource) {
+            return;
+        }
+
+        this.events = new EventSource('/api/events');
+
+        this.events.addEventListener('ingest', (e) => {
+            this.applyIngest(JSON.parse(e.data));
+        });
+
+        this.events.addEventListener('scrape_complete', (e) => {
+            const data = JSON.parse(e.data);
+            this.showToast(`Scraping finished for ${data.location}: ${data.count} listings`, 'success');
+        });
+    }
+
+    applyIngest(event) {
+        // New and changed listings move to the top, mirroring the server's newest-first order
+        const incoming = event.new.concat(event.changed).filter(listing => this.matchesCurrentSearch(listing));
+        // Other orders can't be kept up to date by prepending; they refresh on the next search
+        const newestFirst = !this.currentSearch.sort || this.currentSearch.sort === 'newest';
+
+        if (incoming.length > 0 && newestFirst) {
+            const incomingIds = new Set(incoming.map(listing => listing.id));
+            this.listings = incoming
+                .concat(this.listings.filter(listing => !incomingIds.has(listing.id)))
+                .slice(0, 100);
+            this.displayListings(this.listings);
+            this.updateListingCount(this.listings.length);
+        }
+
+        if (this.stats) {
+            this.applyStatsDelta(event.stats_delta);
+            this.displayStats(this.stats);
+        }
+    }
+
+    applyStatsDelta(delta) {
+        this.stats.total_listings = (this.stats.total_listings || 0) + delta.total_listings;
+        this.stats.recent_listings = (this.stats.recent_listings || 0) + delta.recent_listings;
+        this.stats.average_price = Math.round(((this.stats.average_price || 0) + delta.average_price) * 100) / 100;
+
+        const bySource = this.stats.by_source || {};
+        Object.entries(delta.by_source).forEach(([source, change]) => {
+            bySource[source] = (bySource[source] || 0) + change;
+        });
+        this.stats.by_source = bySource;
+    }
+
+    matchesCurrentSearch(listing) {
+        const search = this.currentSearch;
+
+        if (search.location && !(listing.address || '').toLowerCase().includes(search.location.toLowerCase())) {
+            return false;
+        }
+        if (search.min_price > 0 && !(listing.price >= search.min_price)) {
+            return false;
+        }
+        if (search.max_price < 10000 && !(listing.price <= search.max_price)) {
+            return false;
+        }
+        if (search.bedrooms && /^\d+$/.test(search.bedrooms) && listing.bedrooms !== parseInt(search.bedrooms)) {
+            return false;
+        }
+        if (search.min_bathrooms && !(listing.bathrooms >= search.min_bathrooms)) {
+            return false;
+        }
+        if (search.min_sqft && !(listing.square_feet >= search.min_sqft)) {
+            return false;
+        }
+        if (search.sources && search.sources.length > 0 && !search.sources.includes(listing.source)) {
+            return false;
+        }
+        if (search.amenities && search.amenities.length > 0) {
+            const names = (listing.amenities || []).map(name => name.toLowerCase());
+            return search.amenities.every(term => names.some(name => name.includes(term.toLowerCase())));
+        }
+        return true;
+    }
+
     displayListings(listings) {
         const container = document.getElementById('listings-container');
         
@@ -174,8 +278,10 @@ class RentalPlatform {
         
         const sourceClass = listing.source === 'Zillow' ? 'source-zillow' : 'source-apartments';
         
-        const imageHtml = listing.image_url 
-            ? `<img src="${listing.image_url}" class="listing-image" alt="Property image">`
+        // Prefer the locally cached thumbnail over hot-linking the source's CDN
+        const imageSrc = listing.thumbnail || listing.image_url;
+        const imageHtml = imageSrc 
+            ? `<img src="${imageSrc}" class="listing-image" loading="lazy" alt="Property image">`
             : `<div class="no-image-placeholder"><i class="fas fa-home"></i></div>`;
         
         const amenitiesHtml = listing.amenities && listing.amenities.length > 0
@@ -270,6 +376,45 @@ class RentalPlatform {
         `).join('');
     }
 
+    displayFacets(facets) {
+        const container = document.getElementById('search-facets');
+        if (!facets) {
+            this.hideFacets();
+            return;
+        }
+
+        const badge = (label, count) => `<span class="badge bg-light text-dark border me-1 mb-1">${label} <strong>${count}</strong></span>`;
+        const sources = Object.entries(facets.source).map(([source, count]) => `
+            <button type="button" class="btn btn-sm ${source === this.sourceFilter ? 'btn-primary' : 'btn-outline-primary'} me-1 mb-1 facet-source" data-source="${source}">
+                ${source} <span class="badge bg-secondary">${count}</span>
+            </button>
+        `).join('');
+        const bedrooms = Object.entries(facets.bedrooms)
+            .map(([beds, count]) => badge(beds === '0' ? 'Studio' : `${beds} bed`, count)).join('');
+        const prices = facets.price
+            .filter(bucket => bucket.count > 0)
+            .map(bucket => badge(bucket.max ? `$${bucket.min.toLocaleString()}-${bucket.max.toLocaleString()}` : `$${bucket.min.toLocaleString()}+`, bucket.count))
+            .join('');
+
+        container.innerHTML = `
+            <div class="mb-1"><small class="text-muted me-2">${facets.total} matching</small>${sources}</div>
+            <div>${bedrooms}${prices}</div>
+        `;
+        container.classList.remove('d-none');
+
+        // A source button narrows the search to that source; clicking it again clears it
+        container.querySelectorAll('.facet-source').forEach(button => {
+            button.addEventListener('click', () => {
+                this.sourceFilter = button.dataset.source === this.sourceFilter ? null : button.dataset.source;
+                this.performSearch();
+            });
+        });
+    }
+
+    hideFacets() {
+        document.getElementById('search-facets').classList.add('d-none');
+    }
+
     updateListingCount(count) {
         document.getElementById('listing-count').textContent = `${count} listing${count !== 1 ? 's' : ''} found`;
     }
@@ -4,27 +4,69 @@ Test script for Rental Listings Platform
 """
 
 import unittest
+import asyncio
 import json
+import os
+import subprocess
+import sys
 from unittest.mock import patch, MagicMock
-from app import app
-from database.db_manager import DatabaseManager
+from app import create_app
+from database.db_manager import DatabaseManager, parse_amenity_filter
+from database.async_db import AsyncDatabaseManager
+from database.storage import open_database
+from database import serialization
 from scrapers.zillow_scraper import ZillowScraper
 from scrapers.apartments_scraper import ApartmentsScraper
+from scrapers.base import BaseScraper, parse_prices
+from scrapers.health import reset_health
+
+# Set TEST_DATABASE_URL=postgresql://... to run the suite against PostgreSQL
+TEST_DATABASE = os.environ.get('TEST_DATABASE_URL', 'test_listings.db')
+sqlite_only = unittest.skipIf(TEST_DATABASE != 'test_listings.db', "SQLite-specific test")
+
+class PluginScraper(BaseScraper):
+    """Minimal source used to test the scraper registry"""
+    name = 'test'
+    source = 'Test'
+    base_url = 'https://rentals.test'
+    page_delay = (0, 0)
+    
+    def page_url(self, location, page):
+        return f"{self.base_url}/{location.lower()}/{page}"
+    
+    def extract_listings(self, soup):
+        listings = []
+        for unit in soup.find_all('div', class_='unit'):
+            address, price = unit.get_text().split('|')
+            listings.append(dict(self.new_listing(), address=address, price=parse_prices(price)[0]))
+        return listings
+    
+    def has_next_page(self, soup):
+        return soup.find('a', rel='next') is not None
 
 class TestRentalPlatform(unittest.TestCase):
     
     def setUp(self):
         """Set up test fixtures"""
-        self.app = app.test_client()
-        self.app.testing = True
+        self.flask_app = create_app({'DATABASE_PATH': TEST_DATABASE, 'TESTING': True})
+        self.app = self.flask_app.test_client()
         
         # Test database
-        self.test_db = DatabaseManager("test_listings.db")
+        self.test_db = open_database(TEST_DATABASE)
         self.test_db.init_database()
+        
+        # Failed scrapes in one test must not leave a source's circuit open
+        reset_health()
     
     def tearDown(self):
         """Clean up after tests"""
-        import os
+        if self.test_db.dialect == 'postgresql':
+            conn = self.test_db.connect()
+            conn.cursor().execute("DROP TABLE IF EXISTS listing_amenities, amenities, listings CASCADE")
+            conn.commit()
+            conn.close()
+        self.flask_app.extensions['db'].close()
+        self.test_db.close()
         if os.path.exists("test_listings.db"):
             os.remove("test_listings.db")
     
@@ -121,6 +163,876 @@ class TestRentalPlatform(unittest.TestCase):
         stats = self.test_db.get_stats()
         self.assertEqual(stats['total_listings'], 1)
     
+    def test_save_listings_publishes_ingest_events(self):
+        """Test that saves publish only new and changed listings"""
+        listing = {
+            'source': 'Test',
+            'address': '9 Event St, Test City',
+            'price': 2100,
+            'bedrooms': 2,
+            'scraped_at': '2024-01-01T00:00:00'
+        }
+        self.test_db.save_listings([listing])
+        original_id = self.test_db.get_all_listings()[0]['id']
+        
+        subscription = self.test_db.events.subscribe()
+        self.test_db.save_listings([
+            dict(listing, scraped_at='2024-01-02T00:00:00'),
+            dict(listing, bedrooms=3),
+            {'source': 'Test', 'address': '10 Event St, Test City', 'price': 1900,
+             'scraped_at': '2024-01-02T00:00:00'}
+        ])
+        event = subscription.get_nowait()
+        
+        self.assertEqual(event['type'], 'ingest')
+        self.assertEqual([l['address'] for l in event['new']], ['10 Event St, Test City'])
+        self.assertEqual([l['id'] for l in event['changed']], [original_id])
+        self.assertEqual(event['changed'][0]['bedrooms'], 3)
+        self.assertEqual(event['stats_delta']['total_listings'], 1)
+        self.assertEqual(event['stats_delta']['by_source'], {'Test': 1})
+    
+    def test_events_endpoint_streams(self):
+        """Test that the events endpoint opens a server-sent event stream"""
+        response = self.app.get('/api/events', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(next(response.response), b'retry: 5000\n\n')
+        response.close()
+    
+    def test_listing_serialization(self):
+        """Test the fast row conversion and JSON encoding path"""
+        columns = ('id', 'address', 'amenities')
+        rows = [(1, '1 Main St', '["Parking", "Gym"]'), (2, '2 Main St', None), (3, '3 Main St', 'not json')]
+        listings = serialization.rows_to_listings(columns, rows)
+        
+        self.assertEqual(listings[0]['amenities'], ['Parking', 'Gym'])
+        self.assertIsNone(listings[1]['amenities'])
+        self.assertEqual(listings[2]['amenities'], [])
+        self.assertEqual(json.loads(serialization.dumps({'listings': listings, 1: 'x'})),
+                         {'listings': listings, '1': 'x'})
+        
+        self.test_db.save_listings([
+            {'source': 'Test', 'address': '5 Json Ave, Test City', 'price': 1500,
+             'amenities': ['Pool'], 'scraped_at': '2024-01-01T00:00:00'}
+        ])
+        response = self.app.get('/api/listings')
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(json.loads(response.data)['listings'][0]['amenities'], ['Pool'])
+    
+    def test_amenity_filters(self):
+        """Test multi-amenity filtering through the normalized tables"""
+        base = {'source': 'Test', 'bedrooms': 1, 'scraped_at': '2024-01-01T00:00:00'}
+        self.test_db.save_listings([
+            dict(base, address='1 Amenity Rd, Test City', price=1500, amenities=['Garage Parking', 'In-Unit Laundry']),
+            dict(base, address='2 Amenity Rd, Test City', price=1600, amenities=['Street Parking']),
+            dict(base, address='3 Amenity Rd, Test City', price=1700)
+        ])
+        
+        self.assertEqual(parse_amenity_filter('parking AND laundry'), ['parking', 'laundry'])
+        results = self.test_db.search_listings(amenities=['parking', 'laundry'])
+        self.assertEqual([l['address'] for l in results], ['1 Amenity Rd, Test City'])
+        self.assertEqual(len(self.test_db.search_listings(amenities=['PARKING'])), 2)
+        
+        # Changing a listing's amenities re-links it
+        self.test_db.save_listings([
+            dict(base, address='2 Amenity Rd, Test City', price=1600, amenities=['Street Parking', 'Laundry Room'])
+        ])
+        self.assertEqual(len(self.test_db.search_listings(amenities=['parking', 'laundry'])), 2)
+        
+        response = self.app.post('/api/search',
+                               data=json.dumps({'amenities': 'garage and laundry'}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['count'], 1)
+    
+    def test_search_sort_filters_and_facets(self):
+        """Test server-side sorts, bathroom/size/source filters and facet counts"""
+        base = {'scraped_at': '2024-01-01T00:00:00'}
+        self.test_db.save_listings([
+            dict(base, source='Zillow', address='1 Facet St, Facet City', price=900, bedrooms=0, bathrooms=1, square_feet=450),
+            dict(base, source='Zillow', address='2 Facet St, Facet City', price=2400, bedrooms=2, bathrooms=2, square_feet=1200),
+            dict(base, source='Apartments.com', address='3 Facet St, Facet City', price=1800, bedrooms=1, bathrooms=1.5, square_feet=600),
+            dict(base, source='Apartments.com', address='4 Facet St, Facet City', price=5000, bedrooms=2, bathrooms=2),
+            dict(base, source='Zillow', address='5 Facet St, Facet City', bedrooms=3),
+            dict(base, source='Zillow', address='6 Facet St, Facet City', price='Call for pricing', bedrooms=3, square_feet=1500)
+        ])
+        
+        def addresses(**options):
+            return [int(l['address'].split()[0]) for l in self.test_db.search_listings('Facet City', **options)]
+        
+        # A text price is unknown to every sort, like a missing one
+        self.assertEqual(addresses(sort='price_asc'), [1, 3, 2, 4, 6, 5])
+        self.assertEqual(addresses(sort='price_desc'), [4, 2, 3, 1, 6, 5])
+        # $2.00, $2.00 then $3.00 per sq ft; listings without a size come last
+        self.assertEqual(addresses(sort='price_per_sqft')[2:3], [3])
+        self.assertEqual(set(addresses(sort='price_per_sqft')[3:]), {4, 5, 6})
+        self.assertEqual(addresses(sort='price_asc', min_bathrooms=1.5), [3, 2, 4])
+        self.assertEqual(addresses(sort='price_asc', min_sqft=500, max_sqft=1000), [3])
+        self.assertEqual(addresses(sort='price_asc', sources=['Apartments.com']), [3, 4])
+        
+        facets = self.test_db.search_facets('Facet City')
+        self.assertEqual(facets['total'], 6)
+        self.assertEqual(facets['bedrooms'], {'0': 1, '1': 1, '2': 2, '3': 2})
+        self.assertEqual(facets['source'], {'Zillow': 4, 'Apartments.com': 2})
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 0, 1, 1, 0, 0, 1])
+        self.assertEqual(facets['price'][-1], {'min': 4000, 'max': None, 'count': 1})
+        self.assertEqual(self.test_db.search_facets('Facet City', sources=['Zillow'])['bedrooms'], {'0': 1, '2': 1, '3': 2})
+        
+        response = self.app.post('/api/search', json={
+            'location': 'Facet City', 'sort': 'price_desc', 'min_bathrooms': '1.5', 'sources': 'Zillow, Apartments.com',
+            'facets': True
+        })
+        data = json.loads(response.data)
+        self.assertEqual([int(l['address'].split()[0]) for l in data['listings']], [4, 2, 3])
+        self.assertEqual(data['sort'], 'price_desc')
+        self.assertEqual(data['facets']['total'], 3)
+        self.assertNotIn('facets', json.loads(self.app.post('/api/search', json={'location': 'Facet City'}).data))
+        
+        self.assertEqual(self.app.post('/api/search', json={'sort': 'cheapest'}).status_code, 400)
+        self.assertEqual(self.app.post('/api/search', json={'min_sqft': 'big'}).status_code, 400)
+        # A location that is not a string is refused before it counts as demand
+        self.assertEqual(self.app.post('/api/search', json={'location': ['Austin, TX']}).status_code, 400)
+        self.assertEqual(self.flask_app.extensions['scheduler'].demand('Austin, TX'), 0)
+    
+    def test_geo_search(self):
+        """Test radius and map-bounds searches through the R*Tree index"""
+        base = {'source': 'Test', 'scraped_at': '2024-01-01T00:00:00'}
+        self.test_db.save_listings([
+            # Times Square, ~1 mile from Union Square, and Brooklyn
+            dict(base, address='1 Times Sq, New York, NY', price=3000, latitude=40.7580, longitude=-73.9855),
+            dict(base, address='2 Union Sq, New York, NY', price=2800, latitude=40.7359, longitude=-73.9911),
+            dict(base, address='3 Prospect Park, Brooklyn, NY', price=2500, latitude=40.6602, longitude=-73.9690),
+            dict(base, address='4 Unknown St, New York, NY', price=2000)
+        ])
+        
+        nearby = self.test_db.search_listings(near=(40.7580, -73.9855, 2))
+        self.assertEqual(sorted(l['address'] for l in nearby),
+                         ['1 Times Sq, New York, NY', '2 Union Sq, New York, NY'])
+        self.assertLess(max(l['distance_miles'] for l in nearby), 2)
+        
+        in_box = self.test_db.search_listings(bounds=(40.60, 40.70, -74.0, -73.9))
+        self.assertEqual([l['address'] for l in in_box], ['3 Prospect Park, Brooklyn, NY'])
+        
+        # Moving a listing updates the index through the triggers
+        self.test_db.save_listings([
+            dict(base, address='3 Prospect Park, Brooklyn, NY', price=2500, latitude=40.7570, longitude=-73.9860)
+        ])
+        self.assertEqual(len(self.test_db.search_listings(near=(40.7580, -73.9855, 2))), 3)
+        
+        response = self.app.post('/api/search',
+                               data=json.dumps({'latitude': 40.7580, 'longitude': -73.9855, 'radius_miles': 0.5}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['count'], 2)
+        # Rows encoded by the database read back as the listing dictionaries
+        self.assertEqual(json.loads(response.data)['listings'],
+                         self.test_db.search_listings(near=(40.7580, -73.9855, 0.5)))
+        self.assertEqual(json.loads(self.app.get('/api/listings').data)['listings'], self.test_db.get_all_listings())
+        
+        response = self.app.post('/api/search',
+                               data=json.dumps({'radius_miles': 2}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_analytics_summary(self):
+        """Test vectorized aggregations over the columnar snapshot"""
+        from database.analytics import ListingAnalytics
+        
+        base = {'scraped_at': '2024-01-01T00:00:00', 'bedrooms': 1}
+        self.test_db.save_listings([
+            dict(base, source='Zillow', address='1 A St, Austin, TX', price=1000, square_feet=500),
+            dict(base, source='Zillow', address='2 A St, Austin, TX', price=2000, square_feet=1000),
+            dict(base, source='Apartments.com', address='3 A St, Austin, TX', price=4000, bedrooms=2),
+            dict(base, source='Apartments.com', address='4 B St, Boston, MA 02110', price='$3,000/mo')
+        ])
+        
+        summary = ListingAnalytics(self.test_db).summary()
+        
+        self.assertEqual(summary['listing_count'], 4)
+        self.assertEqual(summary['median_rent_by_city'][0],
+                         {'city': 'Austin, TX', 'median_price': 2000.0, 'count': 3})
+        self.assertEqual(summary['price_per_sqft']['p50'], 2.0)
+        by_source = {row['source']: row for row in summary['by_source']}
+        self.assertEqual(by_source['Zillow']['mean_price'], 1500.0)
+        self.assertEqual(by_source['Apartments.com']['count'], 2)
+        
+        # PostgreSQL's typed column keeps the number of a text price; SQLite
+        # stores the text, which analytics counts as no price
+        boston = next(l for l in self.test_db.get_all_listings() if 'Boston' in l['address'])
+        median_by_bedrooms = [row['median_price'] for row in summary['median_rent_by_bedrooms']]
+        if self.test_db.dialect == 'postgresql':
+            self.assertEqual(boston['price'], 3000)
+            self.assertEqual(median_by_bedrooms, [2000.0, 4000.0])
+            self.assertEqual(by_source['Apartments.com']['mean_price'], 3500.0)
+        else:
+            self.assertEqual(boston['price'], '$3,000/mo')
+            self.assertEqual(median_by_bedrooms, [1500.0, 4000.0])
+            self.assertEqual(by_source['Apartments.com']['mean_price'], 4000.0)
+        
+        response = self.app.get('/api/analytics')
+        self.assertTrue(json.loads(response.data)['success'])
+    
+    def test_bulk_import_export_round_trip(self):
+        """Test streaming NDJSON and CSV export/import in small chunks"""
+        import gzip
+        import io
+        import tempfile
+        from database import bulk
+        
+        self.test_db.save_listings([
+            {'source': 'Test', 'address': f'{i} Bulk St, Test City', 'price': 1000 + i, 'bathrooms': 1.5,
+             'amenities': ['Gym'] if i % 2 else None, 'scraped_at': '2024-01-01T00:00:00'}
+            for i in range(7)
+        ])
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('listings.ndjson.gz', 'listings.csv'):
+                path = os.path.join(tmp, name)
+                progress = bulk.Progress('Exported', stream=io.StringIO())
+                self.assertEqual(bulk.export_listings(self.test_db, path, batch_size=3, progress=progress), 7)
+                if name.endswith('.ndjson.gz'):
+                    # Lines encoded by the query match the listings the store returns
+                    with gzip.open(path, 'rt') as f:
+                        exported = [json.loads(line) for line in f]
+                    self.assertEqual(exported, sorted(self.test_db.get_all_listings(), key=lambda l: l['id']))
+                
+                target = DatabaseManager(os.path.join(tmp, name + '.db'))
+                target.init_database()
+                progress = bulk.Progress('Imported', stream=io.StringIO())
+                self.assertEqual(bulk.import_listings(target, path, batch_size=3, progress=progress),
+                                 {'read': 7, 'saved': 7})
+                self.assertIn('7 rows, 7 saved', progress.stream.getvalue())
+                
+                imported = target.search_listings(amenities=['gym'])
+                self.assertEqual(len(imported), 3)
+                self.assertEqual(imported[0]['bathrooms'], 1.5)
+                self.assertEqual(target.get_stats()['total_listings'], 7)
+            
+            # Rows the database did not save fail the command
+            with patch.object(DatabaseManager, 'save_listings', return_value=2), patch('sys.stderr', io.StringIO()):
+                with self.assertRaises(SystemExit) as exit:
+                    bulk.main(['--db', os.path.join(tmp, 'failed.db'), 'import', path])
+            self.assertEqual(str(exit.exception), "Only 2 of 7 rows were saved")
+    
+    @sqlite_only
+    def test_retention_worker(self):
+        """Test batched expiry with archiving and compaction"""
+        import sqlite3
+        from datetime import datetime
+        from database.retention import RetentionWorker
+        
+        self.test_db.save_listings([
+            {'source': 'Test', 'address': f'{i} Old St, Test City', 'price': 1000 + i,
+             'amenities': ['Pool'], 'scraped_at': '2024-01-01T00:00:00'}
+            for i in range(12)
+        ])
+        conn = sqlite3.connect('test_listings.db')
+        conn.execute("UPDATE listings SET created_at = datetime('now', '-40 days') WHERE price < 1010")
+        conn.commit()
+        conn.close()
+        
+        worker = RetentionWorker(self.test_db, days=30, batch_size=3, pause=0, quiet_hours=(2, 5))
+        report = worker.run_once(now=datetime(2024, 1, 1, 3))
+        
+        self.assertEqual(report['deleted'], 10)
+        self.assertTrue(report['compacted'])
+        self.assertGreaterEqual(report['reclaimed_bytes'], 0)
+        self.assertEqual(self.test_db.get_stats()['total_listings'], 2)
+        self.assertEqual(len(self.test_db.search_listings(amenities=['pool'])), 2)
+        
+        conn = sqlite3.connect('test_listings.db')
+        archived = conn.execute("SELECT COUNT(*), MIN(address) FROM listings_archive").fetchone()
+        conn.close()
+        self.assertEqual(archived, (10, '0 Old St, Test City'))
+        
+        # Outside quiet hours nothing is compacted
+        self.assertFalse(worker.run_once(now=datetime(2024, 1, 1, 12))['compacted'])
+        
+        conn = sqlite3.connect('test_listings.db')
+        conn.execute("UPDATE listings SET created_at = datetime('now', '-40 days')")
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.test_db.clean_old_listings(days=30), 2)
+    
+    def test_storage_upserts_keep_ids(self):
+        """Test batch upserts on the configured storage backend"""
+        listing = {'source': 'Test', 'address': '5 Upsert St, Austin, TX', 'price': 1800,
+                   'bedrooms': 1, 'amenities': ['Gym'], 'scraped_at': '2024-01-01T00:00:00'}
+        
+        # Duplicates within a batch collapse to the last occurrence, and
+        # count as saved on every backend
+        self.assertEqual(self.test_db.save_listings([listing, dict(listing, bedrooms=2)]), 2)
+        saved = self.test_db.get_all_listings()
+        self.assertEqual([row['bedrooms'] for row in saved], [2])
+        self.assertEqual(saved[0]['city'], 'Austin, TX')
+        
+        # Unchanged and changed re-saves update in place
+        self.test_db.save_listings([dict(listing, bedrooms=2, scraped_at='2024-01-02T00:00:00')])
+        self.test_db.save_listings([dict(listing, bedrooms=2, amenities=['Pool'])])
+        updated = self.test_db.get_all_listings()
+        self.assertEqual([row['id'] for row in updated], [saved[0]['id']])
+        self.assertEqual(len(self.test_db.search_listings(amenities=['pool'])), 1)
+        self.assertEqual(self.test_db.search_listings(amenities=['gym']), [])
+        self.assertEqual(self.test_db.dialect, 'postgresql' if '://' in TEST_DATABASE else 'sqlite')
+    
+    @sqlite_only
+    def test_sharded_storage(self):
+        """Test per-metro shards with fan-out search and merged stats"""
+        import io
+        import tempfile
+        from database import bulk
+        from database.analytics import ListingAnalytics
+        from database.listing_index import ListingIndex
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db = open_database(tmp + os.sep, metros={'Brooklyn, NY': 'nyc'})
+            db.init_database()
+            db.save_listings([
+                {'source': 'Zillow', 'address': '1 A St, Austin, TX', 'price': 1000, 'bedrooms': 1,
+                 'amenities': ['Gym'], 'scraped_at': '2024-01-01T00:00:00'},
+                {'source': 'Zillow', 'address': '2 B St, Dallas, TX 75201', 'price': 2000, 'bedrooms': 2,
+                 'scraped_at': '2024-01-01T00:00:00'},
+                {'source': 'Apartments.com', 'address': '3 C St, Brooklyn, NY', 'price': 3000, 'bedrooms': 1,
+                 'amenities': ['Gym'], 'scraped_at': '2024-01-01T00:00:00'}
+            ])
+            
+            self.assertEqual(sorted(db.shards()), ['nyc', 'tx'])
+            listings = db.get_all_listings()
+            self.assertEqual(len({listing['id'] for listing in listings}), 3)
+            self.assertEqual(len(db.search_listings('Austin, TX')), 1)
+            self.assertEqual(len(db.search_listings(amenities=['gym'])), 2)
+            
+            stats = db.get_stats()
+            self.assertEqual(stats['total_listings'], 3)
+            self.assertEqual(stats['average_price'], 2000)
+            self.assertEqual(stats['by_source'], {'Zillow': 2, 'Apartments.com': 1})
+            self.assertEqual(stats['shards'], {'nyc': 1, 'tx': 2})
+            
+            # One ingest event per batch, with the store-wide stats change
+            # merged from each shard's own, not from store-wide get_stats()
+            subscription = db.events.subscribe()
+            states = ['CA', 'CO', 'FL', 'GA', 'IL', 'MA', 'OR', 'PA', 'WA', 'AZ']
+            with patch.object(db, 'get_stats', side_effect=AssertionError("store-wide stats during a save")):
+                db.save_listings([
+                    {'source': 'Zillow', 'address': f'{n} D St, Town, {state}', 'price': 4600,
+                     'scraped_at': '2024-01-02T00:00:00'}
+                    for n, state in enumerate(states)
+                ])
+            event = subscription.get_nowait()
+            self.assertEqual(len(event['new']), 10)
+            self.assertEqual(event['stats_delta']['total_listings'], 10)
+            self.assertEqual(event['stats_delta']['average_price'], 2000)
+            self.assertTrue(subscription.empty())
+            self.assertEqual(len(db.shards()), 12)
+            
+            # Whole-table readers go shard by shard, past the attach limit
+            self.assertEqual(ListingAnalytics(db).summary()['listing_count'], 13)
+            self.assertEqual(ListingIndex(db).load(), 13)
+            path = os.path.join(tmp, 'export.csv')
+            progress = bulk.Progress('Exported', stream=io.StringIO())
+            self.assertEqual(bulk.export_listings(db, path, batch_size=4, progress=progress), 13)
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 14)
+            
+            # Locations match as substrings, as unsharded: a metro's search
+            # also finds similarly named cities in its state's shard
+            db.save_listings([{'source': 'Zillow', 'address': '5 E St, East Brooklyn, NY', 'price': 1800,
+                               'scraped_at': '2024-01-03T00:00:00'}])
+            self.assertIn('ny', db.shards())
+            self.assertEqual(len(db.search_listings('Brooklyn, NY')), 2)
+            self.assertEqual(len(db.search_listings('East Brooklyn, NY')), 1)
+            db.close()
+    
+    def test_adaptive_scheduler(self):
+        """Test churn and demand driven intervals under a request budget"""
+        from scheduler import AdaptiveScheduler
+        
+        scraper = MagicMock()
+        scraper.iter_listings.side_effect = lambda location, max_pages: [
+            {'source': 'Zillow', 'address': f'{i} Main St, {location}', 'price': 1500 + i,
+             'scraped_at': '2024-01-01T00:00:00'}
+            for i in range(4)
+        ]
+        
+        # Budget for two locations (2 sources x 5 pages each)
+        scheduler = AdaptiveScheduler(self.test_db, locations=['Austin, TX', 'Boston, MA', 'Denver, CO'],
+                                      requests_per_hour=20, max_workers=2)
+        for _ in range(5):
+            scheduler.record_search('boston, ma')
+        
+        with patch('scrapers.get_scraper', return_value=scraper):
+            futures = scheduler.run_pending()
+            self.assertEqual(len(futures), 2)
+            self.assertEqual([future.result() for future in futures], [8, 8])
+        
+        status = {row['location']: row for row in scheduler.status()['locations']}
+        # Searched-for Boston went first; all-new listings mean full churn
+        self.assertGreater(status['Boston, MA']['demand'], 4)
+        self.assertEqual(status['Austin, TX']['churn'], 0.3)
+        self.assertLess(status['Boston, MA']['interval_minutes'], status['Austin, TX']['interval_minutes'])
+        self.assertLess(status['Austin, TX']['interval_minutes'], 360)
+        self.assertFalse(status['Denver, CO']['last_count'])
+        self.assertEqual(self.test_db.get_stats()['total_listings'], 8)
+        
+        # Churn is measured against every stored listing, not a capped search
+        self.test_db.save_listings([
+            {'source': 'Zillow', 'address': f'{i} Main St, Denver, CO', 'price': 1500 + i, 'scraped_at': '2024-01-01T00:00:00'}
+            for i in range(151)
+        ])
+        self.assertEqual(len(self.test_db.get_listing_keys('Denver, CO')), 151)
+        with patch('scrapers.get_scraper', return_value=scraper):
+            scheduler._run_job(scheduler.add_location('Denver, CO'))
+        self.assertEqual(scheduler.add_location('Denver, CO').churn, 0)
+        
+        # Searches through the API count as demand too
+        self.app.post('/api/search', data=json.dumps({'location': 'chicago, il'}), content_type='application/json')
+        response = self.app.get('/api/schedule')
+        demand = {row['location']: row['demand'] for row in json.loads(response.data)['schedule']['locations']}
+        self.assertGreater(demand['Chicago, IL'], 0.9)
+    
+    def test_search_cache_and_demand_warming(self):
+        """Test cached searches, write invalidation and demand-driven scrapes"""
+        from scheduler import AdaptiveScheduler
+        from database.search_cache import SearchCache
+        
+        cache = SearchCache(self.test_db)
+        listing = {'source': 'Test', 'address': '1 Warm St, Austin, TX', 'price': 1200,
+                   'scraped_at': '2024-01-01T00:00:00'}
+        self.test_db.save_listings([listing])
+        
+        self.assertEqual(cache.warm(['Austin, TX', 'Reno, NV']), 2)
+        self.assertEqual(len(cache.search(' austin, tx')), 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        
+        # Any write empties the cache
+        self.test_db.save_listings([dict(listing, address='2 Warm St, Austin, TX')])
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(len(cache.search('Austin, TX')), 2)
+        
+        # Writes from another process are noticed through data_version, or
+        # on PostgreSQL, which has none, once the entries expire
+        other = open_database(TEST_DATABASE)
+        other.save_listings([dict(listing, address='3 Warm St, Austin, TX')])
+        other.close()
+        if self.test_db.data_version() is None:
+            cache.ttl = 0
+        self.assertEqual(len(cache.search('Austin, TX')), 3)
+        cache.ttl = 0
+        misses = cache.stats()['misses']
+        cache.search('Austin, TX')
+        self.assertEqual(cache.stats()['misses'], misses + 1)
+        
+        scheduler = AdaptiveScheduler(self.test_db, locations=['Austin, TX'])
+        scheduler.add_location('Austin, TX').next_run = float('inf')
+        scheduler.record_search('Reno, NV')
+        scheduler.record_search('Austin, TX')
+        self.test_db.save_listings([dict(listing, address='1 Held St, Denver, CO')])
+        for _ in range(2):
+            scheduler.record_search('no such place')
+            scheduler.record_search('Denver, CO')
+        
+        # A repeated search for a city without data schedules it; known
+        # locations need promote_demand searches before they are pulled
+        # forward, and strings that name no city are never scraped
+        with patch.object(self.test_db, 'search_listings', wraps=self.test_db.search_listings) as search:
+            self.assertEqual(scheduler.promote_demand_locations(), [])
+            scheduler.record_search('reno, nv')
+            self.assertEqual(scheduler.promote_demand_locations(), ['Reno, NV'])
+        # Whether a location has data is looked up once, not on every pass
+        self.assertEqual(sorted(call.args for call in search.call_args_list), [('Denver, CO',), ('Reno, NV',)])
+        for _ in range(3):
+            scheduler.record_search('austin, tx')
+        self.assertEqual(scheduler.promote_demand_locations(), ['Austin, TX'])
+        status = {row['location']: row for row in scheduler.status()['locations']}
+        self.assertTrue(status['Reno, NV']['on_demand'])
+        self.assertEqual(status['Austin, TX']['next_run_in_minutes'], 0)
+        self.assertEqual(scheduler.top_locations(1), ['Austin, TX'])
+    
+    def test_batch_writer_streams_with_backpressure(self):
+        """Test that streamed listings are saved in batches while producers are throttled"""
+        import threading
+        import time
+        from database.batch_writer import BatchWriter
+        
+        def listing(n):
+            return {'source': 'Test', 'address': f'{n} Stream St, Test City', 'price': 1000 + n,
+                    'scraped_at': '2024-01-01T00:00:00'}
+        
+        with BatchWriter(self.test_db, batch_size=3, flush_interval=0.05) as writer:
+            for n in range(7):
+                writer.add(listing(n))
+            # A partial batch is flushed after flush_interval, before close()
+            time.sleep(0.5)
+            self.assertEqual(self.test_db.get_stats()['total_listings'], 7)
+        self.assertEqual(writer.stats(), {'received': 7, 'saved': 7, 'batches': 3, 'failed': 0})
+        
+        # While the store is stuck, at most max_pending listings wait and add() blocks
+        release = threading.Event()
+        store = MagicMock()
+        store.save_listings.side_effect = lambda batch: release.wait() and len(batch)
+        writer = BatchWriter(store, batch_size=1, max_pending=2)
+        producer = threading.Thread(target=lambda: [writer.add(listing(n)) for n in range(6)])
+        producer.start()
+        producer.join(timeout=0.3)
+        self.assertTrue(producer.is_alive())
+        release.set()
+        producer.join()
+        self.assertEqual(writer.close()['saved'], 6)
+    
+    def test_listing_index_matches_database(self):
+        """Test that the in-memory index answers searches like the database"""
+        import threading
+        import time
+        from database.listing_index import ListingIndex
+        
+        listings = [
+            {'source': 'Test', 'address': f'{n} Index Ave, {city}', 'price': 1000 + n * 50,
+             'bedrooms': n % 3, 'scraped_at': '2024-01-01T00:00:00'}
+            for n, city in enumerate(['Springfield, IL', 'West Springfield, IL', 'Dover, DE'] * 4)
+        ]
+        listings.append({'source': 'Test', 'address': '99 Index Ave, Dover, DE', 'price': 'Call',
+                         'scraped_at': '2024-01-01T00:00:00'})
+        self.test_db.save_listings(listings)
+        
+        index = ListingIndex(self.test_db)
+        self.assertEqual(index.load(), len(listings))
+        
+        def ids(results):
+            return sorted(listing['id'] for listing in results)
+        
+        searches = [
+            {},
+            {'location': 'springfield, il'},
+            {'location': 'Dover, DE', 'min_price': 1100},
+            {'max_price': 1300, 'bedrooms': '1'},
+        ]
+        for search in searches:
+            self.assertEqual(ids(index.search(**search)), ids(self.test_db.search_listings(**search)))
+
+        # A location walks its cities' rows newest first, across chunks
+        with patch('database.listing_index.SCAN_CHUNK', 2):
+            self.assertEqual([listing['id'] for listing in index.search(location='Springfield, IL', limit=5)],
+                             [listing['id'] for listing in self.test_db.search_listings('Springfield, IL')][:5])
+
+        # Writes and deletes reach the index through the store's events
+        self.test_db.save_listings([dict(listings[0], price=900)])
+        oldest = index.search()[-1]['id']
+        self.test_db.events.notify({'type': 'write', 'count': 1, 'deleted': [oldest]})
+        self.assertNotIn(oldest, ids(index.search()))
+        results = index.search(location='Springfield, IL')
+        self.assertIn(900, [listing['price'] for listing in results])
+        self.assertEqual(index.stats()['listings'], len(listings))
+        
+        # A write that cannot be read back reloads the index off the writer's
+        # thread; searches go to the database until the reload is done
+        release = threading.Event()
+        load = index.load
+        with patch.object(index, 'load', side_effect=lambda: release.wait(5) and load()):
+            self.test_db.events.notify({'type': 'write', 'count': 1, 'ids': [10 ** 9]})
+            self.assertTrue(index.stats()['dirty'])
+            self.assertIsNone(index.search())
+            self.test_db.save_listings([dict(listings[1], bedrooms=5)])
+            release.set()
+            deadline = time.time() + 5
+            while index.stats()['dirty'] and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertFalse(index.stats()['dirty'])
+        self.assertEqual(ids(index.search()), ids(self.test_db.search_listings()))
+        self.assertIn(5, [listing['bedrooms'] for listing in index.search()])
+        
+        # Free-text locations and amenity filters go to the database
+        self.assertIsNone(index.search(location='Index Ave'))
+        self.assertIsNone(index.search(amenities=['pool']))
+        self.assertEqual(len(index.search_listings(location='Index Ave')), len(listings) + 1)
+        self.assertEqual(index.stats()['fallbacks'], 1)
+
+        # Record strings count towards the index's size
+        before = index.memory_bytes()
+        self.test_db.save_listings([dict(listings[2], description='x' * 100000)])
+        self.assertGreater(index.memory_bytes() - before, 100000)
+
+    @sqlite_only
+    def test_read_snapshot_serves_reads(self):
+        """Test that reads come from a snapshot that is swapped in after writes"""
+        import sqlite3
+        import threading
+        import time
+        from starlette.testclient import TestClient
+        from asgi import create_asgi_app
+        
+        snapshot = 'test_listings.snapshot.db'
+        replicated = open_database(TEST_DATABASE, snapshot_path=snapshot, min_interval=0)
+        events = []
+        replicated.events.add_listener(events.append)
+        try:
+            replicated.init_database()
+            self.assertEqual(replicated.generation, 1)
+            listing = {'source': 'Test', 'address': '1 Replica Rd, Test City', 'price': 1500,
+                       'bedrooms': 1, 'scraped_at': '2024-01-01T00:00:00'}
+            
+            # Hold the publisher back so the write is not visible yet
+            with replicated._publish_lock:
+                self.assertEqual(replicated.save_listings([listing]), 1)
+                self.assertEqual(replicated.search_listings('Replica Rd'), [])
+                self.assertEqual(events, [])
+            
+            deadline = time.time() + 5
+            while not events and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(replicated.generation, 2)
+            self.assertEqual(events[0]['count'], 1)
+            results = replicated.search_listings('Replica Rd')
+            self.assertEqual(results[0]['id'], events[0]['ids'][0])
+            self.assertEqual(replicated.get_stats()['snapshot']['generation'], 2)
+            
+            # Cached reads are keyed to the snapshot that answered them
+            self.assertEqual(replicated.data_version(), 2)
+            asgi_client = TestClient(create_asgi_app({'DATABASE_PATH': TEST_DATABASE, 'READ_SNAPSHOT_PATH': snapshot}))
+            self.assertEqual(asgi_client.post('/api/search', json={'location': 'Replica Rd'}).json()['count'], 1)
+            
+            # The copy reads the WAL primary alongside ingest commits
+            saved = []
+            def copy(source, target):
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM listings").fetchone()
+                started = time.perf_counter()
+                saver = threading.Thread(target=lambda: saved.append(
+                    replicated.save_listings([dict(listing, address='2 Replica Rd, Test City')])
+                ))
+                saver.start()
+                saver.join(10)
+                saved.append(time.perf_counter() - started)
+                source.backup(target)
+                source.commit()
+            with patch.object(replicated, '_copy', side_effect=copy):
+                self.assertEqual(replicated.publish(), 3)
+            self.assertEqual(saved[0], 1)
+            self.assertLess(saved[1], 1)
+            # The ASGI app's cache notices the snapshot being replaced
+            deadline = time.time() + 5
+            while len(replicated.search_listings('Replica Rd')) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(asgi_client.post('/api/search', json={'location': 'Replica Rd'}).json()['count'], 2)
+            asgi_client.app.state.db.db.close()
+            
+            # Snapshot connections are read-only
+            conn = replicated.connect()
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM listings")
+            conn.close()
+        finally:
+            replicated.close()
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+    
+    def test_image_prefetch_and_media_cache(self):
+        """Test that saved listings' images are cached, served by hash and evicted LRU"""
+        import hashlib
+        import io
+        import shutil
+        import tempfile
+        import time
+        import media
+        from media import MediaCache
+        
+        media_dir = tempfile.mkdtemp()
+        stub = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+        Image = media.pillow()
+        if Image is not None:
+            output = io.BytesIO()
+            Image.new('RGB', (800, 600), 'teal').save(output, 'PNG')
+            png = output.getvalue()
+        else:
+            png = stub
+        thumbnail, extension = media.make_thumbnail(png)
+        flask_app = create_app({'DATABASE_PATH': TEST_DATABASE, 'TESTING': True, 'MEDIA_CACHE_DIR': media_dir})
+        client = flask_app.test_client()
+        prefetcher = flask_app.extensions['image_prefetcher']
+        try:
+            with patch.object(prefetcher, '_download', return_value=png) as download:
+                prefetcher.start(backfill=0)
+                flask_app.extensions['db'].save_listings([
+                    {'source': 'Test', 'address': f'{n} Photo Ln, Test City', 'price': 1500 + n,
+                     'image_url': 'https://cdn.test/shared.png', 'scraped_at': '2024-01-01T00:00:00'}
+                    for n in range(2)
+                ])
+                deadline = time.time() + 5
+                while prefetcher.stats()['fetched'] < 1 and time.time() < deadline:
+                    time.sleep(0.01)
+                prefetcher.stop()
+            # Both listings share one image, downloaded once
+            download.assert_called_once_with('https://cdn.test/shared.png')
+            
+            listings = client.get('/api/listings').get_json()['listings']
+            self.assertEqual({listing['thumbnail'] for listing in listings},
+                             {f"/media/{hashlib.sha256(thumbnail).hexdigest()}"})
+            
+            response = client.get(listings[0]['thumbnail'])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, thumbnail)
+            self.assertEqual(response.mimetype, media.MIMETYPES[extension])
+            self.assertIn('immutable', response.headers['Cache-Control'])
+            response.close()
+            self.assertEqual(client.get('/media/' + '0' * 64).status_code, 404)
+            
+            # With Pillow images are scaled down to JPEG thumbnails
+            if Image is not None:
+                with Image.open(io.BytesIO(thumbnail)) as image:
+                    self.assertEqual((image.format, image.size), ('JPEG', (400, 300)))
+                self.assertIsNone(media.make_thumbnail(stub))
+            # Without it small images are kept as they are and large ones skipped
+            with patch('media.pillow', return_value=None):
+                self.assertEqual(media.make_thumbnail(stub), (stub, 'png'))
+                self.assertIsNone(media.make_thumbnail(stub, max_original_bytes=len(stub) - 1))
+            
+            # The least recently served file goes first once the cache is full
+            cache = MediaCache(tempfile.mkdtemp(dir=media_dir), max_bytes=250)
+            first = cache.put('https://cdn.test/1.png', stub + b'1', 'png')
+            second = cache.put('https://cdn.test/2.png', stub + b'2', 'png')
+            self.assertIsNotNone(cache.get(first))
+            cache.put('https://cdn.test/3.png', stub + b'3', 'png')
+            self.assertIsNone(cache.get(second))
+            self.assertEqual(set(cache.lookup(['https://cdn.test/1.png', 'https://cdn.test/2.png'])),
+                             {'https://cdn.test/1.png'})
+        finally:
+            flask_app.extensions['db'].close()
+            shutil.rmtree(media_dir)
+    
+    @sqlite_only
+    def test_query_profile_and_index_advisor(self):
+        """Test that profiled queries yield plans, timings and index recommendations"""
+        from database.index_advisor import main as advise
+        
+        response = self.app.get('/api/debug/queries')
+        self.assertEqual(response.status_code, 404)
+        
+        self.test_db.save_listings([
+            {'source': 'Test', 'address': f'{n} Plan St, Test City', 'price': 1000 + n,
+             'bedrooms': n % 4, 'scraped_at': '2024-01-01T00:00:00'}
+            for n in range(50)
+        ])
+        profiled = create_app({'DATABASE_PATH': TEST_DATABASE, 'TESTING': True, 'QUERY_PROFILE': True})
+        client = profiled.test_client()
+        for bedrooms in ('1', '2'):
+            response = client.post('/api/search', json={'bedrooms': bedrooms})
+            self.assertEqual(response.get_json()['count'], 13 if bedrooms == '1' else 12)
+        
+        report = client.get('/api/debug/queries?reset=1').get_json()
+        self.assertTrue(report['success'])
+        search = next(query for query in report['queries'] if 'bedrooms = ?' in query['shape'])
+        self.assertEqual(search['calls'], 2)
+        self.assertTrue(search['plan'])
+        self.assertTrue(search['temp_sort'])
+        recommendation = report['recommendations'][0]
+        self.assertEqual(recommendation['columns'], ['bedrooms', 'created_at'])
+        self.assertEqual(recommendation['redundant'], ['idx_bedrooms'])
+        self.assertEqual(client.get('/api/debug/queries').get_json()['queries'], [])
+        
+        workload = 'test_workload.json'
+        with open(workload, 'w') as f:
+            json.dump(report, f)
+        try:
+            with patch('builtins.print'):
+                self.assertEqual(advise(['--db', TEST_DATABASE, '--workload', workload, '--apply']), report['recommendations'])
+                # Once created, the index is not recommended again
+                self.assertEqual(advise(['--db', TEST_DATABASE, '--workload', workload]), [])
+        finally:
+            os.remove(workload)
+        profiled.extensions['db'].close()
+    
+    def test_import_is_lightweight(self):
+        """Test that importing the app stays cheap and loads no scraper or optional dependencies"""
+        code = (
+            "import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import app\n"
+            "elapsed = time.perf_counter() - start\n"
+            "heavy = ('requests', 'bs4', 'PIL', 'numpy', 'media', 'scrapers.archive')\n"
+            "print(elapsed, *[name for name in heavy if name in sys.modules])\n"
+        )
+        output = subprocess.check_output([sys.executable, '-c', code], text=True)
+        elapsed, *loaded = output.split()
+        
+        self.assertLess(float(elapsed), 1.5)
+        self.assertEqual(loaded, [])
+    
+    def test_async_database_concurrent_reads(self):
+        """Test that async reads run concurrently on one event loop"""
+        self.test_db.save_listings([
+            {'source': 'Test', 'address': '1 Async Way, Test City', 'price': 1800,
+             'bedrooms': 1, 'scraped_at': '2024-01-01T00:00:00'}
+        ])
+        async_db = AsyncDatabaseManager(self.test_db, max_workers=4)
+        
+        async def read_all():
+            return await asyncio.gather(
+                async_db.search_listings('Test City'),
+                async_db.get_all_listings(),
+                async_db.get_stats()
+            )
+        
+        try:
+            search_results, listings, stats = asyncio.run(read_all())
+        finally:
+            async_db.close()
+        
+        self.assertEqual(len(search_results), 1)
+        self.assertEqual(len(listings), 1)
+        self.assertEqual(stats['total_listings'], 1)
+    
+    def test_asgi_read_endpoints(self):
+        """Test the async read API"""
+        import shutil
+        import tempfile
+        from starlette.testclient import TestClient
+        from asgi import create_asgi_app
+        
+        media_dir = tempfile.mkdtemp()
+        flask_app = create_app({'DATABASE_PATH': TEST_DATABASE, 'TESTING': True, 'MEDIA_CACHE_DIR': media_dir})
+        asgi_app = create_asgi_app({'DATABASE_PATH': TEST_DATABASE, 'MEDIA_CACHE_DIR': media_dir})
+        try:
+            with TestClient(asgi_app) as client:
+                response = client.get('/api/listings')
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json()['success'])
+                
+                response = client.post('/api/search', json={'location': 'New York', 'bedrooms': '2'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['count'], 0)
+                
+                # A write from the Flask process reaches the ASGI cache, and an
+                # image cached there after this app started still gets served
+                self.test_db.save_listings([
+                    {'source': 'Test', 'address': f'{n} Async Ave, New York, NY', 'price': 2000 + n,
+                     'bedrooms': 2, 'image_url': f'https://cdn.test/{n}.png', 'scraped_at': '2024-01-01T00:00:00'}
+                    for n in range(2)
+                ])
+                image = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+                digest = flask_app.extensions['media'].put('https://cdn.test/0.png', image, 'png')
+                
+                query = {'location': 'New York', 'bedrooms': '2', 'sort': 'price_asc', 'facets': True}
+                flask_client = flask_app.test_client()
+                expected = flask_client.post('/api/search', json=query).get_json()
+                self.assertEqual(expected['count'], 2)
+                self.assertIn(f'/media/{digest}', [listing.get('thumbnail') for listing in expected['listings']])
+                for _ in range(2):
+                    self.assertEqual(client.post('/api/search', json=query).json(), expected)
+                self.assertGreaterEqual(asgi_app.state.search_cache.hits, 1)
+                self.assertEqual(client.get('/api/listings').json(), flask_client.get('/api/listings').get_json())
+                
+                response = client.get(f'/media/{digest}')
+                self.assertEqual(response.content, image)
+                self.assertIn('immutable', response.headers['Cache-Control'])
+                self.assertEqual(client.get('/media/' + '0' * 64).status_code, 404)
+                
+                self.assertEqual(client.post('/api/search', json={'radius_miles': 5}).status_code, 400)
+                
+                # Source health is reported by the Flask process that scrapes
+                stats = client.get('/api/stats').json()
+                self.assertEqual(stats['stats'], flask_client.get('/api/stats').get_json()['stats'])
+                self.assertNotIn('sources', stats)
+        finally:
+            flask_app.extensions['db'].close()
+            shutil.rmtree(media_dir)
+    
     @patch('requests.Session.get')
     def test_zillow_scraper(self, mock_get):
         """Test Zillow scraper with mocked response"""
@@ -171,6 +1083,180 @@ class TestRentalPlatform(unittest.TestCase):
         
         # Should have attempted to scrape
         mock_get.assert_called()
+    
+    @patch('requests.Session.get')
+    def test_registered_scraper_plugin(self, mock_get):
+        """Test that a registered source only declares its URLs and extractors"""
+        import scrapers
+        
+        pages = {
+            'https://rentals.test/austin/1': b'<div class="unit">1 Oak St, Austin, TX|$1,250</div>'
+                                             b'<div class="unit">1 oak st, austin, tx|$1,250</div><a rel="next"></a>',
+            'https://rentals.test/austin/2': b'<div class="unit">2 Elm St, Austin, TX|$1,400 - $1,600</div>'
+        }
+        mock_get.side_effect = lambda url, **kwargs: MagicMock(status_code=200, content=pages[url])
+        
+        scrapers.register_scraper('test', __name__, 'PluginScraper')
+        try:
+            self.assertIn('test', scrapers.scraper_names())
+            results = scrapers.scrape_all('Austin', max_pages=5, sources=['test'])
+        finally:
+            del scrapers.SCRAPER_CLASSES['test']
+        
+        # Duplicate addresses are dropped and paging stops at the last page
+        self.assertEqual([listing['address'] for listing in results['test']], ['1 Oak St, Austin, TX', '2 Elm St, Austin, TX'])
+        self.assertEqual(results['test'][1]['price'], 1400)
+        self.assertEqual(mock_get.call_count, 2)
+        
+        # The shared session pools connections and retries transient errors
+        session = scrapers.get_scraper('test').session
+        self.assertEqual(session.get_adapter('https://rentals.test').max_retries.total, 3)
+        self.assertIn('gzip', session.headers['Accept-Encoding'])
+    
+    @patch('requests.Session.get')
+    def test_batch_scrape_endpoint(self, mock_get):
+        """Test a multi-location batch scrape with progress and per-location results"""
+        import time
+        import scrapers
+        
+        pages = {
+            'https://rentals.test/austin/1': b'<div class="unit">1 Oak St, Austin, TX|$1,250</div><a rel="next"></a>',
+            'https://rentals.test/austin/2': b'<div class="unit">2 Elm St, Austin, TX|$1,400</div>',
+            'https://rentals.test/boston/1': b'<div class="unit">3 Bay St, Boston, MA|$2,100</div>'
+        }
+        mock_get.side_effect = lambda url, **kwargs: MagicMock(status_code=200, content=pages[url])
+        
+        scrapers.register_scraper('test', __name__, 'PluginScraper')
+        try:
+            response = self.app.post('/api/scrape/batch', json={'locations': ['Austin', 'Boston', 'austin '], 'sources': ['test']})
+            self.assertEqual(response.status_code, 202)
+            batch_id = response.get_json()['batch_id']
+            
+            for _ in range(100):
+                batch = self.app.get(f'/api/scrape/batch/{batch_id}').get_json()['batch']
+                if batch['state'] == 'done':
+                    break
+                time.sleep(0.05)
+            
+            self.assertEqual(self.app.post('/api/scrape/batch', json={'locations': ['Austin'], 'sources': ['nope']}).status_code, 400)
+        finally:
+            del scrapers.SCRAPER_CLASSES['test']
+        
+        # Pages past the last results page drop out of the plan
+        self.assertEqual(batch['state'], 'done')
+        self.assertEqual(batch['progress'], 1.0)
+        self.assertEqual(batch['units'], {'planned': 3, 'completed': 3, 'failed': 0, 'skipped': 0})
+        self.assertEqual(batch['results']['Austin']['test'], {'pages': 2, 'listings': 2, 'errors': 0, 'state': 'done'})
+        self.assertEqual(batch['listings_saved'], 3)
+        self.assertEqual(self.test_db.get_stats()['total_listings'], 3)
+        self.assertEqual(self.app.get('/api/scrape/batch/unknown').status_code, 404)
+        self.assertEqual(self.app.post('/api/scrape/batch', json={'locations': []}).status_code, 400)
+        for max_pages in (0, -3, '5', True):
+            response = self.app.post('/api/scrape/batch', json={'locations': ['Austin'], 'max_pages': max_pages})
+            self.assertEqual(response.status_code, 400)
+        
+        # Page depth is capped, so one request cannot plan an unbounded crawl
+        self.flask_app.config['BATCH_SCRAPE_MAX_PAGES'] = 2
+        with patch.object(self.flask_app.extensions['batch_scraper'], 'submit') as submit:
+            submit.return_value = MagicMock(id='capped', planned=2)
+            response = self.app.post('/api/scrape/batch', json={'locations': ['Austin'], 'max_pages': 10 ** 9})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(submit.call_args.kwargs['max_pages'], 2)
+
+    @patch('requests.Session.get')
+    def test_page_archive_reparse(self, mock_get):
+        """Test that fetched pages are archived and can be parsed again without fetching"""
+        import shutil
+        import tempfile
+        import time
+        import scrapers
+        from scrapers.archive import PageArchive, get_archive, set_archive
+        from scrapers.reparse import reparse
+        
+        directory = tempfile.mkdtemp()
+        archive = PageArchive(directory, segment_bytes=200, codec='gzip')
+        old_page = b'<div class="unit">1 Oak St, Austin, TX|$1,250</div>'
+        mock_get.side_effect = lambda url, **kwargs: MagicMock(status_code=200, url=url, content=old_page)
+        
+        scrapers.register_scraper('test', __name__, 'PluginScraper')
+        set_archive(archive)
+        try:
+            listings, _ = scrapers.get_scraper('test').scrape_page('Austin', 1)
+            self.assertEqual(len(listings), 1)
+            # A later fetch of the same page, and another page
+            archive.append('test', 'Austin', 1, 'https://rentals.test/austin/1',
+                           old_page + b'<div class="unit">2 Elm St, Austin, TX|$1,400</div>',
+                           fetched_at=time.time() + 1)
+            archive.append('test', 'austin', 2, 'https://rentals.test/austin/2',
+                           b'<div class="unit">3 Bay St, Austin, TX|$2,100</div>' + b'<p>Pets welcome</p>' * 50,
+                           fetched_at=time.time() + 2)
+            archive.append('gone', 'Austin', 1, 'https://gone.test/austin/1', old_page, fetched_at=time.time())
+            
+            entries = archive.entries(location='AUSTIN')
+            self.assertEqual([(entry['source'], entry['page']) for entry in entries], [('gone', 1), ('test', 1), ('test', 2)])
+            self.assertEqual(len(archive.entries(latest=False)), 4)
+            self.assertEqual(archive.read(entries[2]).count(b'<p>'), 50)
+            # Small segments roll over; each page is compressed on its own
+            self.assertGreater(int(archive.stats()['segment'][8:14]), 1)
+            self.assertGreater(archive.stats()['ratio'], 1)
+            
+            result = reparse(self.test_db, archive, source='test', workers=2, progress=MagicMock())
+            self.assertEqual(result, {'pages': 2, 'listings': 3, 'skipped': 0})
+            self.assertEqual(reparse(self.test_db, archive, workers=1, progress=MagicMock())['skipped'], 1)
+            
+            # Another process appending to the same directory (e.g. a second web worker)
+            other = PageArchive(directory, segment_bytes=200, codec='gzip')
+            pages = [archive, other, archive, other]
+            ids = [writer.append('other', 'Boston', n, None, b'<p>page %d</p>' % n) for n, writer in enumerate(pages)]
+            other.close()
+            read = {entry['id']: archive.read(entry) for entry in archive.entries(source='other')}
+            self.assertEqual([read[page_id] for page_id in ids], [b'<p>page %d</p>' % n for n in range(4)])
+            
+            # An app without an archive directory stops archiving
+            create_app({'DATABASE_PATH': TEST_DATABASE, 'TESTING': True}).extensions['db'].close()
+            self.assertIsNone(get_archive())
+        finally:
+            set_archive(None)
+            del scrapers.SCRAPER_CLASSES['test']
+            archive.close()
+            shutil.rmtree(directory)
+        
+        saved = sorted(listing['address'] for listing in self.test_db.get_all_listings())
+        self.assertEqual(saved, ['1 Oak St, Austin, TX', '2 Elm St, Austin, TX', '3 Bay St, Austin, TX'])
+        self.assertEqual(mock_get.call_count, 1)
+    
+    @patch('requests.Session.get')
+    def test_scraper_circuit_breaker(self, mock_get):
+        """Test that a failing source stops being requested until a probe succeeds"""
+        from scrapers.health import CircuitBreaker
+        
+        mock_get.return_value = MagicMock(status_code=403)
+        scraper = ZillowScraper()
+        scraper.breaker = CircuitBreaker('zillow', failure_threshold=2, reset_timeout=60)
+        
+        self.assertEqual(scraper.scrape_listings("New York, NY", max_pages=5), [])
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(scraper.breaker.status()['state'], 'open')
+        self.assertEqual(scraper.breaker.status()['last_error'], 'HTTP 403')
+        
+        # While open, scrapes return without any requests
+        scraper.scrape_listings("Chicago, IL", max_pages=5)
+        self.assertEqual(mock_get.call_count, 2)
+        
+        # After the timeout one probe goes out; its failure doubles the wait
+        now = scraper.breaker.opened_at + 61
+        self.assertTrue(scraper.breaker.allow(now))
+        self.assertFalse(scraper.breaker.allow(now))
+        scraper.breaker.record_failure('HTTP 403', now)
+        self.assertEqual(scraper.breaker.status(now)['retry_in_seconds'], 120)
+        
+        # A successful probe closes the circuit
+        self.assertTrue(scraper.breaker.allow(now + 121))
+        scraper.breaker.record_success(now + 121)
+        self.assertEqual(scraper.breaker.status()['state'], 'closed')
+        
+        response = self.app.get('/api/stats')
+        self.assertIn('sources', json.loads(response.data))
 
 def run_tests():
     """Run all tests"""